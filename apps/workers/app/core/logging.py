@@ -1,12 +1,165 @@
 # Created automatically by Cursor AI (2025-01-27)
 
+import atexit
+import io
 import logging
+import logging.handlers
+import queue
+import signal
 import sys
-from typing import Any, Dict
+import threading
+from functools import lru_cache
+from typing import Any, Dict, Optional
 
+try:
+    # picologging is a drop-in, faster stdlib logging (no wheels for 3.12+ yet)
+    import picologging
+    import picologging.handlers
+except ImportError:  # pragma: no cover - depends on the interpreter
+    picologging = None
+
+import orjson
 import structlog
 from pythonjsonlogger import jsonlogger
 
+# Backend for structlog loggers; third-party libraries keep using stdlib logging
+_log_backend = picologging or logging
+
+# Background listeners that own the stdout handlers, keyed by backend name
+_queue_listeners: Dict[str, Any] = {}
+
+# Size of the stdout write buffer and the max delay before buffered lines are flushed
+LOG_BUFFER_SIZE = 4096
+LOG_FLUSH_INTERVAL = 1.0
+
+
+class BufferedLogStream:
+    """Thread-safe buffered stdout sink shared by the log listeners
+    
+    StreamHandler flushes after every record, so ``flush`` is a no-op here and
+    the buffer is drained by ``force_flush`` (periodic timer, atexit, SIGTERM).
+    """
+    
+    def __init__(self, buffer_size: int = LOG_BUFFER_SIZE):
+        self._lock = threading.Lock()
+        try:
+            raw = io.FileIO(sys.stdout.fileno(), "w", closefd=False)
+            self._stream = io.TextIOWrapper(
+                io.BufferedWriter(raw, buffer_size=buffer_size),
+                encoding="utf-8",
+                line_buffering=False,
+            )
+        except (AttributeError, OSError, ValueError):
+            # stdout has no real file descriptor (e.g. captured under pytest)
+            self._stream = sys.stdout
+    
+    def write(self, data: str) -> int:
+        with self._lock:
+            return self._stream.write(data)
+    
+    def flush(self) -> None:
+        pass
+    
+    def force_flush(self) -> None:
+        with self._lock:
+            try:
+                self._stream.flush()
+            except ValueError:
+                # Stream already closed during interpreter shutdown
+                pass
+
+
+_log_stream: Optional[BufferedLogStream] = None
+
+
+def _start_periodic_flush(stream: BufferedLogStream) -> None:
+    """Flush buffered log lines at least every LOG_FLUSH_INTERVAL seconds"""
+    stopped = threading.Event()
+    
+    def _run() -> None:
+        while not stopped.wait(LOG_FLUSH_INTERVAL):
+            stream.force_flush()
+    
+    threading.Thread(target=_run, name="log-flush", daemon=True).start()
+    atexit.register(stopped.set)
+
+
+def _install_sigterm_flush(stream: BufferedLogStream) -> None:
+    """Flush buffered log lines on SIGTERM before delegating to the previous handler
+    
+    Servers such as uvicorn install their own SIGTERM handler after this one,
+    replacing it; there the lifespan shutdown calls ``flush_logs`` and the
+    atexit flush drains whatever is logged after it.
+    """
+    try:
+        previous = signal.getsignal(signal.SIGTERM)
+        
+        def _handler(signum, frame):
+            stream.force_flush()
+            if callable(previous):
+                previous(signum, frame)
+            elif previous is signal.SIG_DFL:
+                sys.exit(128 + signum)
+            # SIG_IGN: the process keeps ignoring SIGTERM
+        
+        signal.signal(signal.SIGTERM, _handler)
+    except ValueError:
+        # Not running in the main thread
+        pass
+
+
+def _get_log_stream() -> BufferedLogStream:
+    """Create the shared buffered stdout sink on first use"""
+    global _log_stream
+    if _log_stream is None:
+        _log_stream = BufferedLogStream()
+        # Registered before the listeners so it runs after they drain (atexit is LIFO)
+        atexit.register(_log_stream.force_flush)
+        _start_periodic_flush(_log_stream)
+        _install_sigterm_flush(_log_stream)
+    return _log_stream
+
+
+def flush_logs() -> None:
+    """Write buffered log lines to stdout now"""
+    if _log_stream is not None:
+        _log_stream.force_flush()
+
+
+def _orjson_dumps(value: Any, **kwargs: Any) -> str:
+    """Serialize a log event with orjson (UUIDs and other objects fall back to str)"""
+    return orjson.dumps(value, default=str).decode()
+
+
+def _logger_factory(*args: Any) -> Any:
+    """structlog logger factory backed by picologging when it is installed"""
+    return _log_backend.getLogger(args[0] if args else None)
+
+
+def _start_queue_listener(backend: Any) -> None:
+    """Route the backend's root logger through a queue drained by a background thread"""
+    if backend.__name__ in _queue_listeners:
+        return
+    
+    log_queue = queue.SimpleQueue()
+    
+    stream_handler = backend.StreamHandler(_get_log_stream())
+    stream_handler.setFormatter(backend.Formatter("%(message)s"))
+    listener = backend.handlers.QueueListener(
+        log_queue, stream_handler, respect_handler_level=True
+    )
+    
+    # Producers only enqueue records; formatting and stdout I/O happen on the listener
+    root = backend.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(backend.handlers.QueueHandler(log_queue))
+    root.setLevel(backend.INFO)
+    
+    listener.start()
+    atexit.register(listener.stop)
+    _queue_listeners[backend.__name__] = listener
+
 
 def setup_logging() -> None:
     """Setup structured logging for the application"""
@@ -21,21 +174,17 @@ def setup_logging() -> None:
             structlog.processors.TimeStamper(fmt="iso"),
             structlog.processors.StackInfoRenderer(),
             structlog.processors.format_exc_info,
-            structlog.processors.UnicodeDecoder(),
-            structlog.processors.JSONRenderer(),
+            structlog.processors.JSONRenderer(serializer=_orjson_dumps),
         ],
         context_class=dict,
-        logger_factory=structlog.stdlib.LoggerFactory(),
+        logger_factory=_logger_factory,
         wrapper_class=structlog.stdlib.BoundLogger,
         cache_logger_on_first_use=True,
     )
     
-    # Configure standard library logging
-    logging.basicConfig(
-        format="%(message)s",
-        stream=sys.stdout,
-        level=logging.INFO,
-    )
+    # Configure standard library logging (and picologging for structlog)
+    for backend in {logging, _log_backend}:
+        _start_queue_listener(backend)
     
     # Set log levels for specific modules
     logging.getLogger("uvicorn").setLevel(logging.INFO)
@@ -52,18 +201,23 @@ def get_logger(name: str) -> structlog.BoundLogger:
     return structlog.get_logger(name)
 
 
+@lru_cache(maxsize=64)
+def _bound_worker_logger(worker_name: str) -> structlog.BoundLogger:
+    """Get a logger with the worker name bound, shared per worker name"""
+    return get_logger(f"worker.{worker_name}").bind(worker=worker_name)
+
+
 class WorkerLogger:
     """Logger wrapper for workers with additional context"""
     
     def __init__(self, worker_name: str):
-        self.logger = get_logger(f"worker.{worker_name}")
+        self.logger = _bound_worker_logger(worker_name)
         self.worker_name = worker_name
     
     def log_job_start(self, job_id: str, job_type: str, **kwargs) -> None:
         """Log job start"""
         self.logger.info(
             "Job started",
-            worker=self.worker_name,
             job_id=job_id,
             job_type=job_type,
             **kwargs,
@@ -73,7 +227,6 @@ class WorkerLogger:
         """Log job success"""
         self.logger.info(
             "Job completed",
-            worker=self.worker_name,
             job_id=job_id,
             duration=duration,
             **kwargs,
@@ -83,7 +236,6 @@ class WorkerLogger:
         """Log job error"""
         self.logger.error(
             "Job failed",
-            worker=self.worker_name,
             job_id=job_id,
             error=str(error),
             error_type=type(error).__name__,
@@ -92,14 +244,8 @@ class WorkerLogger:
     
     def log_worker_start(self) -> None:
         """Log worker start"""
-        self.logger.info(
-            "Worker started",
-            worker=self.worker_name,
-        )
+        self.logger.info("Worker started")
     
     def log_worker_stop(self) -> None:
         """Log worker stop"""
-        self.logger.info(
-            "Worker stopped",
-            worker=self.worker_name,
-        )
+        self.logger.info("Worker stopped")
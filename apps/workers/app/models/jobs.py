@@ -1,45 +1,73 @@
 # Created automatically by Cursor AI (2025-01-27)
 
-from typing import List, Dict, Any, Optional
-from pydantic import BaseModel, Field
-from uuid import UUID
+from typing import List, Dict, Any, Literal, Optional
+from pydantic import BaseModel, ConfigDict, Field
+from typing_extensions import Annotated, TypedDict
+
+
+ExportFormat = Literal["markdown", "json", "pdf"]
+SlackEventType = Literal["oauth_install", "slash_command", "event_callback"]
+AnalyticsEventType = Literal["query", "document_upload", "user_action", "feedback"]
+RetentionType = Literal["sweep", "cleanup_orphaned", "stats"]
+
+# IDs are only passed through to logs and asyncpg, so keep them as strings
+# instead of building a UUID object for every decoded message
+UUIDStr = Annotated[str, Field(pattern=r"^[0-9a-fA-F-]{36}$")]
+
+
+class EmbedChunk(TypedDict):
+    """Text chunk produced by the ingest worker"""
+    page_number: int
+    content: str
 
 
 class IngestJob(BaseModel):
     """Job for ingesting a document"""
-    document_id: UUID
+    model_config = ConfigDict(frozen=True)
+    
+    document_id: UUIDStr
     file_path: str
     mime_type: str
     file_size: int
 
 
 class EmbedJob(BaseModel):
-    """Job for embedding document chunks"""
-    document_id: UUID
-    chunks: List[Dict[str, Any]]
+    """Job for embedding document chunks
+    
+    Embed jobs are produced internally by the ingest worker, so consumers may
+    build them with ``model_construct`` and skip per-chunk validation.
+    """
+    model_config = ConfigDict(frozen=True)
+    
+    document_id: UUIDStr
+    chunks: List[EmbedChunk]
 
 
 class QAJob(BaseModel):
     """Job for processing a QA request"""
+    model_config = ConfigDict(frozen=True)
+    
     query: str
-    thread_id: Optional[UUID] = None
-    project_id: Optional[UUID] = None
-    document_ids: Optional[List[UUID]] = None
-    user_id: Optional[UUID] = None
+    thread_id: Optional[UUIDStr] = None
+    project_id: Optional[UUIDStr] = None
+    document_ids: Optional[List[UUIDStr]] = None
+    user_id: Optional[UUIDStr] = None
     max_results: int = Field(default=10, ge=1, le=20)
     temperature: float = Field(default=0.7, ge=0, le=2)
 
 
 class ExportJob(BaseModel):
     """Job for exporting a thread"""
-    thread_id: UUID
-    format: str  # markdown, json, pdf
-    user_id: Optional[UUID] = None
+    thread_id: UUIDStr
+    format: ExportFormat
+    user_id: Optional[UUIDStr] = None
 
 
 class SlackJob(BaseModel):
     """Job for processing Slack events"""
-    event_type: str
+    model_config = ConfigDict(frozen=True)
+    
+    event_type: SlackEventType
     payload: Dict[str, Any]
     team_id: str
     user_id: Optional[str] = None
@@ -47,6 +75,26 @@ class SlackJob(BaseModel):
 
 class AnalyticsJob(BaseModel):
     """Job for processing analytics"""
-    event_type: str
+    model_config = ConfigDict(frozen=True)
+    
+    event_type: AnalyticsEventType
     data: Dict[str, Any]
     timestamp: float
+    user_id: Optional[UUIDStr] = None
+    org_id: Optional[UUIDStr] = None
+    project_id: Optional[UUIDStr] = None
+    
+    @property
+    def payload(self) -> Dict[str, Any]:
+        """Event-specific data read by the analytics handlers"""
+        return self.data
+
+
+class RetentionJob(BaseModel):
+    """Job for data retention and cleanup tasks"""
+    retention_type: RetentionType
+    organization_id: Optional[UUIDStr] = None
+    job_id: Optional[str] = None
+    priority: str = "normal"
+    scheduled_at: Optional[float] = None
+    result: Optional[Dict[str, Any]] = None
@@ -1,26 +1,221 @@
 # Created automatically by Cursor AI (2025-01-27)
 
-from typing import Dict, Any, List, Optional
-from uuid import UUID
+import asyncio
+import json
+import uuid
+from contextlib import asynccontextmanager
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+
+import asyncpg
+from pgvector.asyncpg import register_vector
+
+from app.core.config import get_settings
+
+
+# Statements are parameterized so asyncpg's per-connection statement cache
+# prepares each of them once and reuses the plan on every call.
+UPDATE_DOCUMENT_STATUS_SQL = """
+    UPDATE documents
+    SET status = $1, metadata = metadata || $2::jsonb, updated_at = NOW()
+    WHERE id = $3
+"""
+
+GET_DOCUMENT_SQL = """
+    SELECT id, project_id, name, file_path, file_size, mime_type,
+           page_count, status, metadata, created_at, updated_at
+    FROM documents
+    WHERE id = $1
+"""
+
+GET_DOCUMENT_NAMES_SQL = """
+    SELECT id::text, name FROM documents WHERE id = ANY($1::uuid[])
+"""
+
+GET_PROJECTS_SQL = """
+    SELECT id::text, org_id::text, name FROM projects WHERE id = ANY($1::uuid[])
+"""
+
+INSERT_EXPORT_SQL = """
+    INSERT INTO exports (job_id, filename, url, file_size, export_type, format)
+    VALUES ($1, $2, $3, $4, $5, $6)
+"""
+
+INSERT_QUERY_STATS_SQL = """
+    INSERT INTO query_stats (user_id, org_id, project_id, query, response_time, tokens_used,
+                             tokens_input, tokens_output, model_used, success, error_message,
+                             source, thread_id, created_at)
+    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, to_timestamp($14))
+"""
+
+INSERT_DOCUMENT_STATS_SQL = """
+    INSERT INTO document_stats (user_id, org_id, project_id, document_id, file_size, file_type,
+                                page_count, chunk_count, processing_time, success, error_message,
+                                created_at)
+    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, to_timestamp($12))
+"""
+
+INSERT_USER_ACTION_STATS_SQL = """
+    INSERT INTO user_action_stats (user_id, org_id, project_id, action, action_data, created_at)
+    VALUES ($1, $2, $3, $4, $5::jsonb, to_timestamp($6))
+"""
+
+DELETE_DOCUMENT_CHUNKS_SQL = """
+    DELETE FROM chunks WHERE document_id = $1
+"""
+
+CHUNK_COLUMNS = ["document_id", "page_number", "chunk_index", "content", "metadata"]
+EMBEDDED_CHUNK_COLUMNS = ["document_id", "page_number", "chunk_index", "content", "embedding"]
 
 
 class DatabaseService:
     """Service for database operations"""
-    
+
     def __init__(self):
-        pass
-    
-    async def update_document_status(self, document_id: UUID, status: str, metadata: Dict[str, Any]) -> None:
+        self._pool: Optional[asyncpg.Pool] = None
+        self._pool_lock = asyncio.Lock()
+
+    async def _get_pool(self) -> asyncpg.Pool:
+        """Create the connection pool on first use"""
+        if self._pool is None:
+            async with self._pool_lock:
+                if self._pool is None:
+                    settings = get_settings()
+                    self._pool = await asyncpg.create_pool(
+                        settings.DATABASE_URL,
+                        min_size=2,
+                        max_size=settings.WORKER_CONCURRENCY * 2,
+                        statement_cache_size=256,
+                        # Binary codec for pgvector columns, so COPY can write embeddings
+                        init=register_vector,
+                    )
+        return self._pool
+
+    @asynccontextmanager
+    async def get_connection(self) -> AsyncIterator[asyncpg.Connection]:
+        """Acquire a pooled connection"""
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            yield conn
+
+    async def close(self) -> None:
+        """Close the connection pool"""
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    async def update_document_status(self, document_id: str, status: str, metadata: Dict[str, Any]) -> None:
         """Update document status"""
-        # TODO: Implement database update
-        pass
-    
-    async def get_document(self, document_id: UUID) -> Optional[Dict[str, Any]]:
+        async with self.get_connection() as conn:
+            await conn.execute(
+                UPDATE_DOCUMENT_STATUS_SQL,
+                status,
+                json.dumps(metadata or {}),
+                document_id,
+            )
+
+    async def get_document(self, document_id: str) -> Optional[Dict[str, Any]]:
         """Get document by ID"""
-        # TODO: Implement database query
-        pass
-    
-    async def create_chunks(self, document_id: UUID, chunks: List[Dict[str, Any]]) -> None:
-        """Create chunks for a document"""
-        # TODO: Implement database insert
-        pass
+        async with self.get_connection() as conn:
+            row = await conn.fetchrow(GET_DOCUMENT_SQL, document_id)
+            return dict(row) if row else None
+
+    async def get_document_names(self, document_ids: List[str]) -> Dict[str, str]:
+        """Get document names by ID, skipping IDs that are not UUIDs"""
+        ids = _uuid_strings(document_ids)
+        if not ids:
+            return {}
+
+        async with self.get_connection() as conn:
+            rows = await conn.fetch(GET_DOCUMENT_NAMES_SQL, ids)
+            return {row["id"]: row["name"] for row in rows}
+
+    async def get_projects(self, project_ids: List[str]) -> Dict[str, Dict[str, str]]:
+        """Get project org IDs and names by project ID, skipping IDs that are not UUIDs"""
+        ids = _uuid_strings(project_ids)
+        if not ids:
+            return {}
+
+        async with self.get_connection() as conn:
+            rows = await conn.fetch(GET_PROJECTS_SQL, ids)
+            return {row["id"]: {"org_id": row["org_id"], "name": row["name"]} for row in rows}
+
+    async def create_chunks(self, document_id: str, chunks: List[Dict[str, Any]]) -> None:
+        """Create chunks for a document with a single COPY"""
+        if not chunks:
+            return
+
+        records = (
+            (
+                document_id,
+                chunk.get("page_number", 0),
+                chunk.get("chunk_index", index),
+                chunk["content"],
+                json.dumps(chunk.get("metadata", {})),
+            )
+            for index, chunk in enumerate(chunks)
+        )
+
+        async with self.get_connection() as conn:
+            await conn.copy_records_to_table(
+                "chunks",
+                records=records,
+                columns=CHUNK_COLUMNS,
+            )
+
+    async def create_chunk_embeddings(self, document_id: str, chunks: List[Dict[str, Any]],
+                                      embeddings: List[Any]) -> None:
+        """Replace a document's chunks with embedded ones using a single COPY"""
+        records = (
+            (
+                document_id,
+                chunk.get("page_number", 0),
+                index,
+                chunk["content"],
+                embedding,
+            )
+            for index, (chunk, embedding) in enumerate(zip(chunks, embeddings))
+        )
+
+        # Clearing first keeps a redelivered job from hitting the unique chunk key
+        async with self.get_connection() as conn:
+            async with conn.transaction():
+                await conn.execute(DELETE_DOCUMENT_CHUNKS_SQL, document_id)
+                await conn.copy_records_to_table(
+                    "chunks",
+                    records=records,
+                    columns=EMBEDDED_CHUNK_COLUMNS,
+                )
+
+    async def create_exports(self, exports: List[Tuple[Any, ...]]) -> None:
+        """Record export artifacts, pipelining every insert in one round trip"""
+        if not exports:
+            return
+
+        async with self.get_connection() as conn:
+            await conn.executemany(INSERT_EXPORT_SQL, exports)
+
+    async def create_analytics_events(self, query_stats: List[Tuple[Any, ...]],
+                                      document_stats: List[Tuple[Any, ...]],
+                                      user_action_stats: List[Tuple[Any, ...]]) -> None:
+        """Record buffered analytics rows in one transaction"""
+        async with self.get_connection() as conn:
+            async with conn.transaction():
+                for sql, rows in (
+                    (INSERT_QUERY_STATS_SQL, query_stats),
+                    (INSERT_DOCUMENT_STATS_SQL, document_stats),
+                    (INSERT_USER_ACTION_STATS_SQL, user_action_stats),
+                ):
+                    if rows:
+                        await conn.executemany(sql, rows)
+
+
+def _uuid_strings(values: List[str]) -> List[str]:
+    """Keep the values that parse as UUIDs, so a stray ID cannot fail a uuid[] query"""
+    valid = []
+    for value in values:
+        try:
+            uuid.UUID(value)
+        except (TypeError, ValueError):
+            continue
+        valid.append(value)
+    return valid
@@ -1,21 +1,242 @@
 import os
 import time
 import logging
-from typing import Optional, Dict, Any
+import threading
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Dict, Any, List, Tuple
 from prometheus_client import (
     Counter, Histogram, Gauge, generate_latest, CONTENT_TYPE_LATEST,
-    CollectorRegistry, multiprocess, start_http_server
+    CollectorRegistry, multiprocess, start_http_server,
+    ProcessCollector, PlatformCollector
 )
 
+from app.core.config import get_settings
+
 logger = logging.getLogger(__name__)
 
+# When set (before prometheus_client is imported), metric values are written to
+# per-process mmap files in this directory and aggregated by a single exporter.
+MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+
+# Label values used when an identifier or error type is not available
+UNKNOWN_LABEL = 'unknown'
+NO_ERROR_LABEL = 'none'
+
+# PID of the process that imported this module; forked children must not
+# try to bind the metrics port again
+_ROOT_PID = os.getpid()
+
+
+def build_multiprocess_registry() -> CollectorRegistry:
+    """Build a registry that aggregates the mmap files of every worker process."""
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def run_metrics_exporter() -> None:
+    """Serve aggregated multiprocess metrics; run once per host as a sidecar."""
+    if not MULTIPROC_DIR:
+        raise RuntimeError('PROMETHEUS_MULTIPROC_DIR must be set to run the metrics exporter')
+    
+    registry = build_multiprocess_registry()
+    ProcessCollector(registry=registry)
+    PlatformCollector(registry=registry)
+    
+    metrics_port = int(os.getenv('METRICS_PORT', '9090'))
+    start_http_server(metrics_port, registry=registry)
+    logger.info(f"Prometheus multiprocess exporter started on port {metrics_port}")
+    
+    while True:
+        time.sleep(3600)
+
+
+# Generated recorders: (method name, metric attribute, parameters, value to apply).
+# Label values are taken from the parameters named in the metric's *_LABELS
+# constant; _LABEL_EXPRESSIONS overrides how a parameter becomes a label value.
+_RECORDERS = (
+    ('record_document_upload', 'document_uploads_total',
+     'organization_id, project_id, status, error_type=NO_ERROR_LABEL', 'inc()'),
+    ('record_document_processing', 'document_processing_total',
+     'organization_id, project_id, worker_type, status, error_type=NO_ERROR_LABEL', 'inc()'),
+    ('record_document_processing_duration', 'document_processing_duration',
+     'organization_id, project_id, worker_type, duration, status', 'observe(duration)'),
+    ('record_qa_query', 'qa_queries_total',
+     'organization_id, project_id, status, error_type=NO_ERROR_LABEL', 'inc()'),
+    ('record_qa_query_duration', 'qa_query_duration',
+     'organization_id, project_id, duration, status', 'observe(duration)'),
+    ('record_tokens_used', 'tokens_used_total',
+     'organization_id, project_id, model_name, token_count, operation', 'inc(token_count)'),
+    ('record_token_generation_duration', 'token_generation_duration',
+     'organization_id, project_id, model_name, duration, operation', 'observe(duration)'),
+    ('record_embedding_generation_duration', 'embedding_generation_duration',
+     'organization_id, project_id, model_name, duration', 'observe(duration)'),
+    ('record_api_request', 'api_requests_total',
+     'method, endpoint, status_code, organization_id=UNKNOWN_LABEL', 'inc()'),
+    ('record_api_request_duration', 'api_request_duration',
+     'method, endpoint, status_code, duration', 'observe(duration)'),
+    ('record_slack_event', 'slack_events_total',
+     "event_type, organization_id=UNKNOWN_LABEL, status='success'", 'inc()'),
+    ('record_export_job', 'export_jobs_total',
+     'organization_id, project_id, format, status', 'inc()'),
+    ('set_active_documents', 'active_documents',
+     'organization_id, project_id, count, status', 'set(count)'),
+    ('set_active_threads', 'active_threads',
+     'organization_id, project_id, count', 'set(count)'),
+    ('set_queue_size', 'queue_size',
+     'queue_name, organization_id, size', 'set(size)'),
+    ('set_worker_count', 'worker_count',
+     'worker_type, status, count', 'set(count)'),
+    ('set_memory_usage', 'memory_usage',
+     'service, type, bytes', 'set(bytes)'),
+    ('set_cpu_usage', 'cpu_usage',
+     'service, percentage', 'set(percentage)'),
+    ('set_token_throughput', 'token_throughput',
+     'organization_id, project_id, model_name, tokens_per_second, operation', 'set(tokens_per_second)'),
+)
+
+_LABEL_EXPRESSIONS = {
+    'status_code': 'str(status_code)',
+}
+
+_RECORDER_TEMPLATE = """
+def {method}({params}):
+    labels = ({labels},)
+    child = _cache_get((_key, labels))
+    if child is None:
+        child = _child(_metric, _key, labels)
+    child.{apply}
+"""
+
+
+class BatchedHistogram:
+    """Labelled histogram child that applies observations in batches.
+    
+    Observations are buffered per thread and folded into bucket counts before
+    touching the child's values, so the value locks are taken once per touched
+    bucket per batch instead of once per observation.
+    """
+    
+    FLUSH_SIZE = 64
+    FLUSH_INTERVAL = 1.0  # seconds
+    
+    def __init__(self, child: Histogram):
+        self._child = child
+        self._upper_bounds = child._upper_bounds
+        self._local = threading.local()
+        self._buffers: List[List[float]] = []
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+    
+    def _buffer(self) -> List[float]:
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = self._local.buffer = []
+            with self._lock:
+                self._buffers.append(buffer)
+        return buffer
+    
+    def observe(self, amount: float) -> None:
+        """Buffer an observation, applying the batch when it is full or stale."""
+        buffer = self._buffer()
+        buffer.append(amount)
+        if (len(buffer) >= self.FLUSH_SIZE
+                or time.monotonic() - self._last_flush >= self.FLUSH_INTERVAL):
+            self.flush()
+    
+    def flush(self) -> None:
+        """Apply every buffered observation to the underlying histogram."""
+        with self._lock:
+            self._last_flush = time.monotonic()
+            for buffer in self._buffers:
+                if not buffer:
+                    continue
+                # Owner threads only append, so the first len(amounts) items are ours
+                amounts = buffer[:]
+                del buffer[:len(amounts)]
+                self._apply(amounts)
+    
+    def _apply(self, amounts: List[float]) -> None:
+        counts = [0] * len(self._upper_bounds)
+        for amount in amounts:
+            counts[bisect_left(self._upper_bounds, amount)] += 1
+        self._child._sum.inc(sum(amounts))
+        for bucket, count in zip(self._child._buckets, counts):
+            if count:
+                bucket.inc(count)
+
+
+class _HistogramFlushCollector:
+    """Registry collector that flushes batched histograms before a scrape."""
+    
+    def __init__(self, service: 'MetricsService'):
+        self._service = service
+    
+    def describe(self):
+        return []
+    
+    def collect(self):
+        self._service.flush_histograms()
+        return []
+
+
 class MetricsService:
-    """Prometheus metrics service for tracking system performance."""
+    """Prometheus metrics service for tracking system performance.
+    
+    Label arguments are used as-is; callers map missing identifiers to
+    UNKNOWN_LABEL at their boundary rather than passing None.
+    """
+    
+    # Label names per metric, in declaration order. record_*/set_* methods pass
+    # label values positionally in this same order.
+    DOCUMENT_UPLOADS_TOTAL_LABELS = ('organization_id', 'project_id', 'status', 'error_type')
+    DOCUMENT_PROCESSING_TOTAL_LABELS = ('organization_id', 'project_id', 'worker_type', 'status', 'error_type')
+    QA_QUERIES_TOTAL_LABELS = ('organization_id', 'project_id', 'status', 'error_type')
+    TOKENS_USED_TOTAL_LABELS = ('organization_id', 'project_id', 'model_name', 'operation')
+    API_REQUESTS_TOTAL_LABELS = ('method', 'endpoint', 'status_code', 'organization_id')
+    SLACK_EVENTS_TOTAL_LABELS = ('event_type', 'organization_id', 'status')
+    EXPORT_JOBS_TOTAL_LABELS = ('organization_id', 'project_id', 'format', 'status')
+    RETENTION_SWEEPS_TOTAL_LABELS = ('organization_id', 'status')
+    RETENTION_DOCUMENTS_PURGED_TOTAL_LABELS = ('organization_id',)
+    DOCUMENT_PROCESSING_DURATION_LABELS = ('organization_id', 'project_id', 'worker_type', 'status')
+    QA_QUERY_DURATION_LABELS = ('organization_id', 'project_id', 'status')
+    API_REQUEST_DURATION_LABELS = ('method', 'endpoint', 'status_code')
+    TOKEN_GENERATION_DURATION_LABELS = ('organization_id', 'project_id', 'model_name', 'operation')
+    EMBEDDING_GENERATION_DURATION_LABELS = ('organization_id', 'project_id', 'model_name')
+    ACTIVE_DOCUMENTS_LABELS = ('organization_id', 'project_id', 'status')
+    ACTIVE_THREADS_LABELS = ('organization_id', 'project_id')
+    QUEUE_SIZE_LABELS = ('queue_name', 'organization_id')
+    WORKER_COUNT_LABELS = ('worker_type', 'status')
+    MEMORY_USAGE_LABELS = ('service', 'type')
+    CPU_USAGE_LABELS = ('service',)
+    TOKEN_THROUGHPUT_LABELS = ('organization_id', 'project_id', 'model_name', 'operation')
     
     def __init__(self):
-        self.registry = CollectorRegistry()
+        self.multiprocess = bool(MULTIPROC_DIR)
+        if self.multiprocess:
+            # Metrics write to mmap files and stay unregistered; this registry
+            # only reads the aggregated values back for get_metrics()
+            self._metrics_registry = None
+            self.registry = build_multiprocess_registry()
+        else:
+            self.registry = CollectorRegistry()
+            self._metrics_registry = self.registry
+        # Labelled child metrics keyed by (metric name, label values)
+        self._label_cache: Dict[Tuple[str, tuple], Any] = {}
+        self._batched_histograms: List[BatchedHistogram] = []
+        # Serialized scrape output, reused for METRICS_CACHE_TTL seconds
+        self._cache_ttl = get_settings().METRICS_CACHE_TTL
+        self._cached_metrics = b''
+        self._last_scrape_at = float('-inf')
+        self._scrape_lock = threading.Lock()
+        # Registered before the metrics so it runs first on every collection
+        self.registry.register(_HistogramFlushCollector(self))
         self._initialize_metrics()
-        self._start_metrics_server()
+        self._build_recorders()
+        if not self.multiprocess and os.getpid() == _ROOT_PID:
+            # In multiprocess mode the exporter sidecar serves the metrics
+            self._start_metrics_server()
     
     def _initialize_metrics(self):
         """Initialize all Prometheus metrics."""
@@ -24,154 +245,192 @@ class MetricsService:
             self.document_uploads_total = Counter(
                 'rag_document_uploads_total',
                 'Total number of document uploads',
-                ['organization_id', 'project_id', 'status', 'error_type'],
-                registry=self.registry
+                self.DOCUMENT_UPLOADS_TOTAL_LABELS,
+                registry=self._metrics_registry
             )
             
             self.document_processing_total = Counter(
                 'rag_document_processing_total',
                 'Total number of document processing jobs',
-                ['organization_id', 'project_id', 'worker_type', 'status', 'error_type'],
-                registry=self.registry
+                self.DOCUMENT_PROCESSING_TOTAL_LABELS,
+                registry=self._metrics_registry
             )
             
             self.qa_queries_total = Counter(
                 'rag_qa_queries_total',
                 'Total number of QA queries',
-                ['organization_id', 'project_id', 'thread_id', 'status', 'error_type'],
-                registry=self.registry
+                self.QA_QUERIES_TOTAL_LABELS,
+                registry=self._metrics_registry
             )
             
             self.tokens_used_total = Counter(
                 'rag_tokens_used_total',
                 'Total number of tokens used',
-                ['organization_id', 'project_id', 'model_name', 'operation'],
-                registry=self.registry
+                self.TOKENS_USED_TOTAL_LABELS,
+                registry=self._metrics_registry
             )
             
             self.api_requests_total = Counter(
                 'rag_api_requests_total',
                 'Total number of API requests',
-                ['method', 'endpoint', 'status_code', 'organization_id'],
-                registry=self.registry
+                self.API_REQUESTS_TOTAL_LABELS,
+                registry=self._metrics_registry
             )
             
             self.slack_events_total = Counter(
                 'rag_slack_events_total',
                 'Total number of Slack events',
-                ['event_type', 'organization_id', 'status'],
-                registry=self.registry
+                self.SLACK_EVENTS_TOTAL_LABELS,
+                registry=self._metrics_registry
             )
             
             self.export_jobs_total = Counter(
                 'rag_export_jobs_total',
                 'Total number of export jobs',
-                ['organization_id', 'project_id', 'format', 'status'],
-                registry=self.registry
+                self.EXPORT_JOBS_TOTAL_LABELS,
+                registry=self._metrics_registry
             )
             
             self.retention_sweeps_total = Counter(
                 'rag_retention_sweeps_total',
                 'Total number of retention sweeps',
-                ['organization_id', 'status', 'documents_purged'],
-                registry=self.registry
+                self.RETENTION_SWEEPS_TOTAL_LABELS,
+                registry=self._metrics_registry
+            )
+            
+            self.retention_documents_purged_total = Counter(
+                'rag_retention_documents_purged_total',
+                'Total number of documents purged by retention sweeps',
+                self.RETENTION_DOCUMENTS_PURGED_TOTAL_LABELS,
+                registry=self._metrics_registry
             )
             
             # Histograms
             self.document_processing_duration = Histogram(
                 'rag_document_processing_duration_seconds',
                 'Document processing duration in seconds',
-                ['organization_id', 'project_id', 'worker_type', 'status'],
+                self.DOCUMENT_PROCESSING_DURATION_LABELS,
                 buckets=[0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300],
-                registry=self.registry
+                registry=self._metrics_registry
             )
             
             self.qa_query_duration = Histogram(
                 'rag_qa_query_duration_seconds',
                 'QA query duration in seconds',
-                ['organization_id', 'project_id', 'thread_id', 'status'],
+                self.QA_QUERY_DURATION_LABELS,
                 buckets=[0.1, 0.5, 1, 2, 5, 10, 30, 60],
-                registry=self.registry
+                registry=self._metrics_registry
             )
             
             self.api_request_duration = Histogram(
                 'rag_api_request_duration_seconds',
                 'API request duration in seconds',
-                ['method', 'endpoint', 'status_code'],
+                self.API_REQUEST_DURATION_LABELS,
                 buckets=[0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10],
-                registry=self.registry
+                registry=self._metrics_registry
             )
             
             self.token_generation_duration = Histogram(
                 'rag_token_generation_duration_seconds',
                 'Token generation duration in seconds',
-                ['organization_id', 'project_id', 'model_name', 'operation'],
+                self.TOKEN_GENERATION_DURATION_LABELS,
                 buckets=[0.1, 0.5, 1, 2, 5, 10, 30, 60],
-                registry=self.registry
+                registry=self._metrics_registry
             )
             
             self.embedding_generation_duration = Histogram(
                 'rag_embedding_generation_duration_seconds',
                 'Embedding generation duration in seconds',
-                ['organization_id', 'project_id', 'model_name', 'chunk_count'],
+                self.EMBEDDING_GENERATION_DURATION_LABELS,
                 buckets=[0.1, 0.5, 1, 2, 5, 10, 30, 60],
-                registry=self.registry
+                registry=self._metrics_registry
             )
             
             # Gauges
             self.active_documents = Gauge(
                 'rag_active_documents',
                 'Number of active documents',
-                ['organization_id', 'project_id', 'status'],
-                registry=self.registry
+                self.ACTIVE_DOCUMENTS_LABELS,
+                multiprocess_mode='livesum',
+                registry=self._metrics_registry
             )
             
             self.active_threads = Gauge(
                 'rag_active_threads',
                 'Number of active threads',
-                ['organization_id', 'project_id'],
-                registry=self.registry
+                self.ACTIVE_THREADS_LABELS,
+                multiprocess_mode='livesum',
+                registry=self._metrics_registry
             )
             
             self.queue_size = Gauge(
                 'rag_queue_size',
                 'Number of jobs in queue',
-                ['queue_name', 'organization_id'],
-                registry=self.registry
+                self.QUEUE_SIZE_LABELS,
+                multiprocess_mode='livesum',
+                registry=self._metrics_registry
             )
             
             self.worker_count = Gauge(
                 'rag_worker_count',
                 'Number of active workers',
-                ['worker_type', 'status'],
-                registry=self.registry
+                self.WORKER_COUNT_LABELS,
+                multiprocess_mode='livesum',
+                registry=self._metrics_registry
             )
             
             self.memory_usage = Gauge(
                 'rag_memory_usage_bytes',
                 'Memory usage in bytes',
-                ['service', 'type'],
-                registry=self.registry
+                self.MEMORY_USAGE_LABELS,
+                multiprocess_mode='liveall',
+                registry=self._metrics_registry
             )
             
             self.cpu_usage = Gauge(
                 'rag_cpu_usage_percent',
                 'CPU usage percentage',
-                ['service'],
-                registry=self.registry
+                self.CPU_USAGE_LABELS,
+                multiprocess_mode='liveall',
+                registry=self._metrics_registry
             )
             
             self.token_throughput = Gauge(
                 'rag_token_throughput_tokens_per_second',
                 'Token throughput in tokens per second',
-                ['organization_id', 'project_id', 'model_name', 'operation'],
-                registry=self.registry
+                self.TOKEN_THROUGHPUT_LABELS,
+                multiprocess_mode='livesum',
+                registry=self._metrics_registry
             )
             
             logger.info("Prometheus metrics initialized successfully")
         except Exception as e:
             logger.error(f"Failed to initialize Prometheus metrics: {e}")
     
+    def _build_recorders(self):
+        """Generate the record_*/set_* methods listed in _RECORDERS.
+        
+        Each recorder is compiled for its metric's exact label shape and binds
+        the metric and the child cache directly, so an update is one tuple
+        build and one dict lookup with no per-call loops or attribute lookups.
+        """
+        for method, metric_key, params, apply in _RECORDERS:
+            label_names = getattr(self, metric_key.upper() + '_LABELS')
+            labels = ', '.join(_LABEL_EXPRESSIONS.get(name, name) for name in label_names)
+            namespace = {
+                '_cache_get': self._label_cache.get,
+                '_child': self._child,
+                '_metric': getattr(self, metric_key),
+                '_key': metric_key,
+                'NO_ERROR_LABEL': NO_ERROR_LABEL,
+                'UNKNOWN_LABEL': UNKNOWN_LABEL,
+            }
+            source = _RECORDER_TEMPLATE.format(
+                method=method, params=params, labels=labels, apply=apply
+            )
+            exec(compile(source, f'<metrics recorder {method}>', 'exec'), namespace)
+            setattr(self, method, namespace[method])
+    
     def _start_metrics_server(self):
         """Start the metrics HTTP server."""
         try:
@@ -181,200 +440,43 @@ class MetricsService:
         except Exception as e:
             logger.error(f"Failed to start metrics server: {e}")
     
+    def _child(self, metric: Any, metric_key: str, labels: tuple) -> Any:
+        """Return the labelled child for ``labels``, resolving it only once."""
+        key = (metric_key, labels)
+        child = self._label_cache.get(key)
+        if child is None:
+            child = metric.labels(*labels)
+            # In multiprocess mode the exporter process scrapes the mmap files
+            # and cannot flush this process's buffers, so observe directly
+            if isinstance(metric, Histogram) and not self.multiprocess:
+                child = BatchedHistogram(child)
+                self._batched_histograms.append(child)
+            self._label_cache[key] = child
+        return child
+    
+    def flush_histograms(self) -> None:
+        """Apply buffered histogram observations."""
+        for histogram in list(self._batched_histograms):
+            histogram.flush()
+    
     def get_metrics(self) -> bytes:
-        """Get metrics in Prometheus format."""
+        """Get metrics in Prometheus format, serializing at most once per TTL."""
+        if time.monotonic() - self._last_scrape_at < self._cache_ttl:
+            return self._cached_metrics
+        
         try:
-            return generate_latest(self.registry)
+            with self._scrape_lock:
+                # Another caller may have refreshed the cache while we waited
+                if time.monotonic() - self._last_scrape_at < self._cache_ttl:
+                    return self._cached_metrics
+                self.flush_histograms()
+                self._cached_metrics = generate_latest(self.registry)
+                self._last_scrape_at = time.monotonic()
+                return self._cached_metrics
         except Exception as e:
             logger.error(f"Failed to generate metrics: {e}")
             return b''
     
-    def record_document_upload(
-        self,
-        organization_id: str,
-        project_id: str,
-        status: str,
-        error_type: Optional[str] = None
-    ):
-        """Record document upload."""
-        self.document_uploads_total.labels(
-            organization_id=organization_id or 'unknown',
-            project_id=project_id or 'unknown',
-            status=status,
-            error_type=error_type or 'none'
-        ).inc()
-    
-    def record_document_processing(
-        self,
-        organization_id: str,
-        project_id: str,
-        worker_type: str,
-        status: str,
-        error_type: Optional[str] = None
-    ):
-        """Record document processing."""
-        self.document_processing_total.labels(
-            organization_id=organization_id or 'unknown',
-            project_id=project_id or 'unknown',
-            worker_type=worker_type,
-            status=status,
-            error_type=error_type or 'none'
-        ).inc()
-    
-    def record_document_processing_duration(
-        self,
-        organization_id: str,
-        project_id: str,
-        worker_type: str,
-        duration: float,
-        status: str
-    ):
-        """Record document processing duration."""
-        self.document_processing_duration.labels(
-            organization_id=organization_id or 'unknown',
-            project_id=project_id or 'unknown',
-            worker_type=worker_type,
-            status=status
-        ).observe(duration)
-    
-    def record_qa_query(
-        self,
-        organization_id: str,
-        project_id: str,
-        thread_id: str,
-        status: str,
-        error_type: Optional[str] = None
-    ):
-        """Record QA query."""
-        self.qa_queries_total.labels(
-            organization_id=organization_id or 'unknown',
-            project_id=project_id or 'unknown',
-            thread_id=thread_id or 'unknown',
-            status=status,
-            error_type=error_type or 'none'
-        ).inc()
-    
-    def record_qa_query_duration(
-        self,
-        organization_id: str,
-        project_id: str,
-        thread_id: str,
-        duration: float,
-        status: str
-    ):
-        """Record QA query duration."""
-        self.qa_query_duration.labels(
-            organization_id=organization_id or 'unknown',
-            project_id=project_id or 'unknown',
-            thread_id=thread_id or 'unknown',
-            status=status
-        ).observe(duration)
-    
-    def record_tokens_used(
-        self,
-        organization_id: str,
-        project_id: str,
-        model_name: str,
-        token_count: int,
-        operation: str
-    ):
-        """Record tokens used."""
-        self.tokens_used_total.labels(
-            organization_id=organization_id or 'unknown',
-            project_id=project_id or 'unknown',
-            model_name=model_name,
-            operation=operation
-        ).inc(token_count)
-    
-    def record_token_generation_duration(
-        self,
-        organization_id: str,
-        project_id: str,
-        model_name: str,
-        duration: float,
-        operation: str
-    ):
-        """Record token generation duration."""
-        self.token_generation_duration.labels(
-            organization_id=organization_id or 'unknown',
-            project_id=project_id or 'unknown',
-            model_name=model_name,
-            operation=operation
-        ).observe(duration)
-    
-    def record_embedding_generation_duration(
-        self,
-        organization_id: str,
-        project_id: str,
-        model_name: str,
-        duration: float,
-        chunk_count: int
-    ):
-        """Record embedding generation duration."""
-        self.embedding_generation_duration.labels(
-            organization_id=organization_id or 'unknown',
-            project_id=project_id or 'unknown',
-            model_name=model_name,
-            chunk_count=str(chunk_count)
-        ).observe(duration)
-    
-    def record_api_request(
-        self,
-        method: str,
-        endpoint: str,
-        status_code: int,
-        organization_id: Optional[str] = None
-    ):
-        """Record API request."""
-        self.api_requests_total.labels(
-            method=method,
-            endpoint=endpoint,
-            status_code=str(status_code),
-            organization_id=organization_id or 'unknown'
-        ).inc()
-    
-    def record_api_request_duration(
-        self,
-        method: str,
-        endpoint: str,
-        status_code: int,
-        duration: float
-    ):
-        """Record API request duration."""
-        self.api_request_duration.labels(
-            method=method,
-            endpoint=endpoint,
-            status_code=str(status_code)
-        ).observe(duration)
-    
-    def record_slack_event(
-        self,
-        event_type: str,
-        organization_id: Optional[str] = None,
-        status: str = 'success'
-    ):
-        """Record Slack event."""
-        self.slack_events_total.labels(
-            event_type=event_type,
-            organization_id=organization_id or 'unknown',
-            status=status
-        ).inc()
-    
-    def record_export_job(
-        self,
-        organization_id: str,
-        project_id: str,
-        format: str,
-        status: str
-    ):
-        """Record export job."""
-        self.export_jobs_total.labels(
-            organization_id=organization_id or 'unknown',
-            project_id=project_id or 'unknown',
-            format=format,
-            status=status
-        ).inc()
-    
     def record_retention_sweep(
         self,
         organization_id: str,
@@ -382,99 +484,14 @@ class MetricsService:
         documents_purged: int
     ):
         """Record retention sweep."""
-        self.retention_sweeps_total.labels(
-            organization_id=organization_id,
-            status=status,
-            documents_purged=str(documents_purged)
-        ).inc()
-    
-    def set_active_documents(
-        self,
-        organization_id: str,
-        project_id: str,
-        count: int,
-        status: str
-    ):
-        """Set active documents count."""
-        self.active_documents.labels(
-            organization_id=organization_id or 'unknown',
-            project_id=project_id or 'unknown',
-            status=status
-        ).set(count)
-    
-    def set_active_threads(
-        self,
-        organization_id: str,
-        project_id: str,
-        count: int
-    ):
-        """Set active threads count."""
-        self.active_threads.labels(
-            organization_id=organization_id or 'unknown',
-            project_id=project_id or 'unknown'
-        ).set(count)
-    
-    def set_queue_size(
-        self,
-        queue_name: str,
-        organization_id: str,
-        size: int
-    ):
-        """Set queue size."""
-        self.queue_size.labels(
-            queue_name=queue_name,
-            organization_id=organization_id
-        ).set(size)
-    
-    def set_worker_count(
-        self,
-        worker_type: str,
-        status: str,
-        count: int
-    ):
-        """Set worker count."""
-        self.worker_count.labels(
-            worker_type=worker_type,
-            status=status
-        ).set(count)
-    
-    def set_memory_usage(
-        self,
-        service: str,
-        type: str,
-        bytes: int
-    ):
-        """Set memory usage."""
-        self.memory_usage.labels(
-            service=service,
-            type=type
-        ).set(bytes)
-    
-    def set_cpu_usage(
-        self,
-        service: str,
-        percentage: float
-    ):
-        """Set CPU usage."""
-        self.cpu_usage.labels(
-            service=service
-        ).set(percentage)
-    
-    def set_token_throughput(
-        self,
-        organization_id: str,
-        project_id: str,
-        model_name: str,
-        tokens_per_second: float,
-        operation: str
-    ):
-        """Set token throughput."""
-        self.token_throughput.labels(
-            organization_id=organization_id or 'unknown',
-            project_id=project_id or 'unknown',
-            model_name=model_name,
-            operation=operation
-        ).set(tokens_per_second)
+        self._child(self.retention_sweeps_total, 'retention_sweeps_total', (
+            organization_id,
+            status,
+        )).inc()
+        if documents_purged:
+            self._child(self.retention_documents_purged_total, 'retention_documents_purged_total', (
+                organization_id,
+            )).inc(documents_purged)
     
     def record_ingest_latency(
         self,
@@ -492,13 +509,12 @@ class MetricsService:
         self,
         organization_id: str,
         project_id: str,
-        thread_id: str,
         duration: float,
         status: str
     ):
         """Record QA latency."""
         self.record_qa_query_duration(
-            organization_id, project_id, thread_id, duration, status
+            organization_id, project_id, duration, status
         )
     
     def record_token_throughput(
@@ -514,5 +530,38 @@ class MetricsService:
             organization_id, project_id, model_name, tokens_per_second, operation
         )
 
-# Global metrics service instance
-metrics_service = MetricsService()
+
+class _NoopMetricsService(MetricsService):
+    """Metrics service that drops every update, used when metrics are disabled."""
+    
+    def __init__(self):
+        self.multiprocess = False
+        self.registry = CollectorRegistry()
+        self._metrics_registry = None
+        self._label_cache = {}
+        self._batched_histograms = []
+    
+    def get_metrics(self) -> bytes:
+        """Get metrics in Prometheus format."""
+        return b''
+
+
+def _noop(self, *args, **kwargs):
+    pass
+
+
+for _name in [recorder[0] for recorder in _RECORDERS] + dir(MetricsService):
+    if _name.startswith(('record_', 'set_')):
+        setattr(_NoopMetricsService, _name, _noop)
+
+
+@lru_cache(maxsize=1)
+def get_metrics_service() -> MetricsService:
+    """Get the process-wide metrics service, creating it on first use."""
+    if not get_settings().METRICS_ENABLED:
+        return _NoopMetricsService()
+    return MetricsService()
+
+
+if __name__ == '__main__':
+    run_metrics_exporter()
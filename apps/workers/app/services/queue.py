@@ -0,0 +1,38 @@
+import logging
+
+from nats.js import JetStreamContext
+from nats.js.api import RetentionPolicy, StreamConfig
+from nats.js.errors import NotFoundError
+
+logger = logging.getLogger(__name__)
+
+# JetStream stream holding the jobs that workers pull in batches. Workers
+# create it on startup, so a fresh NATS server (started with --jetstream)
+# needs no manual provisioning. Producers should publish to these subjects
+# with JetStream publish so every job is persisted and acknowledged.
+JOBS_STREAM = "JOBS"
+JOBS_STREAM_SUBJECTS = ["jobs.embed", "jobs.analytics", "jobs.retention"]
+
+
+async def ensure_jobs_stream(js: JetStreamContext) -> None:
+    """Create the jobs stream, or add any subjects it is missing"""
+    try:
+        info = await js.stream_info(JOBS_STREAM)
+    except NotFoundError:
+        # Work-queue retention drops each job once a consumer acks it
+        await js.add_stream(
+            StreamConfig(
+                name=JOBS_STREAM,
+                subjects=JOBS_STREAM_SUBJECTS,
+                retention=RetentionPolicy.WORK_QUEUE,
+            )
+        )
+        logger.info(f"Created JetStream stream {JOBS_STREAM}")
+        return
+
+    config = info.config
+    missing = [subject for subject in JOBS_STREAM_SUBJECTS if subject not in (config.subjects or [])]
+    if missing:
+        config.subjects = (config.subjects or []) + missing
+        await js.update_stream(config)
+        logger.info(f"Added {missing} to JetStream stream {JOBS_STREAM}")
@@ -2,20 +2,39 @@
 
 import asyncio
 import time
-from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Any, AsyncIterator, Optional, Set, Tuple
 import logging
 
-from app.core.config import settings
+import asyncpg
+
+from app.core.config import get_settings
+from app.models.jobs import RetentionJob
 from app.services.database import DatabaseService
 from app.services.storage import StorageService
 
+logger = logging.getLogger(__name__)
+
+# Maximum documents deleted per transaction, bounding lock duration and WAL size
+PURGE_BATCH_SIZE = 1000
+
+# Organization plans rarely change, so lookups are cached for a few minutes
+PLAN_CACHE_SIZE = 1024
+PLAN_CACHE_TTL = 300  # seconds
+
+# Storage keys checked against the documents table per query
+ORPHAN_CHECK_BATCH_SIZE = 1000
+
+# Maximum in-process scheduled sweeps running at the same time
+MAX_SCHEDULED_SWEEPS = 2
+
 
 class RetentionService:
     """Service for handling data retention and purging"""
     
-    def __init__(self):
-        self.logger = logging.getLogger(__name__)
+    def __init__(self, js=None):
+        self.js = js
         self.db_service = DatabaseService()
         self.storage_service = StorageService()
         
@@ -26,6 +45,13 @@ class RetentionService:
             'professional': 365,
             'enterprise': -1,  # No retention (unlimited)
         }
+        
+        # organization_id -> (cached_at, plan_id), oldest insertion first
+        self._plan_cache: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        
+        # Scheduled sweep tasks are kept referenced so they cannot be garbage collected mid-run
+        self._scheduled_sweeps: Set[asyncio.Task] = set()
+        self._scheduled_sweep_slots = asyncio.Semaphore(MAX_SCHEDULED_SWEEPS)
     
     async def run_retention_sweep(self, organization_id: Optional[str] = None) -> Dict[str, Any]:
         """Run a retention sweep to purge expired data"""
@@ -39,82 +65,209 @@ class RetentionService:
         }
         
         try:
-            self.logger.info("Starting retention sweep")
+            logger.info("Starting retention sweep")
             
-            # Get organizations to process
-            if organization_id:
-                organizations = [{'id': organization_id}]
-            else:
-                organizations = await self._get_all_organizations()
+            # Cutoffs are computed once so every organization uses the same sweep time
+            cutoffs = self._get_retention_cutoffs()
+            
+            # Purge batches as they are read, overlapping DB and storage latency with
+            # the fetch; the pool size is bounded separately from the DB pool
+            concurrency = get_settings().RETENTION_CONCURRENCY
+            batches: asyncio.Queue = asyncio.Queue(maxsize=concurrency)
             
-            for org in organizations:
-                try:
-                    org_results = await self._process_organization_retention(org['id'])
+            async def _purge_worker() -> None:
+                while True:
+                    batch = await batches.get()
+                    if batch is None:
+                        return
+                    org_id, expired_documents = batch
+                    try:
+                        org_results = await self._process_organization_retention(org_id, expired_documents)
+                    except Exception as e:
+                        error_msg = f"Error processing organization {org_id}: {str(e)}"
+                        logger.error(error_msg)
+                        results['errors'].append(error_msg)
+                        continue
                     results['documents_purged'] += org_results['documents_purged']
                     results['chunks_purged'] += org_results['chunks_purged']
                     results['files_purged'] += org_results['files_purged']
-                except Exception as e:
-                    error_msg = f"Error processing organization {org['id']}: {str(e)}"
-                    self.logger.error(error_msg)
-                    results['errors'].append(error_msg)
+            
+            workers = [asyncio.create_task(_purge_worker()) for _ in range(concurrency)]
+            try:
+                async for batch in self._iter_expired_batches(organization_id, cutoffs):
+                    await batches.put(batch)
+            finally:
+                for _ in workers:
+                    await batches.put(None)
+                await asyncio.gather(*workers)
             
             results['duration'] = time.time() - start_time
-            self.logger.info(f"Retention sweep completed: {results}")
+            logger.info("Retention sweep completed: %s", results)
             
         except Exception as e:
             error_msg = f"Error in retention sweep: {str(e)}"
-            self.logger.error(error_msg)
+            logger.error(error_msg)
             results['errors'].append(error_msg)
         
         return results
     
-    async def _process_organization_retention(self, organization_id: str) -> Dict[str, int]:
-        """Process retention for a specific organization"""
+    async def _process_organization_retention(self, organization_id: str,
+                                              expired_documents: List[asyncpg.Record]) -> Dict[str, int]:
+        """Purge the expired documents of a specific organization"""
         results = {
             'documents_purged': 0,
             'chunks_purged': 0,
             'files_purged': 0,
         }
         
-        # Get organization plan
-        plan_id = await self._get_organization_plan(organization_id)
-        retention_days = self.retention_periods.get(plan_id, 30)
-        
-        if retention_days == -1:
-            self.logger.info(f"Organization {organization_id} has unlimited retention (plan: {plan_id})")
-            return results
-        
-        # Calculate cutoff date
-        cutoff_date = datetime.utcnow() - timedelta(days=retention_days)
-        
-        # Get expired documents
-        expired_documents = await self._get_expired_documents(organization_id, cutoff_date)
+        document_ids = [document['id'] for document in expired_documents]
         
-        for document in expired_documents:
+        for start in range(0, len(document_ids), PURGE_BATCH_SIZE):
+            batch = document_ids[start:start + PURGE_BATCH_SIZE]
             try:
-                await self._purge_document(document['id'], organization_id)
-                results['documents_purged'] += 1
-                results['chunks_purged'] += document.get('chunk_count', 0)
-                results['files_purged'] += 1
+                purged_documents = await self._purge_documents_bulk(batch, organization_id)
             except Exception as e:
-                self.logger.error(f"Error purging document {document['id']}: {str(e)}")
+                logger.error("Error purging %s documents for organization %s: %s", len(batch), organization_id, e)
+                continue
+            
+            results['documents_purged'] += len(purged_documents)
+            results['chunks_purged'] += sum(document['chunk_count'] for document in purged_documents)
+            
+            # Delete files from storage
+            file_paths = [document['file_path'] for document in purged_documents]
+            files_deleted = await self.storage_service.delete_files_bulk(file_paths)
+            results['files_purged'] += files_deleted
+            if files_deleted < len(file_paths):
+                logger.error("Failed to delete %s files for organization %s", len(file_paths) - files_deleted, organization_id)
         
         return results
     
-    async def _get_all_organizations(self) -> List[Dict[str, Any]]:
-        """Get all organizations from database"""
+    def _get_retention_cutoffs(self) -> Dict[str, datetime]:
+        """Get the creation-date cutoff of every plan with limited retention"""
+        # Cutoffs are timezone-aware to match documents.created_at (timestamptz),
+        # so the comparison needs no cast and stays usable by the index
+        now = datetime.now(timezone.utc)
+        return {
+            plan_id: now - timedelta(days=retention_days)
+            for plan_id, retention_days in self.retention_periods.items()
+            if retention_days != -1
+        }
+    
+    def _get_cutoff_params(self, cutoffs: Dict[str, datetime]) -> tuple:
+        """Get the query parameters describing each plan's retention cutoff"""
+        return (
+            list(cutoffs.keys()),
+            list(cutoffs.values()),
+            cutoffs['free'],  # Organizations on unknown plans get free-tier retention
+            [plan_id for plan_id, days in self.retention_periods.items() if days == -1],
+        )
+    
+    async def _iter_expired_batches(self, organization_id: Optional[str],
+                                    cutoffs: Dict[str, datetime]) -> AsyncIterator[Tuple[str, List[asyncpg.Record]]]:
+        """Yield (organization_id, documents) purge batches of expired documents"""
+        if organization_id:
+            expired_documents = await self._get_organization_expired_documents(organization_id, cutoffs)
+            for start in range(0, len(expired_documents), PURGE_BATCH_SIZE):
+                yield organization_id, expired_documents[start:start + PURGE_BATCH_SIZE]
+            return
+        
+        pending: Dict[str, List[asyncpg.Record]] = {}
+        async for row in self._iter_expired_documents(cutoffs):
+            documents = pending.setdefault(row['organization_id'], [])
+            documents.append(row)
+            if len(documents) >= PURGE_BATCH_SIZE:
+                yield row['organization_id'], pending.pop(row['organization_id'])
+        
+        for org_id, documents in pending.items():
+            yield org_id, documents
+    
+    async def _iter_expired_documents(self, cutoffs: Dict[str, datetime]) -> AsyncIterator[asyncpg.Record]:
+        """Stream expired documents for all organizations from a single query
+        
+        Unlimited-retention plans are filtered out in SQL, so they cost nothing
+        here. Free-tier organizations dominate the remaining rows; to scale out,
+        shard this query by organization across retention workers.
+        """
+        # The document predicates match the partial index
+        #   CREATE INDEX CONCURRENTLY idx_docs_retention
+        #       ON documents (organization_id, created_at) WHERE deleted_at IS NULL;
+        # so each organization is a bounded range scan rather than a seq scan.
+        # Rows are purged in any order, so no sort is requested.
         query = """
-            SELECT id, name, plan_id, created_at
-            FROM organizations
-            WHERE deleted_at IS NULL
+            WITH plans (plan_id, cutoff) AS (
+                SELECT * FROM unnest($1::text[], $2::timestamptz[])
+            )
+            SELECT 
+                o.id AS organization_id,
+                d.id,
+                d.file_path
+            FROM organizations o
+            LEFT JOIN plans p ON p.plan_id = o.plan_id
+            JOIN documents d ON d.organization_id = o.id
+                AND d.created_at < COALESCE(p.cutoff, $3)
+                AND d.deleted_at IS NULL
+            WHERE o.deleted_at IS NULL
+                AND COALESCE(o.plan_id, '') <> ALL($4::text[])
         """
         
         async with self.db_service.get_connection() as conn:
-            result = await conn.fetch(query)
-            return [dict(row) for row in result]
+            # Server-side cursors only live inside a transaction
+            async with conn.transaction():
+                async for row in conn.cursor(query, *self._get_cutoff_params(cutoffs), prefetch=PURGE_BATCH_SIZE):
+                    yield row
+    
+    async def _get_organization_expired_documents(self, organization_id: str,
+                                                  cutoffs: Dict[str, datetime]) -> List[asyncpg.Record]:
+        """Get an organization's plan and expired documents in a single query"""
+        # Organizations already known to have unlimited retention need no query at all
+        cached_plan_id = self._get_cached_plan(organization_id)
+        if cached_plan_id is not None and self.retention_periods.get(cached_plan_id) == -1:
+            logger.info("Organization %s has unlimited retention (plan: %s)", organization_id, cached_plan_id)
+            return []
+        
+        # Served by idx_docs_retention (see _iter_expired_documents), which also
+        # returns the rows already ordered by created_at
+        query = """
+            WITH plans (plan_id, cutoff) AS (
+                SELECT * FROM unnest($2::text[], $3::timestamptz[])
+            ), o AS (
+                SELECT COALESCE(plan_id, 'free') AS plan_id
+                FROM organizations
+                WHERE id = $1 AND deleted_at IS NULL
+            )
+            SELECT 
+                o.plan_id,
+                d.id,
+                d.file_path
+            FROM o
+            LEFT JOIN plans p ON p.plan_id = o.plan_id
+            LEFT JOIN documents d ON d.organization_id = $1
+                AND d.created_at < COALESCE(p.cutoff, $4)
+                AND d.deleted_at IS NULL
+                AND o.plan_id <> ALL($5::text[])
+            ORDER BY d.created_at ASC
+        """
+        
+        async with self.db_service.get_connection() as conn:
+            result = await conn.fetch(query, organization_id, *self._get_cutoff_params(cutoffs))
+        
+        if not result:
+            return []
+        
+        plan_id = result[0]['plan_id']
+        self._cache_plan(organization_id, plan_id)
+        if self.retention_periods.get(plan_id) == -1:
+            logger.info("Organization %s has unlimited retention (plan: %s)", organization_id, plan_id)
+            return []
+        
+        return [row for row in result if row['id'] is not None]
     
     async def _get_organization_plan(self, organization_id: str) -> str:
         """Get the plan ID for an organization"""
+        cached_plan_id = self._get_cached_plan(organization_id)
+        if cached_plan_id is not None:
+            return cached_plan_id
+        
         query = """
             SELECT plan_id
             FROM organizations
@@ -123,71 +276,62 @@ class RetentionService:
         
         async with self.db_service.get_connection() as conn:
             result = await conn.fetchval(query, organization_id)
-            return result or 'free'
+        
+        plan_id = result or 'free'
+        self._cache_plan(organization_id, plan_id)
+        return plan_id
     
-    async def _get_expired_documents(self, organization_id: str, cutoff_date: datetime) -> List[Dict[str, Any]]:
-        """Get documents that have expired based on retention policy"""
+    def _get_cached_plan(self, organization_id: str) -> Optional[str]:
+        """Get a cached plan ID if it has not expired"""
+        cached = self._plan_cache.get(organization_id)
+        if cached and time.monotonic() - cached[0] < PLAN_CACHE_TTL:
+            return cached[1]
+        return None
+    
+    def _cache_plan(self, organization_id: str, plan_id: str) -> None:
+        """Cache a plan lookup, evicting the oldest entry when full"""
+        self._plan_cache.pop(organization_id, None)
+        self._plan_cache[organization_id] = (time.monotonic(), plan_id)
+        if len(self._plan_cache) > PLAN_CACHE_SIZE:
+            self._plan_cache.popitem(last=False)
+    
+    def invalidate_plan(self, organization_id: str) -> None:
+        """Drop a cached plan, e.g. after the organization changes plans"""
+        self._plan_cache.pop(organization_id, None)
+    
+    async def _purge_documents_bulk(self, document_ids: List[str], organization_id: str) -> List[asyncpg.Record]:
+        """Purge a batch of documents and all their associated data"""
+        logger.info("Purging %s documents for organization %s", len(document_ids), organization_id)
+        
+        # One statement deletes chunks, citations and documents atomically, so no
+        # pre-delete SELECT is needed; chunk counts come from the deleted rows
         query = """
-            SELECT 
-                d.id,
-                d.name,
-                d.file_path,
-                d.created_at,
-                COUNT(c.id) as chunk_count
-            FROM documents d
-            LEFT JOIN chunks c ON d.id = c.document_id
-            WHERE d.organization_id = $1 
-                AND d.created_at < $2
-                AND d.deleted_at IS NULL
-            GROUP BY d.id, d.name, d.file_path, d.created_at
-            ORDER BY d.created_at ASC
+            WITH deleted_chunks AS (
+                DELETE FROM chunks WHERE document_id = ANY($1::uuid[])
+                RETURNING document_id
+            ), deleted_citations AS (
+                DELETE FROM citations WHERE document_id = ANY($1::uuid[])
+            ), deleted_documents AS (
+                DELETE FROM documents
+                WHERE id = ANY($1::uuid[]) AND organization_id = $2
+                RETURNING id, file_path
+            )
+            SELECT d.id, d.file_path, COALESCE(c.chunk_count, 0) AS chunk_count
+            FROM deleted_documents d
+            LEFT JOIN (
+                SELECT document_id, COUNT(*) AS chunk_count
+                FROM deleted_chunks
+                GROUP BY document_id
+            ) c ON c.document_id = d.id
         """
         
-        async with self.db_service.get_connection() as conn:
-            result = await conn.fetch(query, organization_id, cutoff_date)
-            return [dict(row) for row in result]
-    
-    async def _purge_document(self, document_id: str, organization_id: str) -> None:
-        """Purge a document and all its associated data"""
-        self.logger.info(f"Purging document {document_id}")
-        
         async with self.db_service.get_connection() as conn:
             async with conn.transaction():
-                # Get document info before deletion
-                doc_query = """
-                    SELECT file_path, name
-                    FROM documents
-                    WHERE id = $1 AND organization_id = $2
-                """
-                document = await conn.fetchrow(doc_query, document_id, organization_id)
-                
-                if not document:
-                    self.logger.warning(f"Document {document_id} not found or already deleted")
-                    return
-                
-                # Delete chunks first (foreign key constraint)
-                await conn.execute(
-                    "DELETE FROM chunks WHERE document_id = $1",
-                    document_id
-                )
-                
-                # Delete document citations
-                await conn.execute(
-                    "DELETE FROM citations WHERE document_id = $1",
-                    document_id
-                )
-                
-                # Delete document
-                await conn.execute(
-                    "DELETE FROM documents WHERE id = $1 AND organization_id = $2",
-                    document_id, organization_id
-                )
-                
-                # Delete file from storage
-                try:
-                    await self.storage_service.delete_file(document['file_path'])
-                except Exception as e:
-                    self.logger.error(f"Error deleting file {document['file_path']}: {str(e)}")
+                # A lost purge after a crash is simply redone by the next sweep,
+                # so skip waiting for the WAL flush on commit
+                await conn.execute("SET LOCAL synchronous_commit = off")
+                result = await conn.fetch(query, document_ids, organization_id)
+                return result
     
     async def get_retention_stats(self, organization_id: Optional[str] = None) -> Dict[str, Any]:
         """Get retention statistics"""
@@ -209,7 +353,7 @@ class RetentionService:
                 stats.update(all_stats)
                 
         except Exception as e:
-            self.logger.error(f"Error getting retention stats: {str(e)}")
+            logger.error("Error getting retention stats: %s", e)
         
         return stats
     
@@ -217,7 +361,7 @@ class RetentionService:
         """Get retention stats for a specific organization"""
         plan_id = await self._get_organization_plan(organization_id)
         retention_days = self.retention_periods.get(plan_id, 30)
-        cutoff_date = datetime.utcnow() - timedelta(days=retention_days) if retention_days > 0 else None
+        cutoff_date = datetime.now(timezone.utc) - timedelta(days=retention_days) if retention_days > 0 else None
         
         query = """
             SELECT 
@@ -243,66 +387,76 @@ class RetentionService:
         """Get retention stats for all organizations"""
         query = """
             SELECT 
-                o.plan_id,
+                COALESCE(o.plan_id, 'free') as plan_id,
+                GROUPING(COALESCE(o.plan_id, 'free')) = 1 as is_total,
                 COUNT(d.id) as total_documents,
-                SUM(d.file_size) as total_size
+                COALESCE(SUM(d.file_size), 0) as total_size
             FROM organizations o
             LEFT JOIN documents d ON o.id = d.organization_id AND d.deleted_at IS NULL
             WHERE o.deleted_at IS NULL
-            GROUP BY o.plan_id
+            GROUP BY GROUPING SETS ((COALESCE(o.plan_id, 'free')), ())
         """
         
         async with self.db_service.get_connection() as conn:
             result = await conn.fetch(query)
-            
-            documents_by_plan = {}
-            total_documents = 0
-            total_storage = 0
-            
-            for row in result:
-                plan_id = row['plan_id'] or 'free'
-                count = row['total_documents'] or 0
-                size = row['total_size'] or 0
-                
-                documents_by_plan[plan_id] = {
-                    'documents': count,
-                    'storage': size,
-                    'retention_days': self.retention_periods.get(plan_id, 30),
-                }
-                
-                total_documents += count
-                total_storage += size
-            
-            return {
-                'total_documents': total_documents,
-                'storage_usage': total_storage,
-                'documents_by_plan': documents_by_plan,
+        
+        # The grand-total row comes from the empty grouping set
+        totals = {'total_documents': 0, 'total_size': 0}
+        documents_by_plan = {}
+        for row in result:
+            if row['is_total']:
+                totals = row
+                continue
+            documents_by_plan[row['plan_id']] = {
+                'documents': row['total_documents'],
+                'storage': row['total_size'],
+                'retention_days': self.retention_periods.get(row['plan_id'], 30),
             }
+        
+        return {
+            'total_documents': totals['total_documents'],
+            'storage_usage': totals['total_size'],
+            'documents_by_plan': documents_by_plan,
+        }
     
     async def schedule_retention_sweep(self, organization_id: Optional[str] = None) -> str:
         """Schedule a retention sweep job"""
-        # This would typically publish a job to NATS or a job queue
-        # For now, we'll just run it immediately
         job_id = f"retention_sweep_{int(time.time())}"
         
-        # Run the sweep asynchronously
-        asyncio.create_task(self._run_scheduled_sweep(job_id, organization_id))
+        # Publish to the retention stream; the sweep is persisted until a
+        # retention worker acks it, even if none is connected right now
+        if self.js is not None:
+            job = RetentionJob(
+                retention_type="sweep",
+                organization_id=organization_id,
+                job_id=job_id,
+                priority="low",
+                scheduled_at=time.time(),
+            )
+            await self.js.publish("jobs.retention", job.model_dump_json().encode())
+            return job_id
+        
+        # Development fallback without a queue: run the sweep in-process
+        task = asyncio.create_task(self._run_scheduled_sweep(job_id, organization_id))
+        self._scheduled_sweeps.add(task)
+        task.add_done_callback(self._scheduled_sweeps.discard)
         
         return job_id
     
     async def _run_scheduled_sweep(self, job_id: str, organization_id: Optional[str] = None) -> None:
         """Run a scheduled retention sweep"""
         try:
-            self.logger.info(f"Running scheduled retention sweep {job_id}")
-            results = await self.run_retention_sweep(organization_id)
+            async with self._scheduled_sweep_slots:
+                logger.info("Running scheduled retention sweep %s", job_id)
+                results = await self.run_retention_sweep(organization_id)
             
             # Log results
-            self.logger.info(f"Retention sweep {job_id} completed: {results}")
+            logger.info("Retention sweep %s completed: %s", job_id, results)
             
             # Could also store results in database or send notifications
             
         except Exception as e:
-            self.logger.error(f"Error in scheduled retention sweep {job_id}: {str(e)}")
+            logger.error("Error in scheduled retention sweep %s: %s", job_id, e)
     
     async def get_document_retention_info(self, document_id: str) -> Dict[str, Any]:
         """Get retention information for a specific document"""
@@ -334,7 +488,7 @@ class RetentionService:
                 days_until_expiry = None
             else:
                 expires_at = created_at + timedelta(days=retention_days)
-                days_until_expiry = (expires_at - datetime.utcnow()).days
+                days_until_expiry = (expires_at - datetime.now(timezone.utc)).days
             
             return {
                 'document_id': result['id'],
@@ -354,7 +508,7 @@ class RetentionService:
         # This would be an enterprise feature to extend retention for specific documents
         # For now, we'll just log the request
         
-        self.logger.info(f"Retention extension requested for document {document_id}: +{additional_days} days")
+        logger.info("Retention extension requested for document %s: +%s days", document_id, additional_days)
         
         # In a real implementation, you might:
         # 1. Check if the organization has the right plan
@@ -371,35 +525,53 @@ class RetentionService:
             'errors': [],
         }
         
+        # Only storage keys without a live document come back from the database
+        orphan_query = """
+            SELECT s.file_path FROM unnest($1::text[]) AS s(file_path)
+            EXCEPT
+            SELECT file_path FROM documents
+            WHERE deleted_at IS NULL AND file_path = ANY($1::text[])
+        """
+        
+        # Listing and deletion run as separate pipeline stages so the next storage
+        # page is fetched while orphans from the previous one are deleted
+        pages: asyncio.Queue = asyncio.Queue(maxsize=2)
+        
+        async def _list_pages() -> None:
+            try:
+                async for page in self.storage_service.iter_all_files(page_size=ORPHAN_CHECK_BATCH_SIZE):
+                    await pages.put(page)
+            except Exception:
+                await pages.put(None)
+                raise
+            await pages.put(None)
+        
         try:
-            # Get all file paths from database
-            query = "SELECT file_path FROM documents WHERE deleted_at IS NULL"
-            
-            async with self.db_service.get_connection() as conn:
-                db_files = await conn.fetch(query)
-                db_file_paths = {row['file_path'] for row in db_files}
-            
-            # List all files in storage
-            storage_files = await self.storage_service.list_all_files()
-            
-            # Find orphaned files
-            orphaned_files = storage_files - db_file_paths
-            
-            # Delete orphaned files
-            for file_path in orphaned_files:
-                try:
-                    await self.storage_service.delete_file(file_path)
-                    results['orphaned_files_deleted'] += 1
-                except Exception as e:
-                    error_msg = f"Error deleting orphaned file {file_path}: {str(e)}"
-                    self.logger.error(error_msg)
-                    results['errors'].append(error_msg)
+            lister = asyncio.create_task(_list_pages())
+            try:
+                while (page := await pages.get()) is not None:
+                    results['files_checked'] += len(page)
+                    
+                    # Find orphaned files
+                    async with self.db_service.get_connection() as conn:
+                        orphaned_files = [row['file_path'] for row in await conn.fetch(orphan_query, page)]
+                    
+                    # Delete orphaned files
+                    deleted = await self.storage_service.delete_files_bulk(orphaned_files)
+                    results['orphaned_files_deleted'] += deleted
+                    if deleted < len(orphaned_files):
+                        error_msg = f"Failed to delete {len(orphaned_files) - deleted} orphaned files"
+                        logger.error(error_msg)
+                        results['errors'].append(error_msg)
+            finally:
+                lister.cancel()
             
-            results['files_checked'] = len(storage_files)
+            # Surface listing errors
+            await lister
             
         except Exception as e:
             error_msg = f"Error in orphaned file cleanup: {str(e)}"
-            self.logger.error(error_msg)
+            logger.error(error_msg)
             results['errors'].append(error_msg)
         
         return results
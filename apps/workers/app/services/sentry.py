@@ -1,5 +1,7 @@
 import os
 import logging
+import random
+import re
 from typing import Optional, Dict, Any
 import sentry_sdk
 from sentry_sdk.integrations.logging import LoggingIntegration
@@ -9,11 +11,38 @@ from sentry_sdk.integrations.httpx import HttpxIntegration
 
 logger = logging.getLogger(__name__)
 
+# Built once; the before_send/before_breadcrumb hooks run for every event
+_SENSITIVE_KEY_RE = re.compile(r'(?i)(password|token|secret|api[_-]?key|auth|cookie|^key$)')
+# Event sections that carry caller-supplied data and may hold secrets
+_REDACTED_EVENT_SECTIONS = ('request', 'extra', 'contexts', 'breadcrumbs')
+_ALWAYS_SENT_LEVELS = frozenset({'error', 'fatal'})
+_STATIC_TAGS = {
+    'service': 'rag-worker',
+    'component': 'worker',
+}
+
+
+def _redact(*roots: Any) -> None:
+    """Redact sensitive keys at any depth, walking iteratively rather than recursively."""
+    stack = list(roots)
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, dict):
+            for key, value in obj.items():
+                if isinstance(key, str) and _SENSITIVE_KEY_RE.search(key):
+                    obj[key] = '[REDACTED]'
+                elif isinstance(value, (dict, list)):
+                    stack.append(value)
+        elif isinstance(obj, list):
+            stack.extend(obj)
+
 class SentryService:
     """Sentry service for error tracking and monitoring in workers."""
     
     def __init__(self):
         self.is_initialized = False
+        self._error_only = os.getenv('SENTRY_ERROR_ONLY', 'false').lower() == 'true'
+        self._event_sample_rate = 0.0 if self._error_only else float(os.getenv('SENTRY_EVENT_SAMPLE_RATE', '1.0'))
         self._initialize_sentry()
     
     def _initialize_sentry(self):
@@ -52,66 +81,48 @@ class SentryService:
                 ],
                 before_send=self._before_send,
                 before_breadcrumb=self._before_breadcrumb,
-                default_tags={
-                    'service': 'rag-worker',
-                    'component': 'worker',
-                }
+                default_tags=_STATIC_TAGS,
             )
             
             self.is_initialized = True
             logger.info('Sentry initialized successfully')
         except Exception as e:
-            logger.error(f'Failed to initialize Sentry: {e}')
+            logger.error('Failed to initialize Sentry: %s', e)
     
     def _before_send(self, event: Dict[str, Any], hint: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Filter sensitive data before sending to Sentry."""
+        # Drop sampled-out non-error events before paying for redaction
+        if event.get('level') not in _ALWAYS_SENT_LEVELS and random.random() >= self._event_sample_rate:
+            return None
+        
         try:
-            # Remove sensitive data from event
-            if 'request' in event and 'headers' in event['request']:
-                sensitive_headers = ['authorization', 'cookie', 'x-api-key', 'x-auth-token']
-                for header in sensitive_headers:
-                    if header in event['request']['headers']:
-                        event['request']['headers'][header] = '[REDACTED]'
-            
-            # Remove sensitive data from extra context
-            if 'extra' in event:
-                sensitive_keys = ['password', 'token', 'secret', 'key', 'api_key']
-                for key in sensitive_keys:
-                    if key in event['extra']:
-                        event['extra'][key] = '[REDACTED]'
+            # Remove sensitive data from request headers/data, extra context,
+            # contexts and breadcrumbs in a single walk
+            _redact(*(event.get(section) for section in _REDACTED_EVENT_SECTIONS))
             
             # Add custom context
-            if 'tags' not in event:
-                event['tags'] = {}
-            event['tags'].update({
-                'service': 'rag-worker',
-                'component': 'worker',
-            })
+            event.setdefault('tags', {}).update(_STATIC_TAGS)
             
             return event
         except Exception as e:
-            logger.error(f'Error in before_send: {e}')
+            logger.error('Error in before_send: %s', e)
             return event
     
     def _before_breadcrumb(self, breadcrumb: Dict[str, Any], hint: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Filter sensitive data from breadcrumbs."""
         try:
             # Remove sensitive data from breadcrumb data
-            if 'data' in breadcrumb:
-                sensitive_keys = ['password', 'token', 'secret', 'key', 'api_key']
-                for key in sensitive_keys:
-                    if key in breadcrumb['data']:
-                        breadcrumb['data'][key] = '[REDACTED]'
+            _redact(breadcrumb.get('data'))
             
             return breadcrumb
         except Exception as e:
-            logger.error(f'Error in before_breadcrumb: {e}')
+            logger.error('Error in before_breadcrumb: %s', e)
             return breadcrumb
     
     def capture_exception(self, exception: Exception, context: Optional[Dict[str, Any]] = None) -> str:
         """Capture an exception."""
         if not self.is_initialized:
-            logger.error(f'Exception not captured (Sentry not initialized): {exception}')
+            logger.error('Exception not captured (Sentry not initialized): %s', exception)
             return ''
         
         try:
@@ -123,16 +134,16 @@ class SentryService:
                     'component': 'worker',
                 }
             )
-            logger.error(f'Exception captured in Sentry: {event_id}')
+            logger.error('Exception captured in Sentry: %s', event_id)
             return event_id
         except Exception as e:
-            logger.error(f'Failed to capture exception: {e}')
+            logger.error('Failed to capture exception: %s', e)
             return ''
     
     def capture_message(self, message: str, level: str = 'info', context: Optional[Dict[str, Any]] = None) -> str:
         """Capture a message."""
         if not self.is_initialized:
-            logger.log(logging.INFO, f'Message not captured (Sentry not initialized): {message}')
+            logger.log(logging.INFO, 'Message not captured (Sentry not initialized): %s', message)
             return ''
         
         try:
@@ -145,10 +156,10 @@ class SentryService:
                     'component': 'worker',
                 }
             )
-            logger.info(f'Message captured in Sentry: {event_id}')
+            logger.info('Message captured in Sentry: %s', event_id)
             return event_id
         except Exception as e:
-            logger.error(f'Failed to capture message: {e}')
+            logger.error('Failed to capture message: %s', e)
             return ''
     
     def add_breadcrumb(self, message: str, category: str = 'rag-worker', level: str = 'info', data: Optional[Dict[str, Any]] = None):
@@ -164,7 +175,7 @@ class SentryService:
                 data=data
             )
         except Exception as e:
-            logger.error(f'Failed to add breadcrumb: {e}')
+            logger.error('Failed to add breadcrumb: %s', e)
     
     def set_user(self, user_id: str, email: Optional[str] = None, username: Optional[str] = None):
         """Set user context."""
@@ -178,7 +189,7 @@ class SentryService:
                 'username': username,
             })
         except Exception as e:
-            logger.error(f'Failed to set user: {e}')
+            logger.error('Failed to set user: %s', e)
     
     def set_extra(self, key: str, value: Any):
         """Set extra context."""
@@ -188,7 +199,7 @@ class SentryService:
         try:
             sentry_sdk.set_extra(key, value)
         except Exception as e:
-            logger.error(f'Failed to set extra: {e}')
+            logger.error('Failed to set extra: %s', e)
     
     def set_tag(self, key: str, value: str):
         """Set tag."""
@@ -198,7 +209,7 @@ class SentryService:
         try:
             sentry_sdk.set_tag(key, value)
         except Exception as e:
-            logger.error(f'Failed to set tag: {e}')
+            logger.error('Failed to set tag: %s', e)
     
     def start_transaction(self, name: str, operation: str) -> Any:
         """Start a transaction."""
@@ -212,7 +223,7 @@ class SentryService:
                 op=operation
             )
         except Exception as e:
-            logger.error(f'Failed to start transaction: {e}')
+            logger.error('Failed to start transaction: %s', e)
             return DummyTransaction()
     
     def get_current_transaction(self) -> Optional[Any]:
@@ -223,7 +234,7 @@ class SentryService:
         try:
             return sentry_sdk.get_current_scope().transaction
         except Exception as e:
-            logger.error(f'Failed to get current transaction: {e}')
+            logger.error('Failed to get current transaction: %s', e)
             return None
     
     def configure_scope(self, callback):
@@ -234,7 +245,7 @@ class SentryService:
         try:
             sentry_sdk.configure_scope(callback)
         except Exception as e:
-            logger.error(f'Failed to configure scope: {e}')
+            logger.error('Failed to configure scope: %s', e)
     
     def flush(self, timeout: Optional[float] = None) -> bool:
         """Flush events."""
@@ -244,7 +255,7 @@ class SentryService:
         try:
             return sentry_sdk.flush(timeout=timeout)
         except Exception as e:
-            logger.error(f'Failed to flush Sentry: {e}')
+            logger.error('Failed to flush Sentry: %s', e)
             return False
     
     def close(self):
@@ -257,7 +268,7 @@ class SentryService:
             self.is_initialized = False
             logger.info('Sentry closed successfully')
         except Exception as e:
-            logger.error(f'Failed to close Sentry: {e}')
+            logger.error('Failed to close Sentry: %s', e)
     
     def is_enabled(self) -> bool:
         """Check if Sentry is initialized."""
@@ -1,16 +1,81 @@
 # Created automatically by Cursor AI (2025-01-27)
 
+import asyncio
+import functools
+import logging
+import secrets
 import time
-import hashlib
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple, Union
 from uuid import UUID
 
+import boto3
+import httpx
+
+from app.core.config import get_settings
+from app.services.database import DatabaseService
+
+logger = logging.getLogger(__name__)
+
+
+# Maximum concurrent storage deletes issued by delete_files_bulk
+DELETE_CONCURRENCY = 32
+
+# Uploads larger than this are sent as parallel multipart uploads
+MULTIPART_THRESHOLD = 16 * 1024 * 1024
+MULTIPART_SIZE = 8 * 1024 * 1024
+MULTIPART_PARALLEL_COUNT = 8
+
+# Connections kept open to S3 by the shared HTTP client
+HTTP_MAX_CONNECTIONS = 64
+HTTP_KEEPALIVE_EXPIRY = 60
+
+# Content types of export artifacts by file extension
+_CONTENT_TYPES = {
+    'md': 'text/markdown',
+    'html': 'text/html',
+    'json': 'application/json',
+    'pdf': 'application/pdf',
+}
+_DEFAULT_CONTENT_TYPE = 'application/octet-stream'
+
+
+def _as_bytes(content: Union[bytes, memoryview]) -> bytes:
+    """Get bytes for an upload body without copying views over a whole bytes object"""
+    if isinstance(content, memoryview):
+        if isinstance(content.obj, bytes) and content.nbytes == len(content.obj):
+            return content.obj
+        return content.tobytes()
+    return content
+
 
 class StorageService:
     """Service for storage operations"""
     
     def __init__(self):
-        pass
+        # Signs URLs and manages multipart uploads; object bytes go straight to S3 over HTTP
+        settings = get_settings()
+        self.bucket = settings.S3_BUCKET
+        self.endpoint = settings.S3_ENDPOINT.rstrip("/")
+        self.s3_client = boto3.client(
+            's3',
+            endpoint_url=settings.S3_ENDPOINT,
+            aws_access_key_id=settings.S3_ACCESS_KEY,
+            aws_secret_access_key=settings.S3_SECRET_KEY,
+            region_name=settings.S3_REGION,
+            use_ssl=settings.S3_SECURE,
+        )
+        self._http_client: Optional[httpx.AsyncClient] = None
+        
+        # Export metadata rows waiting for the next flush_metadata
+        self.db_service = DatabaseService()
+        self._metadata_buffer: List[Tuple[Any, ...]] = []
+        
+        # Export uploaders specialized per known extension
+        self._uploaders = {
+            file_extension: functools.partial(self._upload_typed, content_type=content_type,
+                                              file_extension=file_extension)
+            for file_extension, content_type in _CONTENT_TYPES.items()
+        }
     
     async def download_file(self, file_path: str) -> bytes:
         """Download file from storage"""
@@ -22,70 +87,218 @@ class StorageService:
         # TODO: Implement file upload
         pass
     
-    async def delete_file(self, file_path: str) -> None:
-        """Delete file from storage"""
-        # TODO: Implement file deletion
-        pass
+    async def iter_all_files(self, page_size: int = 1000) -> AsyncIterator[List[str]]:
+        """Yield pages of at most page_size file paths stored in storage"""
+        params = {'Bucket': self.bucket, 'MaxKeys': page_size}
+        while True:
+            # boto3 blocks, so each page is listed off the event loop
+            response = await asyncio.to_thread(self.s3_client.list_objects_v2, **params)
+            
+            keys = [obj['Key'] for obj in response.get('Contents', ())]
+            if keys:
+                yield keys
+            
+            if not response.get('IsTruncated'):
+                return
+            params['ContinuationToken'] = response['NextContinuationToken']
     
-    async def store_file(self, file_path: str, content: bytes, content_type: str = None) -> str:
+    async def presign_put(self, file_path: str, content_type: str, expires_in: int = 900) -> str:
+        """Generate a presigned PUT URL for uploading a file directly to storage"""
+        return self.s3_client.generate_presigned_url(
+            'put_object',
+            Params={'Bucket': self.bucket, 'Key': file_path, 'ContentType': content_type},
+            ExpiresIn=expires_in,
+        )
+    
+    async def store_file(self, file_path: str, content: Union[bytes, memoryview], content_type: str = None,
+                         parallel_count: int = MULTIPART_PARALLEL_COUNT,
+                         multipart_size: int = MULTIPART_SIZE) -> str:
         """Store a file and return the URL"""
         try:
-            # This would upload to S3/MinIO
-            # Implementation depends on your storage service
-            return f"https://storage.example.com/files/{file_path}"
-        except Exception as e:
-            print(f"Failed to store file: {e}")
+            content_type = content_type or 'application/octet-stream'
+            
+            if memoryview(content).nbytes > MULTIPART_THRESHOLD:
+                await self._store_file_multipart(file_path, content, content_type, parallel_count, multipart_size)
+                return f"{self.endpoint}/{self.bucket}/{file_path}"
+            
+            # PUT straight to S3/MinIO through a presigned URL; a 200 confirms the upload
+            url = await self.presign_put(file_path, content_type)
+            response = await self._get_http_client().put(
+                url,
+                content=_as_bytes(content),
+                headers={'Content-Type': content_type},
+            )
+            response.raise_for_status()
+            
+            return f"{self.endpoint}/{self.bucket}/{file_path}"
+        except Exception:
+            logger.exception("Failed to store file %s", file_path)
             raise
     
-    async def upload_export_artifact(self, job, content: str, file_extension: str) -> str:
+    async def upload_export_artifact(self, job, content: Union[str, bytes, bytearray, memoryview],
+                                     file_extension: str) -> str:
         """Upload export artifact to S3 and return URL"""
+        uploader = self._uploaders.get(file_extension)
+        if uploader is None:
+            return await self._upload_typed(job, content, content_type=_DEFAULT_CONTENT_TYPE,
+                                            file_extension=file_extension)
+        return await uploader(job, content)
+    
+    async def _upload_typed(self, job, content: Union[str, bytes, bytearray, memoryview], *,
+                            content_type: str, file_extension: str) -> str:
+        """Upload an export artifact whose content type is already resolved"""
         try:
-            # Generate unique filename
-            timestamp = int(time.time())
-            job_id = job.thread_id or job.project_id or job.document_id
-            content_hash = hashlib.md5(content.encode()).hexdigest()[:8]
-            
-            filename = f"exports/{job.export_type}/{job_id}_{timestamp}_{content_hash}.{file_extension}"
-            
-            # Determine content type
-            content_type_map = {
-                'md': 'text/markdown',
-                'html': 'text/html',
-                'json': 'application/json',
-                'pdf': 'application/pdf'
-            }
-            content_type = content_type_map.get(file_extension, 'application/octet-stream')
+            filename, data = self._prepare_export_artifact(job, content, file_extension)
             
             # Upload to S3
-            url = await self.store_file(filename, content.encode(), content_type)
+            url = await self.store_file(filename, memoryview(data), content_type)
             
             # Store metadata in database
-            await self._store_export_metadata(job, filename, url, len(content))
+            self._store_export_metadata(job, filename, url, memoryview(data).nbytes)
+            await self.flush_metadata()
             
             return url
             
-        except Exception as e:
-            print(f"Failed to upload export artifact: {e}")
+        except Exception:
+            logger.exception("Failed to upload export artifact")
             raise
     
-    async def _store_export_metadata(self, job, filename: str, url: str, file_size: int) -> None:
-        """Store export metadata in database"""
+    async def upload_export_session(self, job, artifacts: List[Tuple[Union[str, bytes], str]]) -> List[str]:
+        """Upload every (content, file_extension) artifact of an export job as one unit
+        
+        All uploads run in parallel. Metadata is only recorded once every artifact
+        is in storage; if any upload fails, the ones that succeeded are deleted so
+        the job leaves no orphaned objects behind.
+        """
+        # Allocate every object key up front
+        prepared = [
+            (
+                *self._prepare_export_artifact(job, content, file_extension),
+                _CONTENT_TYPES.get(file_extension, _DEFAULT_CONTENT_TYPE),
+            )
+            for content, file_extension in artifacts
+        ]
+        
+        outcomes = await asyncio.gather(
+            *(self.store_file(filename, memoryview(data), content_type) for filename, data, content_type in prepared),
+            return_exceptions=True,
+        )
+        
+        failures = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+        if failures:
+            # Abort the session
+            uploaded = [
+                filename for (filename, _, _), outcome in zip(prepared, outcomes)
+                if not isinstance(outcome, Exception)
+            ]
+            await self.delete_files_bulk(uploaded)
+            logger.error("Failed to upload export session, removed %d uploaded artifacts",
+                         len(uploaded), exc_info=failures[0])
+            raise failures[0]
+        
+        # Commit the session
+        for (filename, data, _), url in zip(prepared, outcomes):
+            self._store_export_metadata(job, filename, url, memoryview(data).nbytes)
+        await self.flush_metadata()
+        
+        return list(outcomes)
+    
+    def _prepare_export_artifact(self, job, content: Union[str, bytes, bytearray, memoryview],
+                                 file_extension: str) -> Tuple[str, Union[bytes, bytearray, memoryview]]:
+        """Encode an export artifact and allocate its object key"""
+        job_id = job.thread_id or job.project_id or job.document_id
+        # Encode once; the same buffer is uploaded and measured
+        data = content.encode("utf-8") if isinstance(content, str) else content
+        
+        # Generate unique filename; a nanosecond timestamp plus 32 random bits
+        # keeps names unique without reading the content
+        filename = f"exports/{job.export_type}/{job_id}_{time.time_ns()}_{secrets.token_hex(4)}.{file_extension}"
+        
+        return filename, data
+    
+    async def _store_file_multipart(self, file_path: str, content: Union[bytes, memoryview], content_type: str,
+                                    parallel_count: int, multipart_size: int) -> None:
+        """Upload a large file as parts PUT concurrently through presigned URLs"""
+        upload = await asyncio.to_thread(
+            self.s3_client.create_multipart_upload,
+            Bucket=self.bucket, Key=file_path, ContentType=content_type,
+        )
+        upload_id = upload['UploadId']
+        
+        view = memoryview(content)
+        slots = asyncio.Semaphore(parallel_count)
+        
+        async def _upload_part(part_number: int, start: int) -> Dict[str, Any]:
+            # A freed slot immediately starts the next pending part
+            async with slots:
+                url = self.s3_client.generate_presigned_url(
+                    'upload_part',
+                    Params={'Bucket': self.bucket, 'Key': file_path, 'UploadId': upload_id, 'PartNumber': part_number},
+                    ExpiresIn=900,
+                )
+                response = await self._get_http_client().put(url, content=_as_bytes(view[start:start + multipart_size]))
+                response.raise_for_status()
+                return {'PartNumber': part_number, 'ETag': response.headers['ETag']}
+        
         try:
-            # This would store export metadata in the database
-            # Implementation depends on your database service
-            export_record = {
-                "job_id": job.id,
-                "filename": filename,
-                "url": url,
-                "file_size": file_size,
-                "export_type": job.export_type,
-                "format": job.format,
-                "created_at": time.time()
-            }
-            # Store in database
-            pass
-        except Exception as e:
-            print(f"Failed to store export metadata: {e}")
+            parts = await asyncio.gather(*(
+                _upload_part(part_number, start)
+                for part_number, start in enumerate(range(0, view.nbytes, multipart_size), start=1)
+            ))
+            await asyncio.to_thread(
+                self.s3_client.complete_multipart_upload,
+                Bucket=self.bucket, Key=file_path, UploadId=upload_id,
+                MultipartUpload={'Parts': parts},
+            )
+        except Exception:
+            await asyncio.to_thread(
+                self.s3_client.abort_multipart_upload,
+                Bucket=self.bucket, Key=file_path, UploadId=upload_id,
+            )
+            raise
+    
+    def _get_http_client(self) -> httpx.AsyncClient:
+        """Get the HTTP client used for presigned uploads, creating it on first use"""
+        if self._http_client is None:
+            # One pooled client reuses TCP/TLS sessions to S3 across exports
+            self._http_client = httpx.AsyncClient(
+                timeout=get_settings().WORKER_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+                ),
+            )
+        return self._http_client
+    
+    async def close(self) -> None:
+        """Close the HTTP client and database pool"""
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+        await self.db_service.close()
+    
+    def _store_export_metadata(self, job, filename: str, url: str, file_size: int) -> None:
+        """Buffer export metadata until the next flush_metadata"""
+        self._metadata_buffer.append((
+            job.id,
+            filename,
+            url,
+            file_size,
+            job.export_type,
+            job.format,
+        ))
+    
+    async def flush_metadata(self) -> None:
+        """Store buffered export metadata in database with one batched insert"""
+        if not self._metadata_buffer:
+            return
+        
+        rows, self._metadata_buffer = self._metadata_buffer, []
+        try:
+            await self.db_service.create_exports(rows)
+        except Exception:
+            logger.exception("Failed to store export metadata")
     
     async def generate_signed_url(self, file_path: str, expires_in: int = 3600) -> str:
         """Generate a signed URL for file access"""
@@ -93,8 +306,8 @@ class StorageService:
             # This would generate a signed URL for S3/MinIO
             # Implementation depends on your storage service
             return f"https://storage.example.com/signed/{file_path}?expires={expires_in}"
-        except Exception as e:
-            print(f"Failed to generate signed URL: {e}")
+        except Exception:
+            logger.exception("Failed to generate signed URL")
             raise
     
     async def delete_file(self, file_path: str) -> bool:
@@ -103,6 +316,17 @@ class StorageService:
             # This would delete from S3/MinIO
             # Implementation depends on your storage service
             return True
-        except Exception as e:
-            print(f"Failed to delete file: {e}")
+        except Exception:
+            logger.exception("Failed to delete file %s", file_path)
             return False
+    
+    async def delete_files_bulk(self, file_paths: List[str]) -> int:
+        """Delete many files from storage concurrently and return how many were deleted"""
+        semaphore = asyncio.Semaphore(DELETE_CONCURRENCY)
+        
+        async def _delete(file_path: str) -> bool:
+            async with semaphore:
+                return await self.delete_file(file_path)
+        
+        deleted = await asyncio.gather(*(_delete(path) for path in file_paths), return_exceptions=True)
+        return sum(1 for result in deleted if result is True)
@@ -1,11 +1,15 @@
 import os
 import logging
-from typing import Optional, Dict, Any, List
+from types import MappingProxyType
+from typing import Optional, Dict, Any, List, Mapping
 from contextlib import contextmanager
+from functools import lru_cache
+from grpc import Compression
 from opentelemetry import trace
 from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
-from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
 from opentelemetry.sdk.resources import Resource
 from opentelemetry.semconv.resource import ResourceAttributes
 from opentelemetry.trace import SpanKind, Status, StatusCode
@@ -14,46 +18,77 @@ from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapProp
 
 logger = logging.getLogger(__name__)
 
+# Process configuration, fixed for the lifetime of the worker
+_SERVICE_NAME = os.getenv('OTEL_SERVICE_NAME', 'rag-worker')
+_SERVICE_VERSION = os.getenv('OTEL_SERVICE_VERSION', '1.0.0')
+_ENVIRONMENT = os.getenv('NODE_ENV', 'development')
+_OTEL_ENDPOINT = os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT')
+_SAMPLER_ARG = os.getenv('OTEL_TRACES_SAMPLER_ARG', '0.05')
+
+_RESOURCE = Resource.create({
+    ResourceAttributes.SERVICE_NAME: _SERVICE_NAME,
+    ResourceAttributes.SERVICE_VERSION: _SERVICE_VERSION,
+    ResourceAttributes.DEPLOYMENT_ENVIRONMENT: _ENVIRONMENT,
+})
+
+# Per-kind attribute templates; helpers copy one and fill it in instead of
+# building a fresh dict (and re-hashing literal keys) for every span
+_HTTP_ATTRS_TEMPLATE = {'http.method': None, 'http.url': None}
+_DB_ATTRS_TEMPLATE = {'db.operation': None}
+_EXTERNAL_ATTRS_TEMPLATE = {'service.name': None, 'service.operation': None}
+_WORKER_ATTRS_TEMPLATE = {'job.type': None, 'job.id': None}
+_DOCUMENT_ATTRS_TEMPLATE = {'document.operation': None, 'document.id': None}
+_QA_ATTRS_TEMPLATE = {'qa.operation': None}
+
+# Shared read-only stand-in for omitted attributes
+_EMPTY_ATTRS: Mapping[str, Any] = MappingProxyType({})
+
 class TelemetryService:
     """OpenTelemetry service for distributed tracing across workers."""
     
     def __init__(self):
         self.tracer_provider: Optional[TracerProvider] = None
         self.tracer: Optional[trace.Tracer] = None
+        self._enabled = False
         self.propagator = TraceContextTextMapPropagator()
         self._initialize_otel()
     
     def _initialize_otel(self):
         """Initialize OpenTelemetry tracing."""
         try:
-            service_name = os.getenv('OTEL_SERVICE_NAME', 'rag-worker')
-            service_version = os.getenv('OTEL_SERVICE_VERSION', '1.0.0')
-            environment = os.getenv('NODE_ENV', 'development')
-            otel_endpoint = os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT')
+            otel_endpoint = _OTEL_ENDPOINT
+            sample_ratio = float(_SAMPLER_ARG)
             
-            # Create tracer provider
+            # Create tracer provider; root spans are sampled by trace id and
+            # child spans follow their parent's decision
             self.tracer_provider = TracerProvider(
-                resource=Resource.create({
-                    ResourceAttributes.SERVICE_NAME: service_name,
-                    ResourceAttributes.SERVICE_VERSION: service_version,
-                    ResourceAttributes.DEPLOYMENT_ENVIRONMENT: environment,
-                })
+                sampler=ParentBased(TraceIdRatioBased(sample_ratio)),
+                resource=_RESOURCE,
             )
             
-            # Configure span processor
+            # Configure span processor; gRPC keeps one HTTP/2 connection to
+            # the collector and batches are gzipped on the wire
             if otel_endpoint:
                 exporter = OTLPSpanExporter(
-                    endpoint=f"{otel_endpoint}/v1/traces"
+                    endpoint=otel_endpoint,
+                    insecure=not otel_endpoint.startswith('https://'),
+                    compression=Compression.Gzip,
                 )
                 self.tracer_provider.add_span_processor(
-                    BatchSpanProcessor(exporter)
+                    BatchSpanProcessor(
+                        exporter,
+                        max_queue_size=8192,
+                        max_export_batch_size=1024,
+                        schedule_delay_millis=2000,
+                    )
                 )
             
             # Set the tracer provider
             trace.set_tracer_provider(self.tracer_provider)
             
             # Get tracer
-            self.tracer = trace.get_tracer(service_name, service_version)
+            self.tracer = trace.get_tracer(_SERVICE_NAME, _SERVICE_VERSION)
+            self._enabled = self.tracer is not None
             
             logger.info("OpenTelemetry tracing initialized successfully")
         except Exception as e:
@@ -67,16 +102,12 @@ class TelemetryService:
         parent_context: Optional[Context] = None
     ) -> Optional[trace.Span]:
         """Create a new span."""
-        if not self.tracer:
+        tracer = self.tracer
+        if not tracer:
             return None
         
-        span = self.tracer.start_span(
-            name,
-            kind=kind,
-            attributes=attributes or {},
-            context=parent_context
-        )
-        return span
+        start_span = tracer.start_span
+        return start_span(name, context=parent_context, kind=kind, attributes=attributes if attributes is not None else _EMPTY_ATTRS)
     
     @contextmanager
     def span(
@@ -86,21 +117,27 @@ class TelemetryService:
         attributes: Optional[Dict[str, Any]] = None,
         parent_context: Optional[Context] = None
     ):
-        """Context manager for creating and managing spans."""
-        span = self.create_span(name, kind, attributes, parent_context)
-        if not span:
+        """Context manager that creates a span and makes it the current span."""
+        if not self.tracer:
             yield None
             return
         
-        try:
-            yield span
-            span.set_status(Status(StatusCode.OK))
-        except Exception as e:
-            span.set_status(Status(StatusCode.ERROR, str(e)))
-            span.record_exception(e)
-            raise
-        finally:
-            span.end()
+        # Activate the span so the add_event/set_* helpers reach it
+        with self.tracer.start_as_current_span(
+            name,
+            context=parent_context,
+            kind=kind,
+            attributes=attributes if attributes is not None else _EMPTY_ATTRS,
+            record_exception=False,
+            set_status_on_exception=False,
+        ) as span:
+            try:
+                yield span
+                span.set_status(Status(StatusCode.OK))
+            except Exception as e:
+                span.set_status(Status(StatusCode.ERROR, str(e)))
+                span.record_exception(e)
+                raise
     
     def get_current_span(self) -> Optional[trace.Span]:
         """Get the current active span."""
@@ -108,27 +145,36 @@ class TelemetryService:
     
     def add_event(self, name: str, attributes: Optional[Dict[str, Any]] = None):
         """Add event to current span."""
+        if not self._enabled:
+            return
         span = self.get_current_span()
-        if span:
-            span.add_event(name, attributes or {})
+        if span is not None and span.is_recording():
+            span.add_event(name, attributes if attributes is not None else _EMPTY_ATTRS)
     
     def set_attributes(self, attributes: Dict[str, Any]):
         """Set attributes on current span."""
+        if not self._enabled:
+            return
         span = self.get_current_span()
-        if span:
+        if span is not None and span.is_recording():
             span.set_attributes(attributes)
     
     def set_error(self, error: Exception):
         """Mark current span as error."""
+        if not self._enabled:
+            return
         span = self.get_current_span()
-        if span:
+        # Only format the error for a span that will actually be exported
+        if span is not None and span.is_recording():
             span.set_status(Status(StatusCode.ERROR, str(error)))
             span.record_exception(error)
     
     def set_success(self):
         """Mark current span as success."""
+        if not self._enabled:
+            return
         span = self.get_current_span()
-        if span:
+        if span is not None and span.is_recording():
             span.set_status(Status(StatusCode.OK))
     
     def extract_trace_context(self, headers: Dict[str, str]) -> Optional[Context]:
@@ -161,10 +207,9 @@ class TelemetryService:
         status_code: Optional[int] = None
     ) -> Optional[trace.Span]:
         """Create a span for HTTP requests."""
-        attributes = {
-            'http.method': method,
-            'http.url': url,
-        }
+        attributes = _HTTP_ATTRS_TEMPLATE.copy()
+        attributes['http.method'] = method
+        attributes['http.url'] = url
         if status_code:
             attributes['http.status_code'] = status_code
         
@@ -181,9 +226,8 @@ class TelemetryService:
         query: Optional[str] = None
     ) -> Optional[trace.Span]:
         """Create a span for database operations."""
-        attributes = {
-            'db.operation': operation,
-        }
+        attributes = _DB_ATTRS_TEMPLATE.copy()
+        attributes['db.operation'] = operation
         if table:
             attributes['db.table'] = table
         if query:
@@ -202,10 +246,9 @@ class TelemetryService:
         endpoint: Optional[str] = None
     ) -> Optional[trace.Span]:
         """Create a span for external service calls."""
-        attributes = {
-            'service.name': service,
-            'service.operation': operation,
-        }
+        attributes = _EXTERNAL_ATTRS_TEMPLATE.copy()
+        attributes['service.name'] = service
+        attributes['service.operation'] = operation
         if endpoint:
             attributes['service.endpoint'] = endpoint
         
@@ -222,10 +265,9 @@ class TelemetryService:
         organization_id: Optional[str] = None
     ) -> Optional[trace.Span]:
         """Create a span for worker jobs."""
-        attributes = {
-            'job.type': job_type,
-            'job.id': job_id,
-        }
+        attributes = _WORKER_ATTRS_TEMPLATE.copy()
+        attributes['job.type'] = job_type
+        attributes['job.id'] = job_id
         if organization_id:
             attributes['organization.id'] = organization_id
         
@@ -242,10 +284,9 @@ class TelemetryService:
         organization_id: Optional[str] = None
     ) -> Optional[trace.Span]:
         """Create a span for document processing."""
-        attributes = {
-            'document.operation': operation,
-            'document.id': document_id,
-        }
+        attributes = _DOCUMENT_ATTRS_TEMPLATE.copy()
+        attributes['document.operation'] = operation
+        attributes['document.id'] = document_id
         if organization_id:
             attributes['organization.id'] = organization_id
         
@@ -262,9 +303,8 @@ class TelemetryService:
         organization_id: Optional[str] = None
     ) -> Optional[trace.Span]:
         """Create a span for chat/QA operations."""
-        attributes = {
-            'qa.operation': operation,
-        }
+        attributes = _QA_ATTRS_TEMPLATE.copy()
+        attributes['qa.operation'] = operation
         if thread_id:
             attributes['thread.id'] = thread_id
         if organization_id:
@@ -278,21 +318,25 @@ class TelemetryService:
     
     def get_current_trace_id(self) -> Optional[str]:
         """Get trace ID from current span."""
+        if not self._enabled:
+            return None
         span = self.get_current_span()
-        if span:
+        if span is not None and span.is_recording():
             return span.get_span_context().trace_id
         return None
     
     def get_current_span_id(self) -> Optional[str]:
         """Get span ID from current span."""
+        if not self._enabled:
+            return None
         span = self.get_current_span()
-        if span:
+        if span is not None and span.is_recording():
             return span.get_span_context().span_id
         return None
     
     def is_enabled(self) -> bool:
         """Check if tracing is enabled."""
-        return self.tracer is not None
+        return self._enabled
     
     def shutdown(self):
         """Shutdown OpenTelemetry."""
@@ -303,5 +347,7 @@ class TelemetryService:
         except Exception as e:
             logger.error(f"Failed to shutdown OpenTelemetry: {e}")
 
-# Global telemetry service instance
-telemetry_service = TelemetryService()
+@lru_cache(maxsize=1)
+def get_telemetry_service() -> TelemetryService:
+    """Get the process-wide telemetry service, creating it on first use."""
+    return TelemetryService()
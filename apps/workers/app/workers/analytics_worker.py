@@ -1,18 +1,217 @@
 # Created automatically by Cursor AI (2025-01-27)
 
 import asyncio
+import logging
+import random
+import sys
 import time
-from typing import Dict, Any, List
+from collections import deque
+from typing import Deque, Dict, Any, List, Optional, Set, Tuple, get_args
 
 import nats
+import orjson
 from nats.aio.client import Client as NATS
 import redis.asyncio as redis
 
-from app.core.config import settings
+from app.core.config import get_settings
 from app.core.logging import WorkerLogger
-from app.models.jobs import AnalyticsJob
+from app.models.jobs import AnalyticsEventType, AnalyticsJob
+from app.services.database import DatabaseService
+from app.services.queue import ensure_jobs_stream
 
 
+# Tasks processing analytics jobs concurrently, and how many fetched
+# messages may wait for them
+ANALYTICS_CONSUMERS = 8
+ANALYTICS_QUEUE_SIZE = 1024
+
+# Durable JetStream consumer shared by all analytics workers
+ANALYTICS_DURABLE = "analytics-worker"
+
+
+# Projects aggregated at once by the nightly stats job
+AGGREGATION_CONCURRENCY = 64
+
+# Nightly jobs start up to NIGHTLY_JITTER seconds after UTC midnight; the
+# replica that claims the night's lock runs them, the others skip that night
+NIGHTLY_JITTER = 300
+NIGHTLY_LOCK_TTL = 6 * 3600
+
+# Redis connections shared by the consumer and aggregation tasks; callers
+# wait for a free connection instead of failing when all are in use
+REDIS_MAX_CONNECTIONS = 32
+
+# Daily metrics live in one hash per project, metrics:{org_id}:{project_id},
+# plus this global hash, with queries, tokens, rt_count and rt_total fields
+GLOBAL_METRICS_KEY = "metrics:global"
+
+# Daily active users are HyperLogLogs, users:{org_id}:{project_id} plus this
+# global one, cleared with the metrics hashes by the nightly aggregation
+GLOBAL_USERS_KEY = "users:global"
+
+# Real-time metric deltas are published here and written to Redis by a
+# MetricsFlusher once per METRICS_FLUSH_WINDOW seconds
+METRICS_DELTA_SUBJECT = "metrics.delta"
+METRICS_FLUSHERS = "metrics-flushers"
+METRICS_FLUSH_WINDOW = 0.1
+
+# Real-time metric keys expire a day after their last update
+METRICS_TTL = 86400
+
+# Recomputes satisfaction_score (0-100) from the thumbs up/down counters in
+# one atomic round trip. KEYS: thumbs_up, thumbs_down, score; ARGV: TTL.
+# The score is returned as a string because Lua numbers reply as integers.
+SATISFACTION_SCORE_LUA = """
+local up = tonumber(redis.call('GET', KEYS[1]) or 0)
+local down = tonumber(redis.call('GET', KEYS[2]) or 0)
+local total = up + down
+local score = 0
+if total > 0 then
+    score = up / total * 100
+end
+redis.call('SET', KEYS[3], score, 'EX', ARGV[1])
+return tostring(score)
+"""
+
+# Job id prefix per event type, formatted once rather than for every job
+_JOB_ID_PREFIXES = {
+    event_type: f"analytics_{event_type}_" for event_type in get_args(AnalyticsEventType)
+}
+
+class MetricsFlusher:
+    """Accumulate metric deltas from NATS and write them to Redis in one pipeline per window"""
+    
+    def __init__(self, nats_client: NATS, redis_client: redis.Redis, logger: WorkerLogger):
+        self.nats_client = nats_client
+        self.redis_client = redis_client
+        self.logger = logger
+        self._subscription = None
+        self._task: asyncio.Task = None
+        
+        # Deltas received in the current window, by (org_id, project_id)
+        self._counters: Dict[Tuple[str, str], List[float]] = {}
+        self._documents: Dict[Tuple[str, str], Dict[str, int]] = {}
+        self._users: Dict[Tuple[str, str], Set[str]] = {}
+    
+    async def start(self) -> None:
+        """Subscribe to metric deltas and start the flush loop"""
+        # Queue group, so each delta is counted by exactly one replica
+        self._subscription = await self.nats_client.subscribe(
+            METRICS_DELTA_SUBJECT, queue=METRICS_FLUSHERS, cb=self._on_delta
+        )
+        self._task = asyncio.create_task(self._run())
+    
+    async def stop(self) -> None:
+        """Stop receiving deltas and write out the current window"""
+        if self._subscription:
+            await self._subscription.unsubscribe()
+        if self._task:
+            self._task.cancel()
+        try:
+            await self.flush()
+        except Exception as e:
+            self.logger.logger.error(f"Failed to flush real-time metrics: {e}")
+    
+    async def _on_delta(self, msg) -> None:
+        """Fold one published delta into the current window"""
+        try:
+            delta = orjson.loads(msg.data)
+        except orjson.JSONDecodeError as e:
+            self.logger.logger.warning(f"Invalid metrics delta: {e}")
+            return
+        
+        # Jobs without an org or project cannot be keyed; skip them so one bad
+        # delta cannot fail the whole window's pipeline
+        org_id, project_id = delta.get("org"), delta.get("proj")
+        if not org_id or not project_id:
+            return
+        key = (org_id, project_id)
+        
+        # queries, tokens, rt_count, rt_total
+        counters = self._counters.get(key)
+        if counters is None:
+            counters = self._counters[key] = [0, 0, 0, 0.0]
+        counters[0] += delta.get("q") or 0
+        counters[1] += delta.get("tok") or 0
+        counters[2] += 1
+        counters[3] += delta.get("rt") or 0
+        
+        document_ids = delta.get("docs")
+        if document_ids:
+            documents = self._documents.setdefault(key, {})
+            for document_id in document_ids:
+                documents[document_id] = documents.get(document_id, 0) + 1
+        
+        if delta.get("user"):
+            self._users.setdefault(key, set()).add(delta["user"])
+    
+    async def _run(self) -> None:
+        """Flush the accumulated deltas every METRICS_FLUSH_WINDOW seconds"""
+        while True:
+            await asyncio.sleep(METRICS_FLUSH_WINDOW)
+            try:
+                await self.flush()
+            except Exception as e:
+                self.logger.logger.error(f"Failed to flush real-time metrics: {e}")
+    
+    async def flush(self) -> None:
+        """Write the current window to Redis in one round trip"""
+        if not self._counters:
+            return
+        
+        # Swap the window out before awaiting so new deltas start a fresh one;
+        # a failed write drops the window, real-time metrics are best effort
+        counters, self._counters = self._counters, {}
+        documents, self._documents = self._documents, {}
+        users, self._users = self._users, {}
+        
+        pipe = self.redis_client.pipeline(transaction=False)
+        global_counters = [0, 0, 0, 0.0]
+        
+        for (org_id, project_id), (queries, tokens, rt_count, rt_total) in counters.items():
+            project_key = f"metrics:{org_id}:{project_id}"
+            self._increment_metrics(pipe, project_key, queries, tokens, rt_count, rt_total)
+            pipe.expire(project_key, METRICS_TTL)
+            
+            global_counters[0] += queries
+            global_counters[1] += tokens
+            global_counters[2] += rt_count
+            global_counters[3] += rt_total
+            
+            # Update document and project usage rankings
+            top_documents_key = f"topdocs:{org_id}:{project_id}"
+            for document_id, count in documents.get((org_id, project_id), {}).items():
+                pipe.zincrby(top_documents_key, count, document_id)
+                pipe.zincrby("topdocs:global", count, document_id)
+            pipe.expire(top_documents_key, METRICS_TTL)
+            pipe.zincrby(f"activity:{org_id}", queries, project_id)
+            pipe.zincrby("activity:global", queries, project_id)
+            pipe.expire(f"activity:{org_id}", METRICS_TTL)
+            
+            # Count the window's users towards daily active users
+            project_users = users.get((org_id, project_id))
+            if project_users:
+                users_key = f"users:{org_id}:{project_id}"
+                pipe.pfadd(users_key, *project_users)
+                pipe.pfadd(GLOBAL_USERS_KEY, *project_users)
+                pipe.expire(users_key, METRICS_TTL)
+        
+        self._increment_metrics(pipe, GLOBAL_METRICS_KEY, *global_counters)
+        
+        # The nightly job resets the rankings; the TTL only covers idle replicas
+        pipe.expire("topdocs:global", METRICS_TTL)
+        pipe.expire("activity:global", METRICS_TTL)
+        
+        await pipe.execute()
+    
+    @staticmethod
+    def _increment_metrics(pipe, key: str, queries: int, tokens: int, rt_count: int, rt_total: float) -> None:
+        """Queue counter increments; the average response time is rt_total / rt_count on read"""
+        pipe.hincrby(key, "queries", queries)
+        pipe.hincrby(key, "tokens", tokens)
+        pipe.hincrby(key, "rt_count", rt_count)
+        pipe.hincrbyfloat(key, "rt_total", rt_total)
+
 class AnalyticsWorker:
     """Worker for processing analytics"""
     
@@ -26,6 +225,35 @@ class AnalyticsWorker:
         # External services
         self.nats_client: NATS = None
         self.redis_client: redis.Redis = None
+        self.redis_pool: redis.BlockingConnectionPool = None
+        self._satisfaction_script = None
+        self._subscription = None
+        
+        # Services
+        self.db = DatabaseService()
+        
+        # Fetched messages waiting for a consumer task
+        self._jobs: asyncio.Queue = asyncio.Queue(maxsize=ANALYTICS_QUEUE_SIZE)
+        
+        # Analytics rows of the fetched batch, written when the batch completes;
+        # a job adds at most one row, so a buffer never outgrows a batch
+        batch_size = get_settings().ANALYTICS_BATCH_SIZE
+        self._query_buf: Deque[Tuple[Any, ...]] = deque(maxlen=batch_size)
+        self._doc_buf: Deque[Tuple[Any, ...]] = deque(maxlen=batch_size)
+        self._action_buf: Deque[Tuple[Any, ...]] = deque(maxlen=batch_size)
+        # Encoded metric deltas of the batch, published once its rows are written
+        self._delta_buf: Deque[bytes] = deque(maxlen=batch_size)
+        self._flush_lock = asyncio.Lock()
+        self._nightly_task: asyncio.Task = None
+        self._metrics_flusher: MetricsFlusher = None
+        
+        # Analytics event handlers by event type
+        self._handlers = {
+            "query": self._log_query_analytics,
+            "document_upload": self._log_document_analytics,
+            "user_action": self._log_user_action_analytics,
+            "feedback": self.collect_feedback_signals,
+        }
     
     async def start(self) -> None:
         """Start the analytics worker"""
@@ -35,6 +263,13 @@ class AnalyticsWorker:
         # Initialize connections
         await self._init_connections()
         
+        # Start writing published metric deltas to Redis
+        self._metrics_flusher = MetricsFlusher(self.nats_client, self.redis_client, self.logger)
+        await self._metrics_flusher.start()
+        
+        # Schedule the nightly aggregations
+        self._nightly_task = asyncio.create_task(self._nightly_loop())
+        
         # Start processing loop
         while self.is_running:
             try:
@@ -49,71 +284,150 @@ class AnalyticsWorker:
         self.logger.log_worker_stop()
         self.is_running = False
         
+        if self._nightly_task:
+            self._nightly_task.cancel()
+        await self.db.close()
+        
+        if self._metrics_flusher:
+            await self._metrics_flusher.stop()
+        
         if self.nats_client:
             await self.nats_client.close()
         if self.redis_client:
             await self.redis_client.close()
+        if self.redis_pool:
+            await self.redis_pool.disconnect()
     
     async def _init_connections(self) -> None:
         """Initialize external service connections"""
         # Connect to NATS
         self.nats_client = nats.NATS()
-        await self.nats_client.connect(settings.NATS_URL)
+        await self.nats_client.connect(get_settings().NATS_URL)
         
         # Connect to Redis
-        self.redis_client = redis.from_url(settings.REDIS_URL)
+        self.redis_pool = redis.BlockingConnectionPool.from_url(
+            get_settings().REDIS_URL,
+            max_connections=REDIS_MAX_CONNECTIONS,
+        )
+        self.redis_client = redis.Redis(connection_pool=self.redis_pool)
+        
+        # Runs by EVALSHA, reloading the script if Redis has lost it
+        self._satisfaction_script = self.redis_client.register_script(SATISFACTION_SCORE_LUA)
+        
+        # Subscribe once; _process_jobs only fetches from this subscription
+        js = self.nats_client.jetstream()
+        await ensure_jobs_stream(js)
+        self._subscription = await js.pull_subscribe("jobs.analytics", ANALYTICS_DURABLE)
     
     async def _process_jobs(self) -> None:
         """Process analytics jobs from NATS"""
+        consumers = [asyncio.create_task(self._consume_jobs()) for _ in range(ANALYTICS_CONSUMERS)]
         try:
-            # Subscribe to analytics jobs
-            subscription = await self.nats_client.subscribe("jobs.analytics")
+            # Pull jobs in batches; one fetch replaces a round trip per message
+            batch_size = get_settings().ANALYTICS_BATCH_SIZE
             
-            async for msg in subscription.messages:
+            while self.is_running:
                 try:
-                    job_data = msg.data.decode()
-                    job = AnalyticsJob.parse_raw(job_data)
-                    
-                    await self._process_analytics_job(job)
-                    
-                    # Acknowledge message
-                    await msg.ack()
-                    
-                except Exception as e:
-                    self.logger.log_job_error(job.event_type, e)
-                    self.failed_jobs += 1
-                    await msg.nak()
+                    msgs = await self._subscription.fetch(batch=batch_size, timeout=1.0)
+                except nats.errors.TimeoutError:
+                    continue
+                
+                await self._process_batch(msgs)
         
         except Exception as e:
             self.logger.logger.error(f"Error processing jobs: {e}")
+        
+        finally:
+            for consumer in consumers:
+                consumer.cancel()
+    
+    async def _process_batch(self, msgs: List[Any]) -> None:
+        """Process a fetched batch on the consumer tasks, then ack it at once"""
+        succeeded = [True] * len(msgs)
+        malformed = set()
+        
+        for index, msg in enumerate(msgs):
+            try:
+                job = AnalyticsJob.model_validate_json(msg.data)
+            except Exception as e:
+                self.logger.log_job_error("unknown", e)
+                self.failed_jobs += 1
+                malformed.add(index)
+                continue
+            
+            await self._jobs.put((index, job, succeeded))
+        
+        await self._jobs.join()
+        
+        # Only ack once the batch's rows are in the database; on failure the
+        # rows and metric deltas are dropped and the nak'd batch is redelivered
+        # to rebuild them, so neither is counted twice
+        deltas = list(self._delta_buf)
+        self._delta_buf.clear()
+        try:
+            await self._flush_buffers()
+        except Exception as e:
+            self.logger.logger.error(f"Failed to flush analytics buffers: {e}")
+            succeeded = [False] * len(msgs)
+        else:
+            await self._publish_deltas(deltas)
+        
+        # Acknowledge the batch with pipelined acks instead of one round trip each;
+        # malformed payloads are terminated since redelivery cannot fix them
+        await asyncio.gather(
+            *(
+                msg.term() if index in malformed else msg.ack() if ok else msg.nak()
+                for index, (msg, ok) in enumerate(zip(msgs, succeeded))
+            ),
+            return_exceptions=True,
+        )
+    
+    async def _consume_jobs(self) -> None:
+        """Process queued analytics jobs until cancelled"""
+        while True:
+            index, job, succeeded = await self._jobs.get()
+            try:
+                await self._process_analytics_job(job)
+            
+            except Exception as e:
+                self.logger.log_job_error(job.event_type, e)
+                self.failed_jobs += 1
+                succeeded[index] = False
+            
+            finally:
+                self._jobs.task_done()
     
     async def _process_analytics_job(self, job: AnalyticsJob) -> None:
         """Process a single analytics job"""
-        start_time = time.time()
-        job_id = f"analytics_{job.event_type}_{int(start_time)}"
+        start = time.monotonic()
         
-        self.logger.log_job_start(job_id, "analytics", event_type=job.event_type, user_id=job.user_id)
+        # Per-job start/success records are only built when INFO is enabled
+        log_progress = self.logger.logger.isEnabledFor(logging.INFO)
+        if log_progress:
+            self.logger.log_job_start(self._job_id(job), "analytics",
+                                      event_type=job.event_type, user_id=job.user_id)
         
         try:
-            if job.event_type == "query":
-                await self._log_query_analytics(job)
-            elif job.event_type == "document_upload":
-                await self._log_document_analytics(job)
-            elif job.event_type == "user_action":
-                await self._log_user_action_analytics(job)
-            elif job.event_type == "feedback":
-                await self.collect_feedback_signals(job)
+            handler = self._handlers.get(job.event_type)
+            if handler:
+                await handler(job)
             else:
                 self.logger.logger.warning(f"Unknown analytics event type: {job.event_type}")
             
-            duration = time.time() - start_time
-            self.logger.log_job_success(job_id, duration, event_type=job.event_type)
+            if log_progress:
+                duration = time.monotonic() - start
+                self.logger.log_job_success(self._job_id(job), duration, event_type=job.event_type)
             self.processed_jobs += 1
             
         except Exception as e:
-            self.logger.log_job_error(job_id, e, event_type=job.event_type)
+            self.logger.log_job_error(self._job_id(job), e, event_type=job.event_type)
             raise
     
+    @staticmethod
+    def _job_id(job: AnalyticsJob) -> str:
+        """Log identifier of an analytics job"""
+        return f"{_JOB_ID_PREFIXES[job.event_type]}{int(job.timestamp)}"
+    
     async def _log_query_analytics(self, job: AnalyticsJob) -> None:
         """Log query analytics data"""
         try:
@@ -130,10 +444,11 @@ class AnalyticsWorker:
                 tokens_used=query_data.get("tokens_used", 0),
                 tokens_input=query_data.get("tokens_input", 0),
                 tokens_output=query_data.get("tokens_output", 0),
-                model_used=query_data.get("model_used", "unknown"),
+                # Low-cardinality labels are interned so buffered rows share one string each
+                model_used=sys.intern(query_data.get("model_used", "unknown")),
                 success=query_data.get("success", True),
                 error_message=query_data.get("error_message", None),
-                source=query_data.get("source", "web"),  # web, slack, api
+                source=sys.intern(query_data.get("source", "web")),  # web, slack, api
                 thread_id=query_data.get("thread_id", None)
             )
             
@@ -190,28 +505,24 @@ class AnalyticsWorker:
                                 query: str, response_time: float, tokens_used: int,
                                 tokens_input: int, tokens_output: int, model_used: str,
                                 success: bool, error_message: str, source: str, thread_id: str) -> None:
-        """Store query statistics in database"""
+        """Buffer query statistics for the next database flush"""
         try:
-            # This would store query stats in the database
-            # Implementation depends on your database service
-            query_record = {
-                "user_id": user_id,
-                "org_id": org_id,
-                "project_id": project_id,
-                "query": query[:500],  # Truncate long queries
-                "response_time": response_time,
-                "tokens_used": tokens_used,
-                "tokens_input": tokens_input,
-                "tokens_output": tokens_output,
-                "model_used": model_used,
-                "success": success,
-                "error_message": error_message,
-                "source": source,
-                "thread_id": thread_id,
-                "timestamp": time.time()
-            }
-            # Store in database
-            pass
+            self._query_buf.append((
+                user_id,
+                org_id,
+                project_id,
+                query[:500],  # Truncate long queries
+                response_time,
+                tokens_used,
+                tokens_input,
+                tokens_output,
+                model_used,
+                success,
+                error_message,
+                source,
+                thread_id,
+                time.time(),
+            ))
         except Exception as e:
             self.logger.logger.error(f"Failed to store query stats: {e}")
     
@@ -219,186 +530,215 @@ class AnalyticsWorker:
                                    document_id: str, file_size: int, file_type: str,
                                    page_count: int, chunk_count: int, processing_time: float,
                                    success: bool, error_message: str) -> None:
-        """Store document statistics in database"""
+        """Buffer document statistics for the next database flush"""
         try:
-            # This would store document stats in the database
-            # Implementation depends on your database service
-            document_record = {
-                "user_id": user_id,
-                "org_id": org_id,
-                "project_id": project_id,
-                "document_id": document_id,
-                "file_size": file_size,
-                "file_type": file_type,
-                "page_count": page_count,
-                "chunk_count": chunk_count,
-                "processing_time": processing_time,
-                "success": success,
-                "error_message": error_message,
-                "timestamp": time.time()
-            }
-            # Store in database
-            pass
+            self._doc_buf.append((
+                user_id,
+                org_id,
+                project_id,
+                document_id,
+                file_size,
+                file_type,
+                page_count,
+                chunk_count,
+                processing_time,
+                success,
+                error_message,
+                time.time(),
+            ))
         except Exception as e:
             self.logger.logger.error(f"Failed to store document stats: {e}")
     
     async def _store_user_action_stats(self, user_id: str, org_id: str, project_id: str,
                                       action: str, action_data: dict, timestamp: float) -> None:
-        """Store user action statistics in database"""
+        """Buffer user action statistics for the next database flush"""
         try:
-            # This would store user action stats in the database
-            # Implementation depends on your database service
-            action_record = {
-                "user_id": user_id,
-                "org_id": org_id,
-                "project_id": project_id,
-                "action": action,
-                "action_data": action_data,
-                "timestamp": timestamp
-            }
-            # Store in database
-            pass
+            self._action_buf.append((
+                user_id,
+                org_id,
+                project_id,
+                action,
+                orjson.dumps(action_data).decode(),
+                timestamp,
+            ))
         except Exception as e:
             self.logger.logger.error(f"Failed to store user action stats: {e}")
     
+    async def _flush_buffers(self) -> None:
+        """Write every buffered analytics row in one transaction
+        
+        The buffers are emptied whether or not the write succeeds; the caller
+        naks the batch on failure, so redelivery rebuilds the rows once.
+        """
+        async with self._flush_lock:
+            buffers = (self._query_buf, self._doc_buf, self._action_buf)
+            if not any(buffers):
+                return
+            
+            rows = [list(buffer) for buffer in buffers]
+            for buffer in buffers:
+                buffer.clear()
+            
+            await self.db.create_analytics_events(*rows)
+    
     async def _update_realtime_metrics(self, job: AnalyticsJob) -> None:
-        """Update real-time metrics in Redis"""
+        """Buffer the query's metric deltas until its batch is written"""
+        # Metrics are keyed by org and project
+        if not job.org_id or not job.project_id:
+            return
+        
         try:
-            # Update query count
-            await self.redis_client.incr(f"metrics:queries:{job.org_id}:{job.project_id}")
-            await self.redis_client.incr(f"metrics:queries:global")
-            
-            # Update token usage
-            tokens_used = job.payload.get("tokens_used", 0)
-            await self.redis_client.incrby(f"metrics:tokens:{job.org_id}:{job.project_id}", tokens_used)
-            await self.redis_client.incrby(f"metrics:tokens:global", tokens_used)
-            
-            # Update response time (rolling average)
-            response_time = job.payload.get("response_time", 0)
-            await self._update_rolling_average(f"metrics:response_time:{job.org_id}:{job.project_id}", response_time)
-            await self._update_rolling_average(f"metrics:response_time:global", response_time)
+            delta = {
+                "org": job.org_id,
+                "proj": job.project_id,
+                "q": 1,
+                "tok": job.payload.get("tokens_used", 0),
+                "rt": job.payload.get("response_time", 0),
+                "docs": job.payload.get("document_ids") or [],
+                "user": job.user_id,
+            }
             
-            # Set expiry for metrics (24 hours)
-            await self.redis_client.expire(f"metrics:queries:{job.org_id}:{job.project_id}", 86400)
-            await self.redis_client.expire(f"metrics:tokens:{job.org_id}:{job.project_id}", 86400)
-            await self.redis_client.expire(f"metrics:response_time:{job.org_id}:{job.project_id}", 86400)
+            self._delta_buf.append(orjson.dumps(delta))
             
         except Exception as e:
             self.logger.logger.error(f"Failed to update real-time metrics: {e}")
     
-    async def _update_rolling_average(self, key: str, new_value: float) -> None:
-        """Update rolling average in Redis"""
+    async def _publish_deltas(self, deltas: List[bytes]) -> None:
+        """Publish a written batch's metric deltas for the metrics flusher"""
         try:
-            # Get current count and sum
-            count = await self.redis_client.get(f"{key}:count")
-            total = await self.redis_client.get(f"{key}:total")
-            
-            if count is None:
-                count = 0
-                total = 0
-            else:
-                count = int(count)
-                total = float(total)
-            
-            # Update values
-            count += 1
-            total += new_value
+            # Fire and forget: the client buffers the messages, no broker ack is awaited
+            for delta in deltas:
+                await self.nats_client.publish(METRICS_DELTA_SUBJECT, delta)
+        except Exception as e:
+            self.logger.logger.error(f"Failed to publish real-time metrics: {e}")
+    
+    @staticmethod
+    def _parse_daily_metrics(metrics: Dict[bytes, bytes]) -> Tuple[int, int, float]:
+        """Get query count, tokens used and average response time from a metrics hash"""
+        queries_count = int(metrics.get(b"queries", 0))
+        tokens_used = int(metrics.get(b"tokens", 0))
+        response_time_count = int(metrics.get(b"rt_count", 0))
+        response_time_avg = (
+            float(metrics[b"rt_total"]) / response_time_count if response_time_count else 0.0
+        )
+        return queries_count, tokens_used, response_time_avg
+    
+    async def _nightly_loop(self) -> None:
+        """Run the nightly aggregations after every UTC midnight while the worker runs"""
+        while self.is_running:
+            now = time.time()
+            midnight = (now // 86400 + 1) * 86400
+            await asyncio.sleep(midnight - now + random.uniform(0, NIGHTLY_JITTER))
             
-            # Store updated values
-            await self.redis_client.set(f"{key}:count", count)
-            await self.redis_client.set(f"{key}:total", total)
-            await self.redis_client.set(f"{key}:avg", total / count)
+            try:
+                claimed = await self.redis_client.set(
+                    f"analytics:nightly:{int(midnight)}", self.name, nx=True, ex=NIGHTLY_LOCK_TTL
+                )
+                if not claimed:
+                    continue
+                
+                # The run closes out the UTC day that ended at midnight
+                date = time.strftime("%Y-%m-%d", time.gmtime(midnight - 86400))
+                
+                # Rankings read the users HyperLogLogs before the aggregation clears them
+                await self.track_top_documents(date)
+                await self.track_most_active_projects(date)
+                await self.aggregate_nightly_stats(date)
             
-        except Exception as e:
-            self.logger.logger.error(f"Failed to update rolling average: {e}")
+            except Exception as e:
+                self.logger.logger.error(f"Failed to run nightly aggregations: {e}")
+    
+    @staticmethod
+    def _previous_utc_date() -> str:
+        """Date of the last completed UTC day"""
+        return time.strftime("%Y-%m-%d", time.gmtime(time.time() - 86400))
     
-    async def aggregate_nightly_stats(self) -> None:
+    async def aggregate_nightly_stats(self, date: Optional[str] = None) -> None:
         """Aggregate nightly usage statistics"""
         try:
             self.logger.logger.info("Starting nightly usage stats aggregation")
             
+            # Rows are labelled with the UTC day being closed out
+            date = date or self._previous_utc_date()
+            
             # Get all orgs and projects
             orgs_projects = await self._get_all_orgs_projects()
             
-            for org_id, projects in orgs_projects.items():
-                for project_id in projects:
-                    await self._aggregate_project_stats(org_id, project_id)
+            # Aggregate projects concurrently without flooding Redis and the database
+            semaphore = asyncio.Semaphore(AGGREGATION_CONCURRENCY)
+            
+            async def _aggregate(org_id: str, project_id: str) -> None:
+                async with semaphore:
+                    await self._aggregate_project_stats(org_id, project_id, date)
+            
+            await asyncio.gather(
+                *(_aggregate(org_id, project_id) for org_id, projects in orgs_projects.items() for project_id in projects),
+                return_exceptions=True,
+            )
             
             # Aggregate global stats
-            await self._aggregate_global_stats()
+            await self._aggregate_global_stats(date)
             
             self.logger.logger.info("Completed nightly usage stats aggregation")
             
         except Exception as e:
             self.logger.logger.error(f"Failed to aggregate nightly stats: {e}")
     
-    async def _aggregate_project_stats(self, org_id: str, project_id: str) -> None:
+    async def _aggregate_project_stats(self, org_id: str, project_id: str, date: str) -> None:
         """Aggregate statistics for a specific project"""
         try:
-            # Get daily metrics from Redis
-            queries_count = await self.redis_client.get(f"metrics:queries:{org_id}:{project_id}")
-            tokens_used = await self.redis_client.get(f"metrics:tokens:{org_id}:{project_id}")
-            response_time_avg = await self.redis_client.get(f"metrics:response_time:{org_id}:{project_id}:avg")
+            metrics_key = f"metrics:{org_id}:{project_id}"
+            users_key = f"users:{org_id}:{project_id}"
             
-            # Convert to appropriate types
-            queries_count = int(queries_count) if queries_count else 0
-            tokens_used = int(tokens_used) if tokens_used else 0
-            response_time_avg = float(response_time_avg) if response_time_avg else 0.0
+            # Read and clear the daily metrics in one MULTI, so increments
+            # flushed meanwhile land in the next day instead of being lost
+            async with self.redis_client.pipeline(transaction=True) as pipe:
+                pipe.hgetall(metrics_key)
+                pipe.pfcount(users_key)
+                pipe.unlink(metrics_key, users_key)
+                metrics, active_users, _ = await pipe.execute()
+            
+            queries_count, tokens_used, response_time_avg = self._parse_daily_metrics(metrics)
             
             # Store aggregated stats in database
             await self._store_usage_stats(
                 org_id=org_id,
                 project_id=project_id,
-                date=time.strftime("%Y-%m-%d"),
+                date=date,
                 queries_count=queries_count,
                 tokens_used=tokens_used,
                 avg_response_time=response_time_avg,
-                active_users=await self._get_active_users_count(org_id, project_id),
+                active_users=active_users,
                 documents_processed=await self._get_documents_processed_count(org_id, project_id)
             )
             
-            # Clear daily metrics
-            await self.redis_client.delete(f"metrics:queries:{org_id}:{project_id}")
-            await self.redis_client.delete(f"metrics:tokens:{org_id}:{project_id}")
-            await self.redis_client.delete(f"metrics:response_time:{org_id}:{project_id}:count")
-            await self.redis_client.delete(f"metrics:response_time:{org_id}:{project_id}:total")
-            await self.redis_client.delete(f"metrics:response_time:{org_id}:{project_id}:avg")
-            
         except Exception as e:
             self.logger.logger.error(f"Failed to aggregate project stats for {org_id}:{project_id}: {e}")
     
-    async def _aggregate_global_stats(self) -> None:
+    async def _aggregate_global_stats(self, date: str) -> None:
         """Aggregate global statistics"""
         try:
-            # Get global metrics from Redis
-            queries_count = await self.redis_client.get("metrics:queries:global")
-            tokens_used = await self.redis_client.get("metrics:tokens:global")
-            response_time_avg = await self.redis_client.get("metrics:response_time:global:avg")
+            # Read and clear the global daily metrics in one MULTI
+            async with self.redis_client.pipeline(transaction=True) as pipe:
+                pipe.hgetall(GLOBAL_METRICS_KEY)
+                pipe.pfcount(GLOBAL_USERS_KEY)
+                pipe.unlink(GLOBAL_METRICS_KEY, GLOBAL_USERS_KEY)
+                metrics, active_users, _ = await pipe.execute()
             
-            # Convert to appropriate types
-            queries_count = int(queries_count) if queries_count else 0
-            tokens_used = int(tokens_used) if tokens_used else 0
-            response_time_avg = float(response_time_avg) if response_time_avg else 0.0
+            queries_count, tokens_used, response_time_avg = self._parse_daily_metrics(metrics)
             
             # Store global aggregated stats
             await self._store_usage_stats(
                 org_id="global",
                 project_id="global",
-                date=time.strftime("%Y-%m-%d"),
+                date=date,
                 queries_count=queries_count,
                 tokens_used=tokens_used,
                 avg_response_time=response_time_avg,
-                active_users=await self._get_global_active_users_count(),
+                active_users=active_users,
                 documents_processed=await self._get_global_documents_processed_count()
             )
             
-            # Clear global daily metrics
-            await self.redis_client.delete("metrics:queries:global")
-            await self.redis_client.delete("metrics:tokens:global")
-            await self.redis_client.delete("metrics:response_time:global:count")
-            await self.redis_client.delete("metrics:response_time:global:total")
-            await self.redis_client.delete("metrics:response_time:global:avg")
-            
         except Exception as e:
             self.logger.logger.error(f"Failed to aggregate global stats: {e}")
     
@@ -441,9 +781,8 @@ class AnalyticsWorker:
     async def _get_active_users_count(self, org_id: str, project_id: str) -> int:
         """Get count of active users for a project"""
         try:
-            # This would query the database for active users
-            # Implementation depends on your database service
-            return 10  # Placeholder
+            # HyperLogLog estimate, within about 1% of the exact count
+            return await self.redis_client.pfcount(f"users:{org_id}:{project_id}")
         except Exception as e:
             self.logger.logger.error(f"Failed to get active users count: {e}")
             return 0
@@ -458,16 +797,6 @@ class AnalyticsWorker:
             self.logger.logger.error(f"Failed to get documents processed count: {e}")
             return 0
     
-    async def _get_global_active_users_count(self) -> int:
-        """Get global count of active users"""
-        try:
-            # This would query the database for global active users
-            # Implementation depends on your database service
-            return 100  # Placeholder
-        except Exception as e:
-            self.logger.logger.error(f"Failed to get global active users count: {e}")
-            return 0
-    
     async def _get_global_documents_processed_count(self) -> int:
         """Get global count of documents processed"""
         try:
@@ -478,209 +807,154 @@ class AnalyticsWorker:
             self.logger.logger.error(f"Failed to get global documents processed count: {e}")
             return 0
     
-    async def track_top_documents(self) -> None:
+    async def track_top_documents(self, date: Optional[str] = None) -> None:
         """Track top documents by usage"""
         try:
             self.logger.logger.info("Starting top documents tracking")
             
+            # Rows are labelled with the UTC day being closed out
+            date = date or self._previous_utc_date()
+            
             # Get all orgs and projects
             orgs_projects = await self._get_all_orgs_projects()
             
             for org_id, projects in orgs_projects.items():
                 for project_id in projects:
-                    await self._track_project_top_documents(org_id, project_id)
+                    await self._track_project_top_documents(org_id, project_id, date)
             
             # Track global top documents
-            await self._track_global_top_documents()
+            await self._track_global_top_documents(date)
             
             self.logger.logger.info("Completed top documents tracking")
             
         except Exception as e:
             self.logger.logger.error(f"Failed to track top documents: {e}")
     
-    async def track_most_active_projects(self) -> None:
+    async def track_most_active_projects(self, date: Optional[str] = None) -> None:
         """Track most active projects"""
         try:
             self.logger.logger.info("Starting most active projects tracking")
             
+            # Rows are labelled with the UTC day being closed out
+            date = date or self._previous_utc_date()
+            
             # Get all orgs and projects
             orgs_projects = await self._get_all_orgs_projects()
             
             for org_id, projects in orgs_projects.items():
-                await self._track_org_most_active_projects(org_id, projects)
+                await self._track_org_most_active_projects(org_id, projects, date)
             
             # Track global most active projects
-            await self._track_global_most_active_projects()
+            await self._track_global_most_active_projects(date)
             
             self.logger.logger.info("Completed most active projects tracking")
             
         except Exception as e:
             self.logger.logger.error(f"Failed to track most active projects: {e}")
     
-    async def _track_project_top_documents(self, org_id: str, project_id: str) -> None:
+    async def _track_project_top_documents(self, org_id: str, project_id: str, date: str) -> None:
         """Track top documents for a specific project"""
         try:
-            # Get document usage from database
-            document_usage = await self._get_document_usage_stats(org_id, project_id)
-            
-            # Sort by usage count
-            sorted_documents = sorted(document_usage, key=lambda x: x["usage_count"], reverse=True)
+            # Top 10 by usage count
+            sorted_documents = await self._pop_ranking(
+                f"topdocs:{org_id}:{project_id}", 10, "document_id", "usage_count"
+            )
+            await self._add_document_names(sorted_documents)
             
             # Store top documents
             await self._store_top_documents(
                 org_id=org_id,
                 project_id=project_id,
-                top_documents=sorted_documents[:10],  # Top 10
+                top_documents=sorted_documents,
                 period="daily",
-                date=time.strftime("%Y-%m-%d")
+                date=date
             )
             
         except Exception as e:
             self.logger.logger.error(f"Failed to track project top documents for {org_id}:{project_id}: {e}")
     
-    async def _track_global_top_documents(self) -> None:
+    async def _track_global_top_documents(self, date: str) -> None:
         """Track global top documents"""
         try:
-            # Get global document usage from database
-            document_usage = await self._get_global_document_usage_stats()
-            
-            # Sort by usage count
-            sorted_documents = sorted(document_usage, key=lambda x: x["usage_count"], reverse=True)
+            # Top 20 by usage count
+            sorted_documents = await self._pop_ranking("topdocs:global", 20, "document_id", "usage_count")
+            await self._add_document_names(sorted_documents)
             
             # Store global top documents
             await self._store_top_documents(
                 org_id="global",
                 project_id="global",
-                top_documents=sorted_documents[:20],  # Top 20
+                top_documents=sorted_documents,
                 period="daily",
-                date=time.strftime("%Y-%m-%d")
+                date=date
             )
             
         except Exception as e:
             self.logger.logger.error(f"Failed to track global top documents: {e}")
     
-    async def _track_org_most_active_projects(self, org_id: str, projects: list) -> None:
+    async def _track_org_most_active_projects(self, org_id: str, projects: list, date: str) -> None:
         """Track most active projects for an organization"""
         try:
-            # Get project activity from database
-            project_activity = await self._get_project_activity_stats(org_id, projects)
-            
-            # Sort by activity score
-            sorted_projects = sorted(project_activity, key=lambda x: x["activity_score"], reverse=True)
+            # Top 5 by activity score
+            sorted_projects = await self._pop_ranking(f"activity:{org_id}", 5, "project_id", "activity_score")
+            await self._add_project_details(sorted_projects)
             
             # Store most active projects
             await self._store_most_active_projects(
                 org_id=org_id,
-                most_active_projects=sorted_projects[:5],  # Top 5
+                most_active_projects=sorted_projects,
                 period="daily",
-                date=time.strftime("%Y-%m-%d")
+                date=date
             )
             
         except Exception as e:
             self.logger.logger.error(f"Failed to track org most active projects for {org_id}: {e}")
     
-    async def _track_global_most_active_projects(self) -> None:
+    async def _track_global_most_active_projects(self, date: str) -> None:
         """Track global most active projects"""
         try:
-            # Get global project activity from database
-            project_activity = await self._get_global_project_activity_stats()
-            
-            # Sort by activity score
-            sorted_projects = sorted(project_activity, key=lambda x: x["activity_score"], reverse=True)
+            # Top 10 by activity score
+            sorted_projects = await self._pop_ranking("activity:global", 10, "project_id", "activity_score")
+            await self._add_project_details(sorted_projects)
             
             # Store global most active projects
             await self._store_most_active_projects(
                 org_id="global",
-                most_active_projects=sorted_projects[:10],  # Top 10
+                most_active_projects=sorted_projects,
                 period="daily",
-                date=time.strftime("%Y-%m-%d")
+                date=date
             )
             
         except Exception as e:
             self.logger.logger.error(f"Failed to track global most active projects: {e}")
     
-    async def _get_document_usage_stats(self, org_id: str, project_id: str) -> list:
-        """Get document usage statistics for a project"""
-        try:
-            # This would query the database for document usage stats
-            # Implementation depends on your database service
-            return [
-                {
-                    "document_id": "doc1",
-                    "document_name": "Sample Document 1",
-                    "usage_count": 150,
-                    "last_used": time.time()
-                },
-                {
-                    "document_id": "doc2", 
-                    "document_name": "Sample Document 2",
-                    "usage_count": 120,
-                    "last_used": time.time()
-                }
-            ]
-        except Exception as e:
-            self.logger.logger.error(f"Failed to get document usage stats: {e}")
-            return []
+    async def _pop_ranking(self, key: str, count: int, member_field: str, score_field: str) -> List[Dict[str, Any]]:
+        """Read the top entries of a usage ranking, highest score first, and reset it for the next day"""
+        # Read and delete in one MULTI so increments cannot land in between
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.zrevrange(key, 0, count - 1, withscores=True)
+            pipe.unlink(key)
+            ranking, _ = await pipe.execute()
+        return [{member_field: member.decode(), score_field: score} for member, score in ranking]
     
-    async def _get_global_document_usage_stats(self) -> list:
-        """Get global document usage statistics"""
-        try:
-            # This would query the database for global document usage stats
-            # Implementation depends on your database service
-            return [
-                {
-                    "document_id": "doc1",
-                    "document_name": "Global Sample Document 1",
-                    "usage_count": 500,
-                    "last_used": time.time()
-                }
-            ]
-        except Exception as e:
-            self.logger.logger.error(f"Failed to get global document usage stats: {e}")
-            return []
+    async def _add_document_names(self, documents: List[Dict[str, Any]]) -> None:
+        """Fill in document_name on top document rows"""
+        names = await self.db.get_document_names([doc["document_id"] for doc in documents])
+        for doc in documents:
+            doc["document_name"] = names.get(doc["document_id"])
     
-    async def _get_project_activity_stats(self, org_id: str, projects: list) -> list:
-        """Get project activity statistics for an organization"""
-        try:
-            # This would query the database for project activity stats
-            # Implementation depends on your database service
-            return [
-                {
-                    "project_id": "project1",
-                    "project_name": "Sample Project 1",
-                    "activity_score": 85.5,
-                    "queries_count": 200,
-                    "active_users": 15
-                },
-                {
-                    "project_id": "project2",
-                    "project_name": "Sample Project 2", 
-                    "activity_score": 72.3,
-                    "queries_count": 150,
-                    "active_users": 12
-                }
-            ]
-        except Exception as e:
-            self.logger.logger.error(f"Failed to get project activity stats: {e}")
-            return []
-    
-    async def _get_global_project_activity_stats(self) -> list:
-        """Get global project activity statistics"""
-        try:
-            # This would query the database for global project activity stats
-            # Implementation depends on your database service
-            return [
-                {
-                    "project_id": "project1",
-                    "project_name": "Global Sample Project 1",
-                    "activity_score": 95.2,
-                    "queries_count": 500,
-                    "active_users": 50
-                }
-            ]
-        except Exception as e:
-            self.logger.logger.error(f"Failed to get global project activity stats: {e}")
-            return []
+    async def _add_project_details(self, projects: List[Dict[str, Any]]) -> None:
+        """Fill in project_name, queries_count and active_users on most active project rows"""
+        details = await self.db.get_projects([project["project_id"] for project in projects])
+        for project in projects:
+            detail = details.get(project["project_id"], {})
+            project["project_name"] = detail.get("name")
+            # Activity is scored by query count
+            project["queries_count"] = int(project["activity_score"])
+            org_id = detail.get("org_id")
+            project["active_users"] = (
+                await self._get_active_users_count(org_id, project["project_id"]) if org_id else 0
+            )
     
     async def _store_top_documents(self, org_id: str, project_id: str, top_documents: list, 
                                   period: str, date: str) -> None:
@@ -783,45 +1057,37 @@ class AnalyticsWorker:
         try:
             feedback_data = job.payload
             feedback_type = feedback_data.get("feedback_type")
+            project_key = f"feedback:{feedback_type}:{job.org_id}:{job.project_id}"
+            global_key = f"feedback:{feedback_type}:global"
             
-            # Update feedback counts
-            await self.redis_client.incr(f"feedback:{feedback_type}:{job.org_id}:{job.project_id}")
-            await self.redis_client.incr(f"feedback:{feedback_type}:global")
+            # Update feedback counts and set expiry (24 hours) in one round trip
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.incr(project_key)
+                pipe.incr(global_key)
+                pipe.expire(project_key, 86400)
+                pipe.expire(global_key, 86400)
+                await pipe.execute()
             
             # Update satisfaction score if thumbs up/down
             if feedback_type in ["thumbs_up", "thumbs_down"]:
                 await self._update_satisfaction_score(job)
             
-            # Set expiry for metrics (24 hours)
-            await self.redis_client.expire(f"feedback:{feedback_type}:{job.org_id}:{job.project_id}", 86400)
-            await self.redis_client.expire(f"feedback:{feedback_type}:global", 86400)
-            
         except Exception as e:
             self.logger.logger.error(f"Failed to update feedback metrics: {e}")
     
     async def _update_satisfaction_score(self, job: AnalyticsJob) -> None:
         """Update satisfaction score based on feedback"""
         try:
-            feedback_data = job.payload
-            feedback_type = feedback_data.get("feedback_type")
-            
-            # Get current counts
-            thumbs_up = await self.redis_client.get(f"feedback:thumbs_up:{job.org_id}:{job.project_id}")
-            thumbs_down = await self.redis_client.get(f"feedback:thumbs_down:{job.org_id}:{job.project_id}")
-            
-            thumbs_up = int(thumbs_up) if thumbs_up else 0
-            thumbs_down = int(thumbs_down) if thumbs_down else 0
-            
-            # Calculate satisfaction score (0-100)
-            total_feedback = thumbs_up + thumbs_down
-            if total_feedback > 0:
-                satisfaction_score = (thumbs_up / total_feedback) * 100
-            else:
-                satisfaction_score = 0
-            
-            # Store satisfaction score
-            await self.redis_client.set(f"satisfaction_score:{job.org_id}:{job.project_id}", satisfaction_score)
-            await self.redis_client.expire(f"satisfaction_score:{job.org_id}:{job.project_id}", 86400)
+            # Read the counts and store the score server-side, so concurrent
+            # feedback writers cannot interleave between the read and the write
+            await self._satisfaction_script(
+                keys=[
+                    f"feedback:thumbs_up:{job.org_id}:{job.project_id}",
+                    f"feedback:thumbs_down:{job.org_id}:{job.project_id}",
+                    f"satisfaction_score:{job.org_id}:{job.project_id}",
+                ],
+                args=[86400],
+            )
             
         except Exception as e:
             self.logger.logger.error(f"Failed to update satisfaction score: {e}")
@@ -829,11 +1095,13 @@ class AnalyticsWorker:
     async def get_feedback_summary(self, org_id: str, project_id: str, period: str = "daily") -> dict:
         """Get feedback summary for a project"""
         try:
-            # Get feedback counts from Redis
-            thumbs_up = await self.redis_client.get(f"feedback:thumbs_up:{org_id}:{project_id}")
-            thumbs_down = await self.redis_client.get(f"feedback:thumbs_down:{org_id}:{project_id}")
-            comments = await self.redis_client.get(f"feedback:comment:{org_id}:{project_id}")
-            satisfaction_score = await self.redis_client.get(f"satisfaction_score:{org_id}:{project_id}")
+            # Get feedback counts from Redis in one round trip
+            thumbs_up, thumbs_down, comments, satisfaction_score = await self.redis_client.mget(
+                f"feedback:thumbs_up:{org_id}:{project_id}",
+                f"feedback:thumbs_down:{org_id}:{project_id}",
+                f"feedback:comment:{org_id}:{project_id}",
+                f"satisfaction_score:{org_id}:{project_id}",
+            )
             
             # Convert to appropriate types
             thumbs_up = int(thumbs_up) if thumbs_up else 0
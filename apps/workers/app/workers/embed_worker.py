@@ -1,19 +1,48 @@
 # Created automatically by Cursor AI (2025-01-27)
 
 import asyncio
+import hashlib
+import json
 import time
 from typing import Dict, Any, List
 
 import nats
 from nats.aio.client import Client as NATS
+from nats.js.api import ConsumerConfig
 import redis.asyncio as redis
+import numpy as np
 import openai
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_random_exponential
 
-from app.core.config import settings
+from app.core.config import get_settings
 from app.core.logging import WorkerLogger
-from app.models.jobs import EmbedJob
+from app.models.jobs import EmbedChunk, EmbedJob
+from app.services.database import DatabaseService
+from app.services.queue import ensure_jobs_stream
 
 
+# Embed jobs pulled from JetStream per fetch; kept small because every job
+# in a batch waits for the batch's slowest embeddings request
+EMBED_FETCH_BATCH = 32
+EMBED_FETCH_TIMEOUT = 0.5
+
+# Durable JetStream consumer shared by all embed workers; a job that keeps
+# failing is dropped after EMBED_MAX_DELIVER deliveries
+EMBED_DURABLE = "embed-workers"
+EMBED_MAX_DELIVER = 5
+
+# Embeddings are cached by model and content hash for re-processed documents
+EMBED_CACHE_TTL = 7 * 86400
+
+# Attempts per embeddings request before the job fails
+EMBED_MAX_ATTEMPTS = 5
+
+def _is_retryable(error: BaseException) -> bool:
+    """Rate limits, server errors and dropped connections are worth retrying"""
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
 class EmbedWorker:
     """Worker for generating embeddings"""
     
@@ -27,9 +56,13 @@ class EmbedWorker:
         # External services
         self.nats_client: NATS = None
         self.redis_client: redis.Redis = None
+        self._subscription = None
+        
+        # Services
+        self.db = DatabaseService()
         
         # OpenAI client
-        self.openai_client = openai.AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+        self.openai_client = openai.AsyncOpenAI(api_key=get_settings().OPENAI_API_KEY)
     
     async def start(self) -> None:
         """Start the embed worker"""
@@ -53,6 +86,8 @@ class EmbedWorker:
         self.logger.log_worker_stop()
         self.is_running = False
         
+        await self.db.close()
+        
         if self.nats_client:
             await self.nats_client.close()
         if self.redis_client:
@@ -62,83 +97,230 @@ class EmbedWorker:
         """Initialize external service connections"""
         # Connect to NATS
         self.nats_client = nats.NATS()
-        await self.nats_client.connect(settings.NATS_URL)
+        await self.nats_client.connect(get_settings().NATS_URL)
         
         # Connect to Redis
-        self.redis_client = redis.from_url(settings.REDIS_URL)
+        self.redis_client = redis.from_url(get_settings().REDIS_URL)
+        
+        # Subscribe once; _process_jobs only fetches from this subscription
+        js = self.nats_client.jetstream()
+        await ensure_jobs_stream(js)
+        self._subscription = await js.pull_subscribe(
+            "jobs.embed",
+            EMBED_DURABLE,
+            config=ConsumerConfig(max_deliver=EMBED_MAX_DELIVER),
+        )
     
     async def _process_jobs(self) -> None:
         """Process embed jobs from NATS"""
         try:
-            # Subscribe to embed jobs
-            subscription = await self.nats_client.subscribe("jobs.embed")
-            
-            async for msg in subscription.messages:
+            # Pull jobs in batches so their chunks share embeddings requests
+            while self.is_running:
                 try:
-                    job_data = msg.data.decode()
-                    job = EmbedJob.parse_raw(job_data)
-                    
-                    await self._process_embed_job(job)
-                    
-                    # Acknowledge message
-                    await msg.ack()
-                    
-                except Exception as e:
-                    self.logger.log_job_error(job.document_id, e)
-                    self.failed_jobs += 1
-                    await msg.nak()
+                    msgs = await self._subscription.fetch(batch=EMBED_FETCH_BATCH, timeout=EMBED_FETCH_TIMEOUT)
+                except nats.errors.TimeoutError:
+                    continue
+                
+                await self._process_batch(msgs)
         
         except Exception as e:
             self.logger.logger.error(f"Error processing jobs: {e}")
     
-    async def _process_embed_job(self, job: EmbedJob) -> None:
-        """Process a single embed job"""
+    async def _process_batch(self, msgs: List[Any]) -> None:
+        """Embed the chunks of a fetched batch together, then ack it at once"""
         start_time = time.time()
-        job_id = str(job.document_id)
+        succeeded = [False] * len(msgs)
+        jobs = []
+        # Malformed payloads and permanent errors; redelivery cannot fix them
+        terminated = set()
         
-        self.logger.log_job_start(job_id, "embed", document_id=job.document_id)
+        for index, msg in enumerate(msgs):
+            try:
+                job = self._parse_job(msg.data)
+            except Exception as e:
+                self.logger.log_job_error("unknown", e)
+                self.failed_jobs += 1
+                terminated.add(index)
+                continue
+            
+            self.logger.log_job_start(str(job.document_id), "embed", document_id=job.document_id)
+            jobs.append((index, job))
         
         try:
-            # Generate embeddings for chunks
-            embeddings = await self._generate_embeddings(job.chunks)
-            
-            # Store embeddings in database
-            await self._store_embeddings(job.document_id, job.chunks, embeddings)
-            
-            # Update document status to embedded
-            await self._update_document_status(job.document_id, "embedded")
-            
-            duration = time.time() - start_time
-            self.logger.log_job_success(job_id, duration, document_id=job.document_id)
-            self.processed_jobs += 1
-            
+            # One embeddings pass over every chunk in the batch
+            embeddings = await self._generate_embeddings([chunk for _, job in jobs for chunk in job.chunks])
         except Exception as e:
-            # Update document status to failed
-            await self._update_document_status(job.document_id, "failed", {"error": str(e)})
-            raise
-    
-    async def _generate_embeddings(self, chunks: List[Dict[str, Any]]) -> List[List[float]]:
-        """Generate embeddings for text chunks"""
-        embeddings = []
+            if len(jobs) > 1:
+                self.logger.logger.warning(f"Batch embedding failed, embedding jobs separately: {e}")
+            embeddings = None
+            batch_error = e
         
-        for chunk in chunks:
+        offset = 0
+        for index, job in jobs:
             try:
-                response = await self.openai_client.embeddings.create(
-                    model=settings.OPENAI_EMBEDDING_MODEL,
-                    input=chunk["content"]
-                )
-                embeddings.append(response.data[0].embedding)
+                if embeddings is not None:
+                    # Hand each job back its own slice of the batch's embeddings
+                    job_embeddings = embeddings[offset:offset + len(job.chunks)]
+                    offset += len(job.chunks)
+                elif len(jobs) > 1:
+                    # Re-embed on its own so only a bad job fails
+                    job_embeddings = await self._generate_embeddings(job.chunks)
+                else:
+                    raise batch_error
             except Exception as e:
-                raise Exception(f"Failed to generate embedding: {e}")
+                await self._fail_embed_job(job, e)
+                if not _is_retryable(e.__cause__ or e):
+                    terminated.add(index)
+                continue
+            
+            try:
+                await self._process_embed_job(job, job_embeddings, start_time)
+                succeeded[index] = True
+            except Exception as e:
+                await self._fail_embed_job(job, e)
+        
+        # Acknowledge the batch with pipelined acks instead of one round trip each
+        await asyncio.gather(
+            *(
+                msg.term() if index in terminated else msg.ack() if ok else msg.nak()
+                for index, (msg, ok) in enumerate(zip(msgs, succeeded))
+            ),
+            return_exceptions=True,
+        )
+    
+    def _parse_job(self, data: bytes) -> EmbedJob:
+        """Build an EmbedJob from a NATS message payload"""
+        payload = json.loads(data)
+        if get_settings().DEBUG:
+            # Full validation to catch malformed jobs while developing
+            return EmbedJob.model_validate(payload)
+        # Payload comes from the ingest worker; skip re-validating every chunk,
+        # but reject jobs missing what the batch reads so they are terminated
+        # here instead of failing the shared embeddings call
+        chunks = payload.get("chunks")
+        if not payload.get("document_id") or not isinstance(chunks, list):
+            raise ValueError("Embed job is missing document_id or chunks")
+        if not all(isinstance(chunk, dict) and isinstance(chunk.get("content"), str) for chunk in chunks):
+            raise ValueError("Embed job has a chunk without content")
+        return EmbedJob.model_construct(**payload)
+    
+    async def _process_embed_job(self, job: EmbedJob, embeddings: List[np.ndarray], start_time: float) -> None:
+        """Store a job's embeddings and mark its document embedded"""
+        job_id = str(job.document_id)
+        
+        # Store embeddings in database
+        await self._store_embeddings(job.document_id, job.chunks, embeddings)
         
-        return embeddings
+        # Update document status to embedded
+        await self._update_document_status(job.document_id, "embedded")
+        
+        duration = time.time() - start_time
+        self.logger.log_job_success(job_id, duration, document_id=job.document_id)
+        self.processed_jobs += 1
+    
+    async def _fail_embed_job(self, job: EmbedJob, error: Exception) -> None:
+        """Record a failed embed job and mark its document failed"""
+        self.logger.log_job_error(str(job.document_id), error)
+        self.failed_jobs += 1
+        
+        # Update document status to failed
+        await self._update_document_status(job.document_id, "failed", {"error": str(error)})
+    
+    async def _generate_embeddings(self, chunks: List[EmbedChunk]) -> List[np.ndarray]:
+        """Generate embeddings for text chunks, one request per batch of chunks"""
+        settings = get_settings()
+        batch_size = settings.EMBED_BATCH_SIZE
+        model = settings.OPENAI_EMBEDDING_MODEL
+        contents = [chunk["content"] for chunk in chunks]
+        
+        # Embed each distinct text once; repeated headers, footers and tables
+        # share one embedding
+        embeddings = dict.fromkeys(contents)
+        
+        # Reuse embeddings computed for earlier documents
+        keys = {content: self._cache_key(model, content) for content in embeddings}
+        await self._load_cached_embeddings(keys, embeddings)
+        inputs = [content for content, embedding in embeddings.items() if embedding is None]
+        
+        # Overlap the batch requests, bounded to stay within the rate limit
+        semaphore = asyncio.Semaphore(settings.EMBED_CONCURRENCY)
+        
+        async def embed_batch(batch: List[str]) -> List[np.ndarray]:
+            async with semaphore:
+                return await self._embed_batch(batch)
+        
+        try:
+            results = await asyncio.gather(
+                *(embed_batch(inputs[start:start + batch_size]) for start in range(0, len(inputs), batch_size))
+            )
+        except Exception as e:
+            raise Exception(f"Failed to generate embedding: {e}") from e
+        
+        # gather keeps batch order, so flattening lines up with inputs
+        fresh = dict(zip(inputs, (embedding for batch in results for embedding in batch)))
+        embeddings.update(fresh)
+        await self._cache_embeddings(keys, fresh)
+        
+        return [embeddings[content] for content in contents]
+    
+    @staticmethod
+    def _cache_key(model: str, content: str) -> str:
+        """Redis key of a text's cached embedding"""
+        digest = hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+        return f"emb:{model}:{digest}"
     
-    async def _store_embeddings(self, document_id: str, chunks: List[Dict[str, Any]], embeddings: List[List[float]]) -> None:
+    async def _load_cached_embeddings(self, keys: Dict[str, str], embeddings: Dict[str, Any]) -> None:
+        """Fill in cached embeddings with a single MGET"""
+        if not keys:
+            return
+        
+        try:
+            values = await self.redis_client.mget(list(keys.values()))
+        except Exception as e:
+            # The cache only saves API calls; embed everything on a miss
+            self.logger.logger.warning(f"Failed to read embedding cache: {e}")
+            return
+        
+        for content, value in zip(keys, values):
+            if value is not None:
+                embeddings[content] = np.frombuffer(value, dtype=np.float32)
+    
+    async def _cache_embeddings(self, keys: Dict[str, str], embeddings: Dict[str, np.ndarray]) -> None:
+        """Cache new embeddings in one pipelined round trip"""
+        if not embeddings:
+            return
+        
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for content, embedding in embeddings.items():
+                    pipe.set(keys[content], embedding.tobytes(), ex=EMBED_CACHE_TTL)
+                await pipe.execute()
+        except Exception as e:
+            self.logger.logger.warning(f"Failed to write embedding cache: {e}")
+    
+    @retry(
+        retry=retry_if_exception(_is_retryable),
+        wait=wait_random_exponential(multiplier=0.5, max=20),
+        stop=stop_after_attempt(EMBED_MAX_ATTEMPTS),
+        reraise=True,
+    )
+    async def _embed_batch(self, inputs: List[str]) -> List[np.ndarray]:
+        """Embed one batch of texts, retrying transient API errors with backoff"""
+        response = await self.openai_client.embeddings.create(
+            model=get_settings().OPENAI_EMBEDDING_MODEL,
+            input=inputs
+        )
+        
+        # Keep the results in input order, packed as float32 rather than boxed floats
+        return [
+            np.asarray(item.embedding, dtype=np.float32)
+            for item in sorted(response.data, key=lambda item: item.index)
+        ]
+    
+    async def _store_embeddings(self, document_id: str, chunks: List[EmbedChunk], embeddings: List[np.ndarray]) -> None:
         """Store embeddings in database"""
         try:
-            # This would store the embeddings in the database
-            # Implementation depends on your database service
-            pass
+            await self.db.create_chunk_embeddings(document_id, chunks, embeddings)
         except Exception as e:
             self.logger.logger.error(f"Failed to store embeddings: {e}")
             raise
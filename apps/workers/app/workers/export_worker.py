@@ -8,9 +8,10 @@ import nats
 from nats.aio.client import Client as NATS
 import redis.asyncio as redis
 
-from app.core.config import settings
+from app.core.config import get_settings
 from app.core.logging import WorkerLogger
 from app.models.jobs import ExportJob
+from app.services.storage import StorageService
 
 
 class ExportWorker:
@@ -26,6 +27,9 @@ class ExportWorker:
         # External services
         self.nats_client: NATS = None
         self.redis_client: redis.Redis = None
+        
+        # Shared so uploads reuse its pooled S3 connections
+        self.storage = StorageService()
     
     async def start(self) -> None:
         """Start the export worker"""
@@ -53,26 +57,26 @@ class ExportWorker:
             await self.nats_client.close()
         if self.redis_client:
             await self.redis_client.close()
+        await self.storage.close()
     
     async def _init_connections(self) -> None:
         """Initialize external service connections"""
         # Connect to NATS
         self.nats_client = nats.NATS()
-        await self.nats_client.connect(settings.NATS_URL)
+        await self.nats_client.connect(get_settings().NATS_URL)
         
         # Connect to Redis
-        self.redis_client = redis.from_url(settings.REDIS_URL)
+        self.redis_client = redis.from_url(get_settings().REDIS_URL)
     
     async def _process_jobs(self) -> None:
         """Process export jobs from NATS"""
         try:
             # Subscribe to export jobs
-            subscription = await self.nats_client.subscribe("jobs.export")
+            subscription = await self.nats_client.subscribe("jobs.export", queue="export-workers")
             
             async for msg in subscription.messages:
                 try:
-                    job_data = msg.data.decode()
-                    job = ExportJob.parse_raw(job_data)
+                    job = ExportJob.model_validate_json(msg.data)
                     
                     await self._process_export_job(job)
                     
@@ -374,11 +378,6 @@ class ExportWorker:
     async def _store_export_file(self, job: ExportJob, content: str) -> str:
         """Store export file and return URL"""
         try:
-            from app.services.storage import StorageService
-            
-            # Initialize storage service
-            storage_service = StorageService()
-            
             # Determine file extension
             format_extensions = {
                 "markdown": "md",
@@ -389,7 +388,7 @@ class ExportWorker:
             file_extension = format_extensions.get(job.format, "txt")
             
             # Upload artifact to S3
-            url = await storage_service.upload_export_artifact(job, content, file_extension)
+            url = await self.storage.upload_export_artifact(job, content, file_extension)
             
             return url
             
@@ -400,17 +399,12 @@ class ExportWorker:
     async def _generate_signed_url(self, file_url: str) -> str:
         """Generate a signed URL for frontend access"""
         try:
-            from app.services.storage import StorageService
-            
-            # Initialize storage service
-            storage_service = StorageService()
-            
             # Extract file path from URL
             # Assuming URL format: https://storage.example.com/files/path/to/file
             file_path = file_url.replace("https://storage.example.com/files/", "")
             
             # Generate signed URL with 1 hour expiry
-            signed_url = await storage_service.generate_signed_url(file_path, expires_in=3600)
+            signed_url = await self.storage.generate_signed_url(file_path, expires_in=3600)
             
             return signed_url
             
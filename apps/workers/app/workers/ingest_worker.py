@@ -13,6 +13,7 @@ import redis.asyncio as redis
 import boto3
 from botocore.exceptions import ClientError
 import clamd
+import orjson
 from pdfminer.high_level import extract_text
 from pdfminer.layout import LAParams
 import fitz  # PyMuPDF
@@ -20,10 +21,11 @@ import easyocr
 from PIL import Image
 import numpy as np
 
-from app.core.config import settings
+from app.core.config import get_settings
 from app.core.logging import WorkerLogger
 from app.models.jobs import IngestJob
 from app.services.database import DatabaseService
+from app.services.queue import ensure_jobs_stream
 from app.services.storage import StorageService
 
 
@@ -43,11 +45,13 @@ class IngestWorker:
         
         # External services
         self.nats_client: NATS = None
+        self.js = None
         self.redis_client: redis.Redis = None
         self.clamav_client: clamd.ClamdUnixSocket = None
         self.ocr_reader: easyocr.Reader = None
         
         # S3 client
+        settings = get_settings()
         self.s3_client = boto3.client(
             's3',
             endpoint_url=settings.S3_ENDPOINT,
@@ -66,8 +70,9 @@ class IngestWorker:
         await self._init_connections()
         
         # Initialize OCR if enabled
+        settings = get_settings()
         if settings.ENABLE_OCR:
-            self.ocr_reader = easyocr.Reader(settings.OCR_LANGUAGES)
+            self.ocr_reader = easyocr.Reader(list(settings.OCR_LANGUAGES))
         
         # Start processing loop
         while self.is_running:
@@ -93,10 +98,14 @@ class IngestWorker:
         """Initialize external service connections"""
         # Connect to NATS
         self.nats_client = nats.NATS()
-        await self.nats_client.connect(settings.NATS_URL)
+        await self.nats_client.connect(get_settings().NATS_URL)
+        
+        # Embed jobs go through JetStream so they survive until an embed worker acks them
+        self.js = self.nats_client.jetstream()
+        await ensure_jobs_stream(self.js)
         
         # Connect to Redis
-        self.redis_client = redis.from_url(settings.REDIS_URL)
+        self.redis_client = redis.from_url(get_settings().REDIS_URL)
         
         # Connect to ClamAV
         try:
@@ -110,12 +119,11 @@ class IngestWorker:
         """Process ingest jobs from NATS"""
         try:
             # Subscribe to ingest jobs
-            subscription = await self.nats_client.subscribe("jobs.ingest")
+            subscription = await self.nats_client.subscribe("jobs.ingest", queue="ingest-workers")
             
             async for msg in subscription.messages:
                 try:
-                    job_data = msg.data.decode()
-                    job = IngestJob.parse_raw(job_data)
+                    job = IngestJob.model_validate_json(msg.data)
                     
                     await self._process_ingest_job(job)
                     
@@ -177,7 +185,7 @@ class IngestWorker:
             temp_file.close()
             
             # Download from S3
-            self.s3_client.download_file(settings.S3_BUCKET, file_path, temp_path)
+            self.s3_client.download_file(get_settings().S3_BUCKET, file_path, temp_path)
             
             return temp_path
             
@@ -224,7 +232,7 @@ class IngestWorker:
             
             if not text.strip():
                 # No text found, try OCR
-                if settings.ENABLE_OCR and self.ocr_reader:
+                if get_settings().ENABLE_OCR and self.ocr_reader:
                     text = await self._extract_text_with_ocr(file_path)
                 else:
                     raise Exception("No text found and OCR is disabled")
@@ -313,9 +321,10 @@ class IngestWorker:
                 "timestamp": time.time()
             }
             
-            await self.nats_client.publish(
+            # Waits for the stream to persist the job
+            await self.js.publish(
                 "jobs.embed",
-                str(embed_job).encode()
+                orjson.dumps(embed_job)
             )
             
         except Exception as e:
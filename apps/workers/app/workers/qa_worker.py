@@ -9,7 +9,7 @@ from nats.aio.client import Client as NATS
 import redis.asyncio as redis
 import openai
 
-from app.core.config import settings
+from app.core.config import get_settings
 from app.core.logging import WorkerLogger
 from app.models.jobs import QAJob
 
@@ -29,7 +29,7 @@ class QAWorker:
         self.redis_client: redis.Redis = None
         
         # OpenAI client
-        self.openai_client = openai.AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+        self.openai_client = openai.AsyncOpenAI(api_key=get_settings().OPENAI_API_KEY)
     
     async def start(self) -> None:
         """Start the QA worker"""
@@ -62,21 +62,20 @@ class QAWorker:
         """Initialize external service connections"""
         # Connect to NATS
         self.nats_client = nats.NATS()
-        await self.nats_client.connect(settings.NATS_URL)
+        await self.nats_client.connect(get_settings().NATS_URL)
         
         # Connect to Redis
-        self.redis_client = redis.from_url(settings.REDIS_URL)
+        self.redis_client = redis.from_url(get_settings().REDIS_URL)
     
     async def _process_jobs(self) -> None:
         """Process QA jobs from NATS"""
         try:
             # Subscribe to QA jobs
-            subscription = await self.nats_client.subscribe("jobs.qa")
+            subscription = await self.nats_client.subscribe("jobs.qa", queue="qa-workers")
             
             async for msg in subscription.messages:
                 try:
-                    job_data = msg.data.decode()
-                    job = QAJob.parse_raw(job_data)
+                    job = QAJob.model_validate_json(msg.data)
                     
                     await self._process_qa_job(job)
                     
@@ -118,7 +117,7 @@ class QAWorker:
                 "metadata": {
                     "chunks_retrieved": len(chunks),
                     "chunks_used": len(ranked_chunks),
-                    "model": settings.OPENAI_MODEL,
+                    "model": get_settings().OPENAI_MODEL,
                 }
             }
             
@@ -155,7 +154,7 @@ class QAWorker:
         try:
             # Generate query embedding
             response = await self.openai_client.embeddings.create(
-                model=settings.OPENAI_EMBEDDING_MODEL,
+                model=get_settings().OPENAI_EMBEDDING_MODEL,
                 input=query
             )
             query_embedding = response.data[0].embedding
@@ -215,7 +214,7 @@ class QAWorker:
             
             # Generate answer
             response = await self.openai_client.chat.completions.create(
-                model=settings.OPENAI_MODEL,
+                model=get_settings().OPENAI_MODEL,
                 messages=[
                     {"role": "system", "content": "You are a helpful assistant that answers questions based on the provided context. Always cite your sources."},
                     {"role": "user", "content": prompt}
@@ -7,14 +7,29 @@ import logging
 
 import nats
 from nats.aio.client import Client as NATS
+from nats.js import JetStreamContext
+from nats.js.api import ConsumerConfig
 import redis.asyncio as redis
 
-from app.core.config import settings
+from app.core.config import get_settings
 from app.core.logging import WorkerLogger
 from app.models.jobs import RetentionJob
+from app.services.queue import ensure_jobs_stream
 from app.services.retention import RetentionService
 
 
+# Retention jobs pulled and processed concurrently by one worker
+MAX_IN_FLIGHT = 4
+RETENTION_FETCH_TIMEOUT = 1.0
+
+# Durable JetStream consumer shared by all retention workers
+RETENTION_DURABLE = "retention-workers"
+
+# Sweeps can run for a long time, so a job is only redelivered if it is not
+# acked within the hour; it is dropped after RETENTION_MAX_DELIVER attempts
+RETENTION_ACK_WAIT = 3600
+RETENTION_MAX_DELIVER = 5
+
 class RetentionWorker:
     """Worker for handling data retention and cleanup tasks"""
     
@@ -27,7 +42,9 @@ class RetentionWorker:
         
         # External services
         self.nats_client: NATS = None
+        self.js: JetStreamContext = None
         self.redis_client: redis.Redis = None
+        self._subscription = None
         self.retention_service = RetentionService()
     
     async def start(self) -> None:
@@ -61,39 +78,63 @@ class RetentionWorker:
         """Initialize external service connections"""
         # Connect to NATS
         self.nats_client = nats.NATS()
-        await self.nats_client.connect(settings.NATS_URL)
+        await self.nats_client.connect(get_settings().NATS_URL)
         
         # Connect to Redis
-        self.redis_client = redis.from_url(settings.REDIS_URL)
+        self.redis_client = redis.from_url(get_settings().REDIS_URL)
+        
+        # Subscribe once; _process_jobs only fetches from this subscription
+        self.js = self.nats_client.jetstream()
+        await ensure_jobs_stream(self.js)
+        self._subscription = await self.js.pull_subscribe(
+            "jobs.retention",
+            RETENTION_DURABLE,
+            config=ConsumerConfig(ack_wait=RETENTION_ACK_WAIT, max_deliver=RETENTION_MAX_DELIVER),
+        )
+        
+        # Let the service publish scheduled sweeps to the job queue
+        self.retention_service.js = self.js
     
     async def _process_jobs(self) -> None:
         """Process retention jobs from NATS"""
         try:
-            # Subscribe to retention jobs
-            subscription = await self.nats_client.subscribe("jobs.retention")
-            
-            async for msg in subscription.messages:
+            # Pull at most MAX_IN_FLIGHT jobs and finish them before fetching more
+            while self.is_running:
                 try:
-                    job_data = msg.data.decode()
-                    job = RetentionJob.parse_raw(job_data)
-                    
-                    await self._process_retention_job(job)
-                    
-                    # Acknowledge message
-                    await msg.ack()
-                    
-                except Exception as e:
-                    self.logger.log_job_error(job.retention_type, e)
-                    self.failed_jobs += 1
-                    await msg.nak()
+                    msgs = await self._subscription.fetch(batch=MAX_IN_FLIGHT, timeout=RETENTION_FETCH_TIMEOUT)
+                except nats.errors.TimeoutError:
+                    continue
+                
+                await asyncio.gather(*(self._handle_message(msg) for msg in msgs))
         
         except Exception as e:
             self.logger.logger.error(f"Error processing jobs: {e}")
     
+    async def _handle_message(self, msg) -> None:
+        """Process and acknowledge a single retention job message"""
+        try:
+            job = RetentionJob.model_validate_json(msg.data)
+        except Exception as e:
+            # Redelivery cannot fix a malformed payload
+            self.logger.log_job_error("unknown", e)
+            self.failed_jobs += 1
+            await msg.term()
+            return
+        
+        try:
+            await self._process_retention_job(job)
+        except Exception as e:
+            self.logger.log_job_error(job.retention_type, e)
+            self.failed_jobs += 1
+            await msg.nak()
+            return
+        
+        await msg.ack()
+    
     async def _process_retention_job(self, job: RetentionJob) -> None:
         """Process a single retention job"""
         start_time = time.time()
-        job_id = f"retention_{job.retention_type}_{int(start_time)}"
+        job_id = job.job_id or f"retention_{job.retention_type}_{int(start_time)}"
         
         self.logger.log_job_start(job_id, "retention", retention_type=job.retention_type, organization_id=job.organization_id)
         
@@ -217,9 +258,9 @@ class RetentionWorker:
                 scheduled_at=time.time(),
             )
             
-            await self.nats_client.publish(
+            await self.js.publish(
                 "jobs.retention",
-                job.json().encode()
+                job.model_dump_json().encode()
             )
             
             self.logger.logger.info("Daily retention sweep scheduled")
@@ -238,9 +279,9 @@ class RetentionWorker:
                 scheduled_at=time.time(),
             )
             
-            await self.nats_client.publish(
+            await self.js.publish(
                 "jobs.retention",
-                job.json().encode()
+                job.model_dump_json().encode()
             )
             
             self.logger.logger.info("Weekly orphaned file cleanup scheduled")
@@ -259,9 +300,9 @@ class RetentionWorker:
                 scheduled_at=time.time(),
             )
             
-            await self.nats_client.publish(
+            await self.js.publish(
                 "jobs.retention",
-                job.json().encode()
+                job.model_dump_json().encode()
             )
             
             self.logger.logger.info("Retention stats generation scheduled")
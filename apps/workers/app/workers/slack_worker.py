@@ -8,7 +8,7 @@ import nats
 from nats.aio.client import Client as NATS
 import redis.asyncio as redis
 
-from app.core.config import settings
+from app.core.config import get_settings
 from app.core.logging import WorkerLogger
 from app.models.jobs import SlackJob, QAJob
 
@@ -58,21 +58,20 @@ class SlackWorker:
         """Initialize external service connections"""
         # Connect to NATS
         self.nats_client = nats.NATS()
-        await self.nats_client.connect(settings.NATS_URL)
+        await self.nats_client.connect(get_settings().NATS_URL)
         
         # Connect to Redis
-        self.redis_client = redis.from_url(settings.REDIS_URL)
+        self.redis_client = redis.from_url(get_settings().REDIS_URL)
     
     async def _process_jobs(self) -> None:
         """Process Slack jobs from NATS"""
         try:
             # Subscribe to Slack jobs
-            subscription = await self.nats_client.subscribe("jobs.slack")
+            subscription = await self.nats_client.subscribe("jobs.slack", queue="slack-workers")
             
             async for msg in subscription.messages:
                 try:
-                    job_data = msg.data.decode()
-                    job = SlackJob.parse_raw(job_data)
+                    job = SlackJob.model_validate_json(msg.data)
                     
                     await self._process_slack_job(job)
                     
@@ -534,7 +533,7 @@ class SlackWorker:
         try:
             # This would generate a link to the web UI thread
             # For now, return a placeholder
-            base_url = settings.FRONTEND_URL or "https://app.rag-pdf-qa.com"
+            base_url = get_settings().FRONTEND_URL or "https://app.rag-pdf-qa.com"
             encoded_query = query.replace(" ", "+")
             return f"{base_url}/projects/{project_id}/chat?q={encoded_query}"
         except Exception as e:
@@ -544,10 +543,8 @@ class SlackWorker:
     async def _publish_qa_job(self, qa_job: QAJob) -> None:
         """Publish QA job to NATS"""
         try:
-            import json
-            
             # Serialize job
-            job_data = qa_job.json()
+            job_data = qa_job.model_dump_json()
             
             # Publish to NATS
             await self.nats_client.publish("jobs.qa", job_data.encode())
@@ -7,8 +7,8 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.core.config import settings
-from app.core.logging import setup_logging
+from app.core.config import get_settings
+from app.core.logging import flush_logs, setup_logging
 from app.workers.ingest_worker import IngestWorker
 from app.workers.embed_worker import EmbedWorker
 from app.workers.qa_worker import QAWorker
@@ -70,6 +70,9 @@ async def lifespan(app: FastAPI):
     await asyncio.gather(*tasks, return_exceptions=True)
     
     logger.info("Workers stopped")
+    
+    # uvicorn replaces the SIGTERM log flush, so flush on shutdown instead
+    flush_logs()
 
 # Create FastAPI app
 app = FastAPI(
@@ -82,7 +85,7 @@ app = FastAPI(
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=settings.ALLOWED_ORIGINS,
+    allow_origins=get_settings().ALLOWED_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -116,6 +119,7 @@ if __name__ == "__main__":
         "main:app",
         host="0.0.0.0",
         port=8000,
-        reload=settings.DEBUG,
+        loop="uvloop",
+        reload=get_settings().DEBUG,
         log_level="info",
     )
@@ -93,7 +93,8 @@ class TestQAPipeline:
     @pytest.fixture
     def mock_telemetry(self):
         """Mock telemetry service"""
-        with patch('app.services.telemetry.telemetry_service') as mock:
+        with patch('app.services.telemetry.get_telemetry_service') as get_telemetry_service:
+            mock = get_telemetry_service.return_value
             mock.create_span.return_value = Mock()
             mock.start_span.return_value = Mock()
             mock.end_span.return_value = None
@@ -102,7 +103,8 @@ class TestQAPipeline:
     @pytest.fixture
     def mock_metrics(self):
         """Mock metrics service"""
-        with patch('app.services.metrics.metrics_service') as mock:
+        with patch('app.services.metrics.get_metrics_service') as get_metrics_service:
+            mock = get_metrics_service.return_value
             mock.record_counter.return_value = None
             mock.record_histogram.return_value = None
             yield mock
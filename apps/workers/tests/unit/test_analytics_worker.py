@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+from unittest.mock import AsyncMock, Mock
+
+from app.workers.analytics_worker import AnalyticsWorker
+
+
+def _message(data: bytes) -> Mock:
+    return Mock(data=data, ack=AsyncMock(), nak=AsyncMock(), term=AsyncMock())
+
+
+VALID_JOB = b'{"event_type": "query", "data": {}, "timestamp": 1.0}'
+
+
+class TestAnalyticsWorkerFlush:
+    """Unit tests for AnalyticsWorker buffer flushing and batch acknowledgement"""
+
+    def setup_method(self):
+        """Set up test fixtures"""
+        self.worker = AnalyticsWorker()
+        self.worker.db = Mock()
+        self.worker.db.create_analytics_events = AsyncMock()
+
+        self.worker.nats_client = Mock()
+        self.worker.nats_client.publish = AsyncMock()
+
+        # Every processed job buffers one query row and one metric delta
+        async def process(job):
+            self.worker._query_buf.append(("row", job.timestamp))
+            self.worker._delta_buf.append(b"delta")
+
+        self.worker._process_analytics_job = AsyncMock(side_effect=process)
+
+    async def _process_batch(self, msgs):
+        consumer = asyncio.create_task(self.worker._consume_jobs())
+        try:
+            await self.worker._process_batch(msgs)
+        finally:
+            consumer.cancel()
+
+    @pytest.mark.asyncio
+    async def test_failed_flush_drops_rows_instead_of_requeueing(self):
+        """Test that a failed write empties the buffers so retries cannot duplicate rows"""
+        self.worker._query_buf.append(("row", 1.0))
+        self.worker.db.create_analytics_events.side_effect = ConnectionError("db down")
+
+        with pytest.raises(ConnectionError):
+            await self.worker._flush_buffers()
+
+        assert not self.worker._query_buf
+
+        # The next flush writes nothing from the failed attempt
+        self.worker.db.create_analytics_events.side_effect = None
+        await self.worker._flush_buffers()
+        self.worker.db.create_analytics_events.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_batch_is_acked_after_rows_are_written(self):
+        """Test that a batch is acked once its rows are in the database"""
+        msgs = [_message(VALID_JOB), _message(VALID_JOB)]
+
+        await self._process_batch(msgs)
+
+        query_rows, _, _ = self.worker.db.create_analytics_events.await_args.args
+        assert len(query_rows) == 2
+        assert self.worker.nats_client.publish.await_count == 2
+        for msg in msgs:
+            msg.ack.assert_awaited_once()
+            msg.nak.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_failed_flush_naks_the_batch_once(self):
+        """Test that a failed write naks the batch and publishes no metric deltas"""
+        self.worker.db.create_analytics_events.side_effect = ConnectionError("db down")
+        msgs = [_message(VALID_JOB), _message(VALID_JOB)]
+
+        await self._process_batch(msgs)
+
+        for msg in msgs:
+            msg.nak.assert_awaited_once()
+            msg.ack.assert_not_called()
+        assert not self.worker._query_buf
+        assert not self.worker._delta_buf
+        self.worker.nats_client.publish.assert_not_called()
+
+        # Redelivery rebuilds the rows exactly once
+        self.worker.db.create_analytics_events.side_effect = None
+        await self._process_batch(msgs)
+
+        query_rows, _, _ = self.worker.db.create_analytics_events.await_args.args
+        assert len(query_rows) == 2
+        assert self.worker.nats_client.publish.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_malformed_message_is_terminated(self):
+        """Test that a payload that cannot be parsed is not redelivered"""
+        malformed = _message(b'not json')
+        valid = _message(VALID_JOB)
+
+        await self._process_batch([malformed, valid])
+
+        malformed.term.assert_awaited_once()
+        malformed.nak.assert_not_called()
+        valid.ack.assert_awaited_once()
@@ -0,0 +1,216 @@
+import json
+
+import pytest
+import numpy as np
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
+
+from app.workers.embed_worker import EMBED_CACHE_TTL, EmbedWorker
+
+
+# Distinct vector per chunk text
+VECTORS = {
+    "alpha": [1.0, 0.0],
+    "beta": [0.0, 1.0],
+    "gamma": [0.5, 0.5],
+}
+
+
+def _chunks(*contents):
+    return [{"page_number": 0, "content": content} for content in contents]
+
+
+async def _fake_create(model, input):
+    """Embeddings response with the items deliberately out of order"""
+    data = [Mock(index=index, embedding=VECTORS[text]) for index, text in enumerate(input)]
+    return Mock(data=list(reversed(data)))
+
+
+class TestEmbedWorkerGenerateEmbeddings:
+    """Unit tests for EmbedWorker._generate_embeddings"""
+
+    def setup_method(self):
+        """Set up test fixtures"""
+        self.worker = EmbedWorker()
+        self.worker.openai_client = Mock()
+        self.worker.openai_client.embeddings.create = AsyncMock(side_effect=_fake_create)
+
+        # Empty cache by default
+        self.worker.redis_client = MagicMock()
+        self.worker.redis_client.mget = AsyncMock(side_effect=lambda keys: [None] * len(keys))
+        self.pipe = self.worker.redis_client.pipeline.return_value.__aenter__.return_value
+        self.pipe.execute = AsyncMock()
+
+        self.settings = patch('app.workers.embed_worker.get_settings').start()
+        self.settings.return_value.EMBED_BATCH_SIZE = 2
+        self.settings.return_value.EMBED_CONCURRENCY = 2
+        self.settings.return_value.OPENAI_EMBEDDING_MODEL = "test-model"
+
+    def teardown_method(self):
+        """Tear down test fixtures"""
+        patch.stopall()
+
+    def _requested_inputs(self):
+        return [call.kwargs["input"] for call in self.worker.openai_client.embeddings.create.call_args_list]
+
+    @pytest.mark.asyncio
+    async def test_embeddings_follow_chunk_order_across_batches(self):
+        """Test that results line up with chunks despite batching and response order"""
+        embeddings = await self.worker._generate_embeddings(_chunks("alpha", "beta", "gamma"))
+
+        assert [list(embedding) for embedding in embeddings] == [VECTORS["alpha"], VECTORS["beta"], VECTORS["gamma"]]
+        assert all(embedding.dtype == np.float32 for embedding in embeddings)
+        assert self._requested_inputs() == [["alpha", "beta"], ["gamma"]]
+
+    @pytest.mark.asyncio
+    async def test_identical_contents_are_embedded_once(self):
+        """Test that repeated chunk texts share one embedding request slot"""
+        embeddings = await self.worker._generate_embeddings(_chunks("alpha", "beta", "alpha"))
+
+        assert self._requested_inputs() == [["alpha", "beta"]]
+        assert embeddings[0] is embeddings[2]
+        assert list(embeddings[1]) == VECTORS["beta"]
+
+    @pytest.mark.asyncio
+    async def test_cache_hits_skip_the_api_and_misses_are_cached(self):
+        """Test that cached texts are not re-embedded and new ones are stored"""
+        cached = np.asarray([0.25, 0.75], dtype=np.float32).tobytes()
+        self.worker.redis_client.mget = AsyncMock(return_value=[cached, None])
+
+        embeddings = await self.worker._generate_embeddings(_chunks("alpha", "beta"))
+
+        assert self._requested_inputs() == [["beta"]]
+        assert list(embeddings[0]) == [0.25, 0.75]
+        assert list(embeddings[1]) == VECTORS["beta"]
+
+        self.pipe.set.assert_called_once()
+        key, value = self.pipe.set.call_args.args
+        assert key == EmbedWorker._cache_key("test-model", "beta")
+        assert np.frombuffer(value, dtype=np.float32).tolist() == VECTORS["beta"]
+        assert self.pipe.set.call_args.kwargs["ex"] == EMBED_CACHE_TTL
+
+    @pytest.mark.asyncio
+    async def test_all_cached_makes_no_api_call(self):
+        """Test that a fully cached batch is served from Redis alone"""
+        cached = np.asarray(VECTORS["gamma"], dtype=np.float32).tobytes()
+        self.worker.redis_client.mget = AsyncMock(return_value=[cached])
+
+        embeddings = await self.worker._generate_embeddings(_chunks("gamma", "gamma"))
+
+        self.worker.openai_client.embeddings.create.assert_not_called()
+        self.pipe.set.assert_not_called()
+        assert [list(embedding) for embedding in embeddings] == [VECTORS["gamma"], VECTORS["gamma"]]
+
+    @pytest.mark.asyncio
+    async def test_cache_read_failure_embeds_everything(self):
+        """Test that an unavailable cache only costs API calls"""
+        self.worker.redis_client.mget = AsyncMock(side_effect=ConnectionError("redis down"))
+
+        embeddings = await self.worker._generate_embeddings(_chunks("alpha", "beta"))
+
+        assert self._requested_inputs() == [["alpha", "beta"]]
+        assert len(embeddings) == 2
+
+    @pytest.mark.asyncio
+    async def test_api_failure_is_raised(self):
+        """Test that a failed embeddings request fails the batch"""
+        self.worker.openai_client.embeddings.create = AsyncMock(side_effect=ValueError("bad request"))
+
+        with pytest.raises(Exception, match="Failed to generate embedding"):
+            await self.worker._generate_embeddings(_chunks("alpha"))
+
+
+class TestEmbedWorkerParseJob:
+    """Unit tests for EmbedWorker._parse_job"""
+
+    def setup_method(self):
+        """Set up test fixtures"""
+        self.worker = EmbedWorker()
+        self.settings = patch('app.workers.embed_worker.get_settings').start()
+        self.settings.return_value.DEBUG = False
+
+    def teardown_method(self):
+        """Tear down test fixtures"""
+        patch.stopall()
+
+    def test_valid_job_is_built_without_validation(self):
+        """Test that a well-formed internal job is constructed as is"""
+        job = self.worker._parse_job(b'{"document_id": "doc-1", "chunks": [{"page_number": 1, "content": "alpha"}]}')
+
+        assert job.document_id == "doc-1"
+        assert job.chunks == [{"page_number": 1, "content": "alpha"}]
+
+    @pytest.mark.parametrize("data", [
+        b'{"chunks": []}',
+        b'{"document_id": "doc-1"}',
+        b'{"document_id": "doc-1", "chunks": [{"page_number": 1}]}',
+        b'{"document_id": "doc-1", "chunks": ["alpha"]}',
+        b'[]',
+    ])
+    def test_incomplete_job_is_rejected(self, data):
+        """Test that jobs missing what the batch reads fail at parse time"""
+        with pytest.raises(Exception):
+            self.worker._parse_job(data)
+
+
+def _embed_message(document_id, *contents):
+    data = json.dumps({"document_id": document_id, "chunks": _chunks(*contents)}).encode()
+    return Mock(data=data, ack=AsyncMock(), nak=AsyncMock(), term=AsyncMock())
+
+
+class TestEmbedWorkerProcessBatch:
+    """Unit tests for EmbedWorker._process_batch"""
+
+    def setup_method(self):
+        """Set up test fixtures"""
+        self.worker = EmbedWorker()
+        self.settings = patch('app.workers.embed_worker.get_settings').start()
+        self.settings.return_value.DEBUG = False
+
+        async def generate(chunks):
+            if any(chunk["content"] == "poison" for chunk in chunks):
+                raise Exception("Failed to generate embedding") from ValueError("input too long")
+            return [np.asarray(VECTORS[chunk["content"]], dtype=np.float32) for chunk in chunks]
+
+        self.worker._generate_embeddings = AsyncMock(side_effect=generate)
+        self.worker._process_embed_job = AsyncMock()
+        self.worker._fail_embed_job = AsyncMock()
+
+    def teardown_method(self):
+        """Tear down test fixtures"""
+        patch.stopall()
+
+    @pytest.mark.asyncio
+    async def test_batch_is_embedded_once_and_acked(self):
+        """Test that a healthy batch shares one embeddings pass"""
+        msgs = [_embed_message("doc-1", "alpha"), _embed_message("doc-2", "beta", "gamma")]
+
+        await self.worker._process_batch(msgs)
+
+        self.worker._generate_embeddings.assert_awaited_once()
+        embeddings = self.worker._process_embed_job.await_args_list[1].args[1]
+        assert [list(embedding) for embedding in embeddings] == [VECTORS["beta"], VECTORS["gamma"]]
+        for msg in msgs:
+            msg.ack.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_poison_job_only_fails_itself(self):
+        """Test that a permanent failure is isolated and terminated"""
+        healthy, poison = _embed_message("doc-1", "alpha"), _embed_message("doc-2", "poison")
+
+        await self.worker._process_batch([healthy, poison])
+
+        healthy.ack.assert_awaited_once()
+        poison.term.assert_awaited_once()
+        poison.nak.assert_not_called()
+        self.worker._fail_embed_job.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_retryable_failure_is_redelivered(self):
+        """Test that a transient failure naks the job"""
+        patch('app.workers.embed_worker._is_retryable', return_value=True).start()
+        msg = _embed_message("doc-1", "poison")
+
+        await self.worker._process_batch([msg])
+
+        msg.nak.assert_awaited_once()
+        msg.term.assert_not_called()
@@ -0,0 +1,147 @@
+import pytest
+from unittest.mock import patch
+from prometheus_client.metrics import MetricWrapperBase
+
+from app.services.metrics import BatchedHistogram, MetricsService, get_metrics_service
+
+
+# Upper bound on labels per metric; keeps series cardinality under control
+MAX_LABELS_PER_METRIC = 5
+
+# Labels whose values are unbounded and must never be used on a metric
+UNBOUNDED_LABELS = {'thread_id', 'chunk_count', 'documents_purged'}
+
+
+class TestMetricsService:
+    """Unit tests for MetricsService"""
+
+    def setup_method(self):
+        """Set up test fixtures"""
+        with patch('app.services.metrics.start_http_server'):
+            self.metrics = MetricsService()
+
+    def _declared_metrics(self):
+        return {
+            name: value
+            for name, value in vars(self.metrics).items()
+            if isinstance(value, MetricWrapperBase)
+        }
+
+    def test_metrics_label_count_is_bounded(self):
+        """Test that no metric declares more than MAX_LABELS_PER_METRIC labels"""
+        for name, metric in self._declared_metrics().items():
+            assert len(metric._labelnames) <= MAX_LABELS_PER_METRIC, name
+
+    def test_metrics_have_no_unbounded_labels(self):
+        """Test that high-cardinality identifiers are not used as labels"""
+        for name, metric in self._declared_metrics().items():
+            assert not UNBOUNDED_LABELS & set(metric._labelnames), name
+
+    def test_record_passes_labels_in_declared_order(self):
+        """Test that positional label values land on the declared label names"""
+        self.metrics.record_document_processing('org_1', 'proj_1', 'ingest', 'failed', 'timeout')
+
+        value = self.metrics.registry.get_sample_value(
+            'rag_document_processing_total',
+            {
+                'organization_id': 'org_1',
+                'project_id': 'proj_1',
+                'worker_type': 'ingest',
+                'status': 'failed',
+                'error_type': 'timeout',
+            },
+        )
+
+        assert value == 1
+
+    def test_record_retention_sweep_counts_purged_documents(self):
+        """Test that purged documents are counted instead of labelled"""
+        self.metrics.record_retention_sweep('org_1', 'success', 3)
+        self.metrics.record_retention_sweep('org_1', 'success', 2)
+
+        sweeps = self.metrics.registry.get_sample_value(
+            'rag_retention_sweeps_total',
+            {'organization_id': 'org_1', 'status': 'success'},
+        )
+        purged = self.metrics.registry.get_sample_value(
+            'rag_retention_documents_purged_total',
+            {'organization_id': 'org_1'},
+        )
+
+        assert sweeps == 2
+        assert purged == 5
+
+    def test_histogram_observations_are_flushed_on_collect(self):
+        """Test that batched histogram observations are visible to a scrape"""
+        for duration in (0.05, 0.3, 0.3, 45):
+            self.metrics.record_document_processing_duration(
+                'org_1', 'proj_1', 'ingest', duration, 'success'
+            )
+
+        labels = {
+            'organization_id': 'org_1',
+            'project_id': 'proj_1',
+            'worker_type': 'ingest',
+            'status': 'success',
+        }
+        registry = self.metrics.registry
+
+        assert registry.get_sample_value('rag_document_processing_duration_seconds_count', labels) == 4
+        assert registry.get_sample_value('rag_document_processing_duration_seconds_sum', labels) == pytest.approx(45.65)
+        assert registry.get_sample_value(
+            'rag_document_processing_duration_seconds_bucket', dict(labels, le='0.5')
+        ) == 3
+        assert registry.get_sample_value(
+            'rag_document_processing_duration_seconds_bucket', dict(labels, le='60.0')
+        ) == 4
+
+    def test_histograms_are_not_batched_in_multiprocess_mode(self, tmp_path, monkeypatch):
+        """Test that multiprocess histograms are observed directly for the exporter"""
+        monkeypatch.setenv('PROMETHEUS_MULTIPROC_DIR', str(tmp_path))
+        with patch('app.services.metrics.MULTIPROC_DIR', str(tmp_path)), \
+                patch('app.services.metrics.start_http_server'):
+            metrics = MetricsService()
+
+        metrics.record_document_processing_duration('org_1', 'proj_1', 'ingest', 0.3, 'success')
+
+        assert metrics.multiprocess
+        assert metrics._batched_histograms == []
+        assert not any(isinstance(child, BatchedHistogram) for child in metrics._label_cache.values())
+
+    def test_get_metrics_reuses_output_within_ttl(self):
+        """Test that scrapes within the cache TTL reuse the serialized output"""
+        with patch('app.services.metrics.generate_latest', return_value=b'metrics') as generate:
+            first = self.metrics.get_metrics()
+            second = self.metrics.get_metrics()
+
+        assert first == second == b'metrics'
+        assert generate.call_count == 1
+
+    def test_get_metrics_service_returns_singleton(self):
+        """Test that the metrics service is created once per process"""
+        get_metrics_service.cache_clear()
+        try:
+            with patch('app.services.metrics.start_http_server') as start_server:
+                first = get_metrics_service()
+                second = get_metrics_service()
+
+            assert first is second
+            assert start_server.call_count == 1
+        finally:
+            get_metrics_service.cache_clear()
+
+    def test_get_metrics_service_is_noop_when_disabled(self):
+        """Test that disabling metrics skips metric setup and updates"""
+        get_metrics_service.cache_clear()
+        try:
+            with patch('app.services.metrics.get_settings') as get_settings, \
+                    patch('app.services.metrics.start_http_server') as start_server:
+                get_settings.return_value.METRICS_ENABLED = False
+                metrics = get_metrics_service()
+
+            metrics.record_document_upload('org_1', 'proj_1', 'success')
+
+            assert not start_server.called
+            assert metrics.get_metrics() == b''
+        finally:
+            get_metrics_service.cache_clear()
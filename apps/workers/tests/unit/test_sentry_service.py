@@ -0,0 +1,49 @@
+from app.services.sentry import _redact
+
+
+class TestRedact:
+    """Unit tests for Sentry event redaction"""
+
+    def test_sensitive_keys_are_redacted_at_any_depth(self):
+        """Test that nested dicts and lists are walked"""
+        event = {
+            'request': {'headers': {'Authorization': 'Bearer abc', 'Accept': 'text/html'}},
+            'extra': {'jobs': [{'api_key': 'sk-1', 'document_id': 'doc-1'}]},
+        }
+
+        _redact(event['request'], event['extra'])
+
+        assert event['request']['headers'] == {'Authorization': '[REDACTED]', 'Accept': 'text/html'}
+        assert event['extra']['jobs'] == [{'api_key': '[REDACTED]', 'document_id': 'doc-1'}]
+
+    def test_key_matching_is_case_insensitive(self):
+        """Test that key names are matched regardless of case or separator"""
+        data = {'PASSWORD': 'p', 'Api-Key': 'k', 'session_token': 't', 'Cookie': 'c'}
+
+        _redact(data)
+
+        assert set(data.values()) == {'[REDACTED]'}
+
+    def test_bare_key_is_redacted_but_key_fragments_are_not(self):
+        """Test that only an exact 'key' name matches, not words containing it"""
+        data = {'key': 'secret-value', 'monkey': 'banana', 'keyword': 'search'}
+
+        _redact(data)
+
+        assert data == {'key': '[REDACTED]', 'monkey': 'banana', 'keyword': 'search'}
+
+    def test_sensitive_container_is_replaced_whole(self):
+        """Test that a sensitive key holding a dict is redacted without walking it"""
+        data = {'auth': {'user': 'alice', 'password': 'p'}}
+
+        _redact(data)
+
+        assert data == {'auth': '[REDACTED]'}
+
+    def test_missing_sections_and_scalars_are_ignored(self):
+        """Test that absent event sections and non-container values are skipped"""
+        data = {'count': 3, 'items': ['a', 1, None]}
+
+        _redact(None, data, 'text', 42)
+
+        assert data == {'count': 3, 'items': ['a', 1, None]}
@@ -121,6 +121,65 @@ CREATE TABLE usage_stats (
     UNIQUE(org_id, project_id, date)
 );
 
+-- Create exports table (one row per uploaded export artifact)
+CREATE TABLE exports (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    job_id UUID NOT NULL,
+    filename TEXT NOT NULL,
+    url TEXT NOT NULL,
+    file_size BIGINT NOT NULL,
+    export_type VARCHAR(50) NOT NULL,
+    format export_format NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Create query_stats table (one row per answered query, written by the analytics worker)
+CREATE TABLE query_stats (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    user_id UUID,
+    org_id UUID,
+    project_id UUID,
+    query TEXT NOT NULL,
+    response_time DOUBLE PRECISION DEFAULT 0,
+    tokens_used INTEGER DEFAULT 0,
+    tokens_input INTEGER DEFAULT 0,
+    tokens_output INTEGER DEFAULT 0,
+    model_used VARCHAR(100),
+    success BOOLEAN DEFAULT TRUE,
+    error_message TEXT,
+    source VARCHAR(20),
+    thread_id UUID,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Create document_stats table
+CREATE TABLE document_stats (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    user_id UUID,
+    org_id UUID,
+    project_id UUID,
+    document_id UUID,
+    file_size BIGINT DEFAULT 0,
+    file_type VARCHAR(100),
+    page_count INTEGER DEFAULT 0,
+    chunk_count INTEGER DEFAULT 0,
+    processing_time DOUBLE PRECISION DEFAULT 0,
+    success BOOLEAN DEFAULT TRUE,
+    error_message TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Create user_action_stats table
+CREATE TABLE user_action_stats (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    user_id UUID,
+    org_id UUID,
+    project_id UUID,
+    action VARCHAR(100) NOT NULL,
+    action_data JSONB DEFAULT '{}',
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
 -- Create audit_log table
 CREATE TABLE audit_log (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
@@ -147,6 +206,10 @@ CREATE INDEX idx_chunks_embedding ON chunks USING ivfflat (embedding vector_cosi
 CREATE INDEX idx_threads_project ON threads(project_id);
 CREATE INDEX idx_messages_thread ON messages(thread_id);
 CREATE INDEX idx_usage_stats_org_date ON usage_stats(org_id, date);
+CREATE INDEX idx_exports_job ON exports(job_id);
+CREATE INDEX idx_query_stats_org_project_created ON query_stats(org_id, project_id, created_at);
+CREATE INDEX idx_document_stats_org_project_created ON document_stats(org_id, project_id, created_at);
+CREATE INDEX idx_user_action_stats_org_project_created ON user_action_stats(org_id, project_id, created_at);
 CREATE INDEX idx_audit_log_org_user ON audit_log(org_id, user_id);
 CREATE INDEX idx_audit_log_created_at ON audit_log(created_at);
 